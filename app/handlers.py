@@ -1,22 +1,52 @@
 from slack_bolt import App, Ack
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from slack_bolt.adapter.fastapi import SlackRequestHandler
-from typing import Optional
-import os, logging, re, time
-
-from .nlp.agent import plan_query
-from .sql.runner import run_sql
-from .services.cache import ThreadCache
-from .services.csv_export import df_to_csv, upload_csv
-from .services.formatting import df_to_markdown_table
+from typing import Callable, Optional
+import os, logging, re, threading, time
+
+from .nlp.agent import plan_query, remember_plan, route
+from .sql.runner import run_sql, data_version
+from .sql.plan_check import check_query_plans
+from .sql.cost_guard import QueryAborted, cancel_scope
+from .services.cache import make_thread_cache
+from .services.csv_export import df_to_csv, upload_csv, stream_export, start_export_janitor
+from .services.formatting import df_to_table_blocks
 from .services.authz import filter_columns
+from .services.pipeline import (QueryPipeline, PIPELINE_ENABLED, USER_LIMIT,
+                                EXPORT_WORKERS, EXPORT_MAX_QUEUE)
+from .services.dedup import make_deduper, delivery_keys
+from .services.derive import derive, DERIVE_RESULTS
+from .services.warmup import warmer
 from .obs.tracing import init_tracing
+from .obs.metrics import span, stats_collector, STAGE_SECONDS, ROWS_RETURNED, THREAD_CACHE_LOOKUPS, ANSWERS
+from .sql.runner import result_cache
+from .nlp.plan_cache import plan_cache
 
 logger = logging.getLogger(__name__)
-cache = ThreadCache(ttl_seconds=3600)
+cache = make_thread_cache(ttl_seconds=3600)
+pipeline = QueryPipeline()
+# full exports run for minutes; their own small pool keeps them from starving questions
+exports = QueryPipeline(workers=EXPORT_WORKERS, max_queue=EXPORT_MAX_QUEUE, per_user=1, name="bi-export")
+dedup = make_deduper()
+
+stats_collector("bi_result_cache_events_total", "Result cache lookups", result_cache.stats,
+                ["hits", "misses", "coalesced"])
+if plan_cache is not None:
+    stats_collector("bi_plan_cache_events_total", "Plan cache lookups", plan_cache.stats,
+                    ["hits", "similar_hits", "misses"])
+if warmer is not None:
+    stats_collector("bi_warmup_events_total", "Cache warm-up runs and queries", warmer.stats,
+                    ["runs", "queries", "failed"])
+stats_collector("bi_event_deliveries_total", "Slack message deliveries by dedup outcome", dedup.stats,
+                ["first", "duplicate", "attached", "duplicate_remote"])
 
 def build_app() -> App:
     init_tracing()
+    check_query_plans()
+    start_export_janitor()
+    cache.start_sweeper()
+    if warmer is not None:
+        warmer.start()
     app = App(token=os.getenv("SLACK_BOT_TOKEN"), signing_secret=os.getenv("SLACK_SIGNING_SECRET"))
 
     @app.event("message")
@@ -32,7 +62,9 @@ def build_app() -> App:
 
         # DM? (channels starting with 'D' are IMs)
         if channel and channel.startswith("D"):
-            _handle_query(app, say, channel, thread_ts, user_id, text)
+            done = dedup.claim(delivery_keys(event, body))
+            if done:
+                _handle_query(app, say, channel, thread_ts, user_id, text, done=done)
             return
 
         # Channel message: respond only if the bot is actually mentioned
@@ -44,8 +76,11 @@ def build_app() -> App:
                 bot_user_id = None
 
         if bot_user_id and f"<@{bot_user_id}>" in text:
-            cleaned = text.replace(f"<@{bot_user_id}>", "").strip()
-            _handle_query(app, say, channel, thread_ts, user_id, cleaned)
+            # the same mention also arrives as app_mention; whichever is first answers
+            done = dedup.claim(delivery_keys(event, body))
+            if done:
+                cleaned = text.replace(f"<@{bot_user_id}>", "").strip()
+                _handle_query(app, say, channel, thread_ts, user_id, cleaned, done=done)
 
     @app.event("app_mention")
     def handle_mention(body, say, event, context, client):
@@ -55,7 +90,9 @@ def build_app() -> App:
         text = event.get("text","")
         # strip bot mention
         text = " ".join([t for t in text.split() if not t.startswith("<@")])
-        _handle_query(app, say, channel, thread_ts, user_id, text)
+        done = dedup.claim(delivery_keys(event, body))
+        if done:
+            _handle_query(app, say, channel, thread_ts, user_id, text, done=done)
 
     @app.command("/bi")
     def slash_bi(ack, body, say):
@@ -84,6 +121,11 @@ def build_app() -> App:
         if not last:
             say(text="No recent result to export in this thread.", thread_ts=thread_ts)
             return
+        args = (body.get("text") or "").lower().split()
+        if "full" in args or "all" in args:
+            _export_full(app, say, channel, thread_ts, body.get("user_id"), last["sql"],
+                         "parquet" if "parquet" in args else "csv.gz", last.get("params"))
+            return
         csv_path = df_to_csv(last["df"], "export")
         upload_csv(app, channel, csv_path, title="export.csv", thread_ts=thread_ts)
 
@@ -108,53 +150,112 @@ def build_app() -> App:
         if not last:
             say(text="No SQL cached in this thread.", thread_ts=thread_ts)
             return
-        say(text=f"```\n{last['sql']}\n```", thread_ts=thread_ts)
+        say(text=_sql_text(last), thread_ts=thread_ts)
 
     return app
 
-def _handle_query(app: App, say, channel: str, thread_ts: Optional[str], user_id: str, text: str):
+def _handle_query(app: App, say, channel: str, thread_ts: Optional[str], user_id: str, text: str,
+                  done: Optional[Callable[[], None]] = None):
+    """Answer one message; `done` (from the dedup claim) is called once the answer is complete."""
+    handed_off = False
+    try:
+        handed_off = _route_query(app, say, channel, thread_ts, user_id, text, done)
+    finally:
+        if done is not None and not handed_off:
+            done()
+
+def _route_query(app: App, say, channel: str, thread_ts: Optional[str], user_id: str, text: str,
+                 done: Optional[Callable[[], None]] = None) -> bool:
+    """True if the answer was handed to the pipeline, which then calls `done`."""
     text_lower = (text or "").strip().lower()
 
+    with span("route"):
+        intent = route(text)
+
     # --- Text-to-action: Export CSV ---
-    EXPORT_PATTERNS = [
-        r"\b(export|download|save|dump)\b.*\bcsv\b",
-        r"^export\s+csv$",
-        r"^export\s+this\s+as\s+csv$",
-        r"^download\s+csv$",
-    ]
-    if any(re.search(p, text_lower) for p in EXPORT_PATTERNS):
+    if intent and intent.kind == "export":
         last = _get_last_from_cache(channel, thread_ts)
         if not last:
             say(text="No recent result to export in this thread.", thread_ts=thread_ts)
-            return
+            return False
+        # "export full csv" / "download all as parquet": re-run without the display LIMIT
+        if re.search(r"\b(full|all|everything|entire|complete)\b", text_lower) or "parquet" in text_lower:
+            _export_full(app, say, channel, thread_ts, user_id, last["sql"],
+                         "parquet" if "parquet" in text_lower else "csv.gz", last.get("params"))
+            return False
         csv_path = df_to_csv(last["df"], f"export_{int(time.time())}")
         upload_csv(app, channel, csv_path, title="export.csv", thread_ts=thread_ts)
-        return
+        return False
 
     # --- Text-to-action: Show SQL ---
-    SHOW_SQL_PATTERNS = [
-        r"\b(show|display|print|reveal|view|see)\b.*\bsql\b",
-        r"\bsql\b.*\b(used|query|statement)\b",
-        r"^sql$",
-        r"^show\s+sql$",
-        r"^show\s+the\s+sql$",
-    ]
-    if any(re.search(p, text_lower) for p in SHOW_SQL_PATTERNS):
+    if intent and intent.kind == "show_sql":
         last = _get_last_from_cache(channel, thread_ts)
         if not last:
             say(text="No SQL cached in this thread.", thread_ts=thread_ts)
-            return
-        say(text=f"```\n{last['sql']}\n```", thread_ts=thread_ts)
-        return
-    
-    last = cache.get(channel, thread_ts) if thread_ts else None
-    plan = plan_query(text, last_plan=last.get("plan") if last else None)
+            return False
+        say(text=_sql_text(last), thread_ts=thread_ts)
+        return False
+
+    if not PIPELINE_ENABLED:
+        _answer_query(channel, thread_ts, user_id, text, SayReporter(say, thread_ts), intent)
+        return False
+
+    # Async path: ack the user right away, answer from the worker pool
+    reporter = MessageReporter(app.client, say, channel, thread_ts)
+    reporter.start()
+    rejected = pipeline.submit(user_id, _run_reported, channel, thread_ts, user_id, text, reporter, intent,
+                               time.perf_counter(), done)
+    if rejected == USER_LIMIT:
+        reporter.finish(text="You already have questions in progress. Please ask again once they finish.")
+    elif rejected:
+        reporter.finish(text="I'm handling a lot of questions right now. Please try again in a moment.")
+    return not rejected
+
+def _run_reported(channel, thread_ts, user_id, text, reporter, intent=None, submitted=None, done=None):
+    if submitted is not None:
+        STAGE_SECONDS.observe(time.perf_counter() - submitted, stage="queue")
+    try:
+        _answer_query(channel, thread_ts, user_id, text, reporter, intent)
+    except Exception as e:
+        ANSWERS.inc(outcome="error")
+        logger.exception("[handlers] query failed")
+        reporter.finish(text=f"Sorry, something went wrong: {e}")
+    finally:
+        if done is not None:
+            done()
+
+@span("answer")
+def _answer_query(channel: str, thread_ts: Optional[str], user_id: str, text: str, reporter, intent=None):
+    last = _cache_get(channel, thread_ts) if thread_ts else None
+    version = data_version()
+    reporter.progress(":thinking_face: Planning your question…")
+    early = {}
+
+    def start_sql(sql: str):
+        # run the SQL of a streaming LLM plan while the model is still writing the rest of it
+        _abandon(early)
+        cancel = threading.Event()
+        future = pipeline.speculate(user_id, _run_early, sql, cancel)
+        if future is None:
+            return  # at the user's or the pool's limit: it runs once the plan is final
+        early.update(sql=sql, future=future, cancel=cancel)
+        reporter.progress(":hourglass_flowing_sand: Running the query…")
+
+    with span("plan"):
+        try:
+            plan = plan_query(text, last_plan=last.get("plan") if last else None, intent=intent, on_sql=start_sql)
+        except Exception:
+            _abandon(early)
+            raise
+    started = bool(early) and early["sql"] == plan.get("sql") and not plan.get("params")
+    if not started:
+        _abandon(early)
     # 0) Off-topic / small-talk branch: politely decline, no SQL
     if plan.get("answer_type") == "decline":
-        say(
+        ANSWERS.inc(outcome="decline")
+        reporter.finish(
             text=plan.get("decline_text") or
                     "I’m focused on analytics for the Rounds app portfolio. Ask me about apps, installs, revenue, UA, countries, or platforms.",
-            thread_ts=thread_ts,
             blocks=[
                 {"type":"section","text":{"type":"mrkdwn","text": plan.get("decline_text") or
                     "I’m focused on analytics for the Rounds app portfolio. "
@@ -162,52 +263,178 @@ def _handle_query(app: App, say, channel: str, thread_ts: Optional[str], user_id
             ]
         )
         return
+    # a follow-up the previous result already holds the rows for skips the database
+    df = _derive(last, plan, version) if last and not started else None
+    if df is None and not started:
+        reporter.progress(":hourglass_flowing_sand: Running the query…")
     try:
-        df = run_sql(plan["sql"])
+        if df is None:
+            df = early["future"].result() if started else _run_sql(plan["sql"], plan.get("params"))
+    except QueryAborted as e:
+        ANSWERS.inc(outcome="aborted")
+        reporter.finish(text=f":octagonal_sign: I stopped that query: {e.reason}.")
+        return
     except Exception as e:
-        say(text=f"Sorry, I couldn't run that query: {e}", thread_ts=thread_ts)
+        ANSWERS.inc(outcome="error")
+        reporter.finish(text=f"Sorry, I couldn't run that query: {e}")
         return
+    ROWS_RETURNED.inc(len(df))
+    remember_plan(text, last.get("plan") if last else None, plan)
 
     # authz filter
-    df = filter_columns(df, user_id)
+    with span("filter_columns"):
+        df = filter_columns(df, user_id)
+
+    if warmer is not None:
+        warmer.record(text, plan, followup=last is not None)
 
     # cache
-    cache.set(channel, thread_ts, {"plan": plan, "df": df, "sql": plan["sql"]})
-    cache.set(channel, "__last__", {"plan": plan, "df": df, "sql": plan["sql"]})
+    with span("cache_set"):
+        cache.set(channel, thread_ts, {"plan": plan, "df": df, "sql": plan["sql"], "params": plan.get("params"),
+                                       "version": version}, aliases=("__last__",))
 
     if plan.get("answer_type") == "simple" and "app_count" in df.columns and len(df)==1:
         n = int(df.iloc[0]["app_count"])
-        say(
-            text=f"We currently track *{n}* apps.",
-            thread_ts=thread_ts,
+        ANSWERS.inc(outcome="simple")
+        with span("reply"):
+            reporter.finish(
+                text=f"We currently track *{n}* apps.",
+                blocks=[
+                    {"type":"section","text":{"type":"mrkdwn","text":f"We currently track *{n}* apps."}},  #*{n}* apps.\n_{plan.get('explanation','')}_"}}
+                    {"type":"actions","elements":[
+                        {"type":"button","text":{"type":"plain_text","text":"Export CSV"},"action_id":"export_csv"},
+                        {"type":"button","text":{"type":"plain_text","text":"Show SQL"},"action_id":"show_sql"}
+                    ]}
+                ]
+            )
+        return
+
+    with span("render"):
+        table_blocks = df_to_table_blocks(df)
+    summary = plan.get("explanation","")
+    assumptions = plan.get("assumptions","")
+    ANSWERS.inc(outcome="table")
+    with span("reply"):
+        reporter.finish(
+            text=summary,
             blocks=[
-                {"type":"section","text":{"type":"mrkdwn","text":f"We currently track *{n}* apps."}},  #*{n}* apps.\n_{plan.get('explanation','')}_"}}
+                {"type":"section","text":{"type":"mrkdwn","text":f"*Result*\n{summary}\n_{assumptions}_"}},
+                *table_blocks,
                 {"type":"actions","elements":[
                     {"type":"button","text":{"type":"plain_text","text":"Export CSV"},"action_id":"export_csv"},
                     {"type":"button","text":{"type":"plain_text","text":"Show SQL"},"action_id":"show_sql"}
                 ]}
             ]
         )
+
+def _derive(last, plan, version):
+    if not DERIVE_RESULTS or last.get("version") != version:
+        return None
+    t0 = time.perf_counter()
+    df = derive(last, plan)
+    if df is not None:
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage="derive")
+    return df
+
+def _run_sql(sql: str, params=None):
+    with span("run_sql"):
+        return run_sql(sql, params)
+
+def _run_early(sql: str, cancel: threading.Event):
+    with cancel_scope(cancel):
+        return _run_sql(sql)
+
+def _abandon(early: dict):
+    """Drop an early query the final plan no longer wants: unstart it, or stop it where it is."""
+    if early and not early["future"].cancel():
+        early["cancel"].set()
+    early.clear()
+
+class SayReporter:
+    """Synchronous delivery: no progress, one say() with the answer."""
+
+    def __init__(self, say, thread_ts):
+        self.say, self.thread_ts = say, thread_ts
+
+    def progress(self, text: str):
+        pass
+
+    def finish(self, text: str, blocks: Optional[list] = None):
+        kwargs = {"blocks": blocks} if blocks else {}
+        self.say(text=text, thread_ts=self.thread_ts, **kwargs)
+
+class MessageReporter(SayReporter):
+    """Posts a placeholder, then edits it in place as each stage completes."""
+
+    def __init__(self, client, say, channel, thread_ts):
+        super().__init__(say, thread_ts)
+        self.client, self.channel, self.ts = client, channel, None
+
+    def start(self):
+        try:
+            resp = self.client.chat_postMessage(channel=self.channel, thread_ts=self.thread_ts,
+                                                text=":hourglass: Got it, working on it…")
+            self.ts = resp.get("ts")
+        except Exception:
+            logger.exception("[handlers] placeholder post failed; answering without progress updates")
+
+    def _update(self, text: str, blocks: Optional[list] = None) -> bool:
+        if not self.ts:
+            return False
+        try:
+            self.client.chat_update(channel=self.channel, ts=self.ts, text=text, blocks=blocks or [])
+            return True
+        except Exception:
+            logger.exception("[handlers] chat_update failed")
+            return False
+
+    def progress(self, text: str):
+        self._update(text)
+
+    def finish(self, text: str, blocks: Optional[list] = None):
+        if not self._update(text, blocks):
+            super().finish(text, blocks)
+
+def _export_full(app: App, say, channel: str, thread_ts: Optional[str], user_id: str, sql: str, fmt: str,
+                 params=None):
+    def job():
+        try:
+            path = stream_export(sql, f"export_{int(time.time())}", user_id, fmt, params)
+        except QueryAborted as e:
+            say(text=f":octagonal_sign: I stopped the full export: {e.reason}.", thread_ts=thread_ts)
+            return
+        except Exception as e:
+            logger.exception("[handlers] full export failed")
+            say(text=f"Sorry, the full export failed: {e}", thread_ts=thread_ts)
+            return
+        try:
+            upload_csv(app, channel, path, title=os.path.basename(path), thread_ts=thread_ts)
+        finally:
+            os.remove(path)
+
+    if not PIPELINE_ENABLED:
+        job()
         return
+    say(text=":hourglass: Preparing the full export…", thread_ts=thread_ts)
+    rejected = exports.submit(user_id, job)
+    if rejected == USER_LIMIT:
+        say(text="You already have a full export in progress. Please try again once it's uploaded.", thread_ts=thread_ts)
+    elif rejected:
+        say(text="I'm handling a lot of exports right now. Please try the export again in a moment.", thread_ts=thread_ts)
 
-    table_md = df_to_markdown_table(df)
-    summary = plan.get("explanation","")
-    assumptions = plan.get("assumptions","")
-    say(
-        text=summary,
-        thread_ts=thread_ts,
-        blocks=[
-            {"type":"section","text":{"type":"mrkdwn","text":f"*Result*\n{summary}\n_{assumptions}_"}},
-            {"type":"section","text":{"type":"mrkdwn","text":table_md}},
-            {"type":"actions","elements":[
-                {"type":"button","text":{"type":"plain_text","text":"Export CSV"},"action_id":"export_csv"},
-                {"type":"button","text":{"type":"plain_text","text":"Show SQL"},"action_id":"show_sql"}
-            ]}
-        ]
-    )
+def _sql_text(last) -> str:
+    text = f"```\n{last['sql']}\n```"
+    if last.get("params"):
+        text += f"\nparams: `{list(last['params'])}`"
+    return text
+
+def _cache_get(channel, thread_ts):
+    last = cache.get(channel, thread_ts)
+    THREAD_CACHE_LOOKUPS.inc(result="hit" if last else "miss")
+    return last
 
 def _get_last_from_cache(channel, thread_ts):
-    last = cache.get(channel, thread_ts) if thread_ts else None
+    last = _cache_get(channel, thread_ts) if thread_ts else None
     if not last:
-        last = cache.get(channel, "__last__")  # channel-level fallback
+        last = _cache_get(channel, "__last__")  # channel-level fallback
     return last
\ No newline at end of file
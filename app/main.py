@@ -4,6 +4,11 @@ from fastapi import FastAPI, Request, Response
 from slack_bolt.adapter.fastapi import SlackRequestHandler
 from .handlers import build_app
 from .nlp.config import get_llm_config, get_nlp_config
+from .nlp.plan_cache import plan_cache
+from .nlp.agent import ROUTER
+from .sql.cost_guard import guard_stats
+from .services.warmup import warmer
+from .obs.metrics import render_metrics
 
 load_dotenv()
 def mask(t): return (t[:6] + "..." + t[-4:]) if t else None
@@ -22,9 +27,18 @@ async def config():
     """Show current LLM and NLP configuration"""
     return {
         "llm": get_llm_config(),
-        "nlp": get_nlp_config()
+        "nlp": get_nlp_config(),
+        "plan_cache": plan_cache.stats() if plan_cache else None,
+        "router": ROUTER.stats(),
+        "query_aborts": guard_stats(),
+        "warmup": warmer.stats() if warmer else None
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of stage latencies and counters"""
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.post("/slack/events")
 async def slack_events(request: Request):
     return await handler.handle(request)
@@ -1,8 +1,15 @@
-import os, re, json, logging
-from typing import Dict, Any, Optional
-from .schema_doc import SCHEMA_TEXT
-from .prompts import SYSTEM_PROMPT, FEW_SHOTS
-from .config import USE_OPENAI, LLM_MODEL, LLM_FIRST, LLM_TEMPERATURE, LOG_LLM_USAGE, LOG_RULE_USAGE
+import os, re, json, time, logging, threading
+from typing import Callable, Dict, Any, Optional, Tuple
+from .config import (USE_OPENAI, LLM_MODEL, LLM_FIRST, LLM_TEMPERATURE, LLM_TIMEOUT, LLM_KEEPALIVE_SECONDS,
+                     LLM_STREAMING, LOG_LLM_USAGE, LOG_RULE_USAGE, TEMPLATES_ENABLED, ENABLE_FOLLOWUP_LOGIC)
+from .prompt_builder import get_prompt_builder
+from .json_stream import IncrementalJSON
+from .plan_cache import plan_cache
+from .router import IntentRouter, Intent
+from .templates import plan_from_template, followup_from_template
+from .followup import followup_plan
+from ..sql.engines import get_dialect
+from ..obs.metrics import span, PLAN_SECONDS, LLM_TOKENS
 
 logger = logging.getLogger(__name__)
 OFFTOPIC_PATTERNS = [
@@ -47,47 +54,107 @@ SIMPLE_RULES = [
     "  FROM app_metrics "
     "  GROUP BY app_name "
     ") t "
-    "ORDER BY ABS(delta) DESC "
+    "ORDER BY ABS(ua_jan_2025_01 - ua_dec_2024_12) DESC "
     "LIMIT 100",
     "answer_type":"table","explanation":"Compares monthly UA cost and ranks by absolute change.","assumptions":"Months fixed to Dec 2024 vs Jan 2025."}),
 ]
 
-def _llm_plan(user_text: str, last_plan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    # Import inside so the module loads even if langchain_openai isn’t present at import time
-    from langchain_openai import ChatOpenAI
+# Text-to-action intents handled in app/handlers.py before any planning
+EXPORT_PATTERNS = [
+    r"\b(export|download|save|dump)\b.*\b(csv|parquet)\b",
+    r"^export\s+csv$",
+    r"^export\s+this\s+as\s+csv$",
+    r"^download\s+csv$",
+]
+SHOW_SQL_PATTERNS = [
+    r"\b(show|display|print|reveal|view|see)\b.*\bsql\b",
+    r"\bsql\b.*\b(used|query|statement)\b",
+    r"^sql$",
+    r"^show\s+sql$",
+    r"^show\s+the\s+sql$",
+]
 
-    llm = ChatOpenAI(model=LLM_MODEL, temperature=LLM_TEMPERATURE)
-    logger.info("[nlp] Using %s model=%s",
-                "LLM-first" if LLM_FIRST else "LLM-fallback", LLM_MODEL)
+# One compiled matcher for every intent, in priority order
+ROUTER = IntentRouter(
+    [("export", p, None) for p in EXPORT_PATTERNS]
+    + [("show_sql", p, None) for p in SHOW_SQL_PATTERNS]
+    + [("offtopic", p, None) for p in OFFTOPIC_PATTERNS]
+    + [("rule", p, plan) for p, plan in SIMPLE_RULES]
+)
 
-    # Few-shots already in FEW_SHOTS; include prior plan to support follow-ups
-    shot_strs = [f"User: {s['user']}\nJSON: {json.dumps(s['json'])}" for s in FEW_SHOTS]
-    prior = ""
-    if last_plan:
-        prior = (
-            "\n\nPrevious query context:"
-            f"\nSQL: {last_plan.get('sql','')}"
-            f"\nAnswer type: {last_plan.get('answer_type','')}"
-            f"\nExplanation: {last_plan.get('explanation','')}"
-        )
-
-    prompt = (
-        SYSTEM_PROMPT
-        + "\n\nSCHEMA:\n" + SCHEMA_TEXT
-        + prior
-        + "\n\n" + "\n\n".join(shot_strs)
-        + f"\n\nUser: {user_text}\nReturn ONLY the JSON."
-    )
-
-    resp = llm.invoke(prompt)
+def route(user_text: str) -> Optional[Intent]:
+    return ROUTER.route((user_text or "").strip())
+
+_llm = None
+_llm_lock = threading.Lock()
 
+def _get_llm():
+    """The chat client, created once and shared, so its pooled HTTPS connections stay warm."""
+    global _llm
+    if _llm is None:
+        with _llm_lock:
+            if _llm is None:
+                # Import inside so the module loads even if langchain_openai isn’t present at import time
+                import httpx
+                from langchain_openai import ChatOpenAI
+                limits = httpx.Limits(max_keepalive_connections=20, keepalive_expiry=LLM_KEEPALIVE_SECONDS)
+                _llm = ChatOpenAI(model=LLM_MODEL, temperature=LLM_TEMPERATURE, timeout=LLM_TIMEOUT,
+                                  stream_usage=LLM_STREAMING,
+                                  http_client=httpx.Client(timeout=LLM_TIMEOUT, limits=limits),
+                                  http_async_client=httpx.AsyncClient(timeout=LLM_TIMEOUT, limits=limits))
+    return _llm
+
+def _parse_plan(raw: str) -> Dict[str, Any]:
     # Robust JSON extraction: strip fences, slice outermost {...}
-    raw = getattr(resp, "content", str(resp)).strip().strip("`")
+    raw = raw.strip().strip("`")
     if "{" in raw and "}" in raw:
         raw = raw[ raw.find("{") : raw.rfind("}") + 1 ]
     data = json.loads(raw)  # raise visibly if malformed
     if not isinstance(data, dict):
         raise ValueError("LLM returned non-dict JSON")
+    return data
+
+def _stream_plan(llm, messages, on_sql: Optional[Callable[[str], None]]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """(plan, usage) from a streamed completion; `on_sql` gets the SQL as soon as that field is complete."""
+    parser: Optional[IncrementalJSON] = IncrementalJSON()
+    pieces, usage = [], {}
+    for chunk in llm.stream(messages):
+        piece = chunk.content if isinstance(chunk.content, str) else ""
+        pieces.append(piece)
+        usage = getattr(chunk, "usage_metadata", None) or usage
+        if parser is None:
+            continue
+        try:
+            fields = parser.feed(piece)
+        except ValueError as e:
+            logger.warning("[nlp] streamed plan is not clean JSON (%s); parsing it when complete", e)
+            parser = None
+            continue
+        for key, value in fields:
+            if key == "sql" and on_sql is not None and isinstance(value, str) and value.strip():
+                on_sql(value)
+    if parser is not None and parser.done:
+        return parser.fields, usage
+    return _parse_plan("".join(pieces)), usage
+
+def _llm_plan(user_text: str, last_plan: Optional[Dict[str, Any]] = None,
+              on_sql: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    llm = _get_llm()
+    # static system prefix + the few-shots closest to this question (+ prior plan for follow-ups)
+    messages, info = get_prompt_builder().build(user_text, get_dialect().prompt_rule, last_plan)
+    logger.info("[nlp] Using %s model=%s shots=%d prompt_tokens~%d",
+                "LLM-first" if LLM_FIRST else "LLM-fallback", LLM_MODEL, info["shots"], info["tokens"])
+
+    with span("llm"):
+        if LLM_STREAMING:
+            data, usage = _stream_plan(llm, messages, on_sql)
+        else:
+            resp = llm.invoke(messages)
+            usage = getattr(resp, "usage_metadata", None) or {}
+            data = _parse_plan(getattr(resp, "content", str(resp)))
+    for kind in ("input_tokens", "output_tokens"):
+        if usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], kind=kind.split("_")[0])
 
     # Safe defaults so downstream never KeyErrors
     data.setdefault("sql", "")
@@ -96,97 +163,102 @@ def _llm_plan(user_text: str, last_plan: Optional[Dict[str, Any]] = None) -> Dic
     data.setdefault("assumptions", "")
     return data
 
-def _apply_followup(last_sql: str, user_text: str) -> Optional[str]:
-    m = re.search(r"(ios|android)", user_text, re.I)
-    if not m:
-        return None
-    platform = "iOS" if m.group(1).lower() == "ios" else "Android"
-
-    # 1) normalize the previous SQL (remove trailing semicolon)
-    sql = (last_sql or "").strip()
-    sql = re.sub(r";\s*$", "", sql)  # drop ONE trailing semicolon safely
-
-    # 2) if a platform filter exists, swap it
-    if re.search(r"\bplatform\s*=\s*'(?:iOS|Android)'\b", sql, re.I):
-        new_sql = re.sub(
-            r"\bplatform\s*=\s*'(?:iOS|Android)'\b",
-            f"platform='{platform}'",
-            sql,
-            flags=re.I,
-        )
-        return new_sql
-
-    # 3) otherwise, add a platform filter either after WHERE or before GROUP/ORDER/LIMIT/end
-    if re.search(r"\bwhere\b", sql, re.I):
-        # add AND after WHERE
-        new_sql = re.sub(
-            r"(\bwhere\b)",
-            r"\1 " + f"platform='{platform}' AND ",
-            sql,
-            flags=re.I,
-        )
-    else:
-        # insert before GROUP BY / ORDER BY / LIMIT / end
-        new_sql = re.sub(
-            r"(group\s+by|order\s+by|limit|$)",
-            f" WHERE platform='{platform}' " + r"\1",
-            sql,
-            flags=re.I,
-        )
-    return new_sql
-
-def plan_query(user_text: str, last_plan: Optional[Dict[str,Any]] = None) -> Dict[str,Any]:
+def _cached_llm_plan(user_text: str, last_plan: Optional[Dict[str, Any]] = None,
+                     on_sql: Optional[Callable[[str], None]] = None) -> Tuple[str, Dict[str, Any]]:
+    # Plan cache first: a hit skips the LLM round trip entirely
+    if plan_cache is not None:
+        hit = plan_cache.get(user_text, last_plan)
+        if hit:
+            logger.info("[nlp] plan cache hit")
+            return "plan_cache", hit
+    plan = _llm_plan(user_text, last_plan=last_plan, on_sql=on_sql)
+    # cached by remember_plan() once its SQL has run, so a failing plan is never replayed
+    plan["planner"] = "llm"
+    return "llm", plan
+
+def remember_plan(user_text: str, last_plan: Optional[Dict[str, Any]], plan: Dict[str, Any]):
+    """Store a plan the LLM just wrote in the plan cache; call after its SQL ran successfully."""
+    if plan_cache is not None and plan.get("planner") == "llm":
+        plan_cache.put(user_text, last_plan, {k: v for k, v in plan.items() if k != "planner"})
+
+def plan_query(user_text: str, last_plan: Optional[Dict[str,Any]] = None,
+               intent: Optional[Intent] = None,
+               on_sql: Optional[Callable[[str], None]] = None) -> Dict[str,Any]:
+    """Plan SQL for a question. Pass `intent` if the caller already routed the text.
+
+    With LLM_STREAMING, `on_sql(sql)` is called from inside a streamed LLM plan
+    as soon as its SQL is complete, before explanation/assumptions arrive; the
+    returned plan's "sql" is that same string unless planning then failed.
+    """
+    t0 = time.perf_counter()
+    path, plan = _plan(user_text, last_plan, intent, on_sql)
+    PLAN_SECONDS.observe(time.perf_counter() - t0, path=path)
+    return plan
+
+def _plan(user_text: str, last_plan: Optional[Dict[str,Any]],
+          intent: Optional[Intent], on_sql: Optional[Callable[[str], None]] = None) -> Tuple[str, Dict[str,Any]]:
+    # returns (planner path, plan); the path labels the latency histogram
     # Follow-up quick pass (keep this for efficiency regardless of mode)
     if last_plan:
-        new_sql = _apply_followup(last_plan.get("sql",""), user_text)
-        if new_sql:
-            return {
-                "sql": new_sql,
-                "answer_type": last_plan.get("answer_type","table"),
-                "explanation": "Follow-up filtered by platform.",
-                "assumptions": "Interpreted as a platform filter follow-up."
-            }
+        if TEMPLATES_ENABLED and last_plan.get("template"):
+            plan = followup_from_template(user_text, last_plan)
+            if plan:
+                return "followup", plan
+        if ENABLE_FOLLOWUP_LOGIC:
+            # any other previous SQL: apply the change to its parsed form
+            plan = followup_plan(user_text, last_plan)
+            if plan:
+                return "followup", plan
     
+    if intent is None:
+        intent = route(user_text)
+
     # Off-topic / small talk: politely decline and steer to analytics
-    for pat in OFFTOPIC_PATTERNS:
-        if pat.search(user_text or ""):
-            return {
-                "answer_type": "decline",
-                "decline_text": (
-                    "I'm focused on the Rounds app portfolio analytics. "
-                    "Try questions like:\n"
-                    "• how many apps do we have?\n"
-                    "• which country generates the most revenue?\n"
-                    "• list all iOS apps sorted by popularity\n"
-                    "• biggest change in UA spend Jan 2025 vs Dec 2024"
-                ),
-                "explanation": "",
-                "assumptions": "",
-            }  
+    if intent and intent.kind == "offtopic":
+        return "offtopic", {
+            "answer_type": "decline",
+            "decline_text": (
+                "I'm focused on the Rounds app portfolio analytics. "
+                "Try questions like:\n"
+                "• how many apps do we have?\n"
+                "• which country generates the most revenue?\n"
+                "• list all iOS apps sorted by popularity\n"
+                "• biggest change in UA spend Jan 2025 vs Dec 2024"
+            ),
+            "explanation": "",
+            "assumptions": "",
+        }  
+
+    # Slot-filled templates: exact, parameterized SQL for common question shapes.
+    # Questions with a canned rule keep it; anything the slots don't fully cover goes on.
+    if TEMPLATES_ENABLED and not (intent and intent.kind == "rule"):
+        plan = plan_from_template(user_text)
+        if plan:
+            logger.info(f"[nlp] template matched: {plan['template']}")
+            return "template", plan
     
     # LLM-FIRST (try model before rules when configured)
     if LLM_FIRST and USE_OPENAI:
         try:
-            return _llm_plan(user_text, last_plan=last_plan)
+            return _cached_llm_plan(user_text, last_plan=last_plan, on_sql=on_sql)
         except Exception:
             logger.exception("[nlp] LLM-first planning failed")
     
     # Rules (fast path for common asks like “how many apps…”)
-    for idx, (pat, plan) in enumerate(SIMPLE_RULES):
-        if pat.search(user_text or ""):
-            logger.info(f"[nlp] rule matched: #{idx}")
-            return plan
+    if intent and intent.kind == "rule":
+        logger.info(f"[nlp] rule matched: {intent.label}")
+        return "rule", intent.payload
     
     # LLM fallback (if rules didn’t match)
     if USE_OPENAI:
         try:
-            return _llm_plan(user_text, last_plan=last_plan)
+            return _cached_llm_plan(user_text, last_plan=last_plan, on_sql=on_sql)
         except Exception:
             logger.exception("[nlp] LLM fallback failed")
     
     # final generic (never return None)
     logger.info("[nlp] generic fallback")
-    return {
+    return "generic", {
         "sql": "SELECT app_name, platform, date, country, installs, in_app_revenue + ads_revenue AS total_revenue, ua_cost FROM app_metrics ORDER BY date DESC LIMIT 100;",
         "answer_type": "table",
         "explanation": "Generic recent rows.",
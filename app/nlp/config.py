@@ -8,11 +8,33 @@ USE_OPENAI = bool(os.getenv("OPENAI_API_KEY"))
 LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
 LLM_FIRST = os.getenv("LLM_FIRST", "true").lower() == "true"
 LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.0"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# idle seconds a pooled connection to the LLM API is kept open for reuse
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "120"))
+# stream plans and start the query as soon as its SQL is complete
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+
+# Prompt size: the k most similar few-shots, within a token budget (0 = unlimited)
+LLM_FEW_SHOTS_K = int(os.getenv("LLM_FEW_SHOTS_K", "3"))
+LLM_PROMPT_MAX_TOKENS = int(os.getenv("LLM_PROMPT_MAX_TOKENS", "1500"))
 
 # NLP Configuration
 ENABLE_FOLLOWUP_LOGIC = os.getenv("ENABLE_FOLLOWUP_LOGIC", "true").lower() == "true"
 ENABLE_RULE_FALLBACK = os.getenv("ENABLE_RULE_FALLBACK", "true").lower() == "true"
 
+# Plan cache (skips the LLM for questions it has already planned)
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "true").lower() == "true"
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH", "data/plan_cache.json")
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "2000"))
+PLAN_CACHE_TTL = int(os.getenv("PLAN_CACHE_TTL", str(7 * 24 * 3600)))
+# 0 disables lookup by similar question; otherwise the TF-IDF cosine threshold
+PLAN_CACHE_SIMILARITY = float(os.getenv("PLAN_CACHE_SIMILARITY", "0"))
+# new plans are written to PLAN_CACHE_PATH at most this often (0 = on every new plan)
+PLAN_CACHE_SAVE_SECONDS = float(os.getenv("PLAN_CACHE_SAVE_SECONDS", "5"))
+
+# Slot-filled SQL templates (answer common question shapes without the LLM)
+TEMPLATES_ENABLED = os.getenv("TEMPLATES_ENABLED", "true").lower() == "true"
+
 # Logging Configuration
 LOG_LLM_USAGE = os.getenv("LOG_LLM_USAGE", "true").lower() == "true"
 LOG_RULE_USAGE = os.getenv("LOG_RULE_USAGE", "true").lower() == "true"
@@ -24,6 +46,9 @@ def get_llm_config():
         "model": LLM_MODEL,
         "llm_first": LLM_FIRST,
         "temperature": LLM_TEMPERATURE,
+        "streaming": LLM_STREAMING,
+        "few_shots_k": LLM_FEW_SHOTS_K,
+        "prompt_max_tokens": LLM_PROMPT_MAX_TOKENS,
         "api_key_configured": bool(os.getenv("OPENAI_API_KEY"))
     }
 
@@ -34,5 +59,8 @@ def get_nlp_config():
         "enable_followup": ENABLE_FOLLOWUP_LOGIC,
         "enable_rule_fallback": ENABLE_RULE_FALLBACK,
         "log_llm": LOG_LLM_USAGE,
-        "log_rules": LOG_RULE_USAGE
+        "log_rules": LOG_RULE_USAGE,
+        "plan_cache": PLAN_CACHE_ENABLED,
+        "plan_cache_similarity": PLAN_CACHE_SIMILARITY,
+        "templates": TEMPLATES_ENABLED
     }
@@ -0,0 +1,214 @@
+"""
+Follow-ups answered by editing the previous query instead of planning anew.
+
+"what about iOS?", "only in Germany", "last 7 days instead", "by installs",
+"top 5", "bottom 3", "all platforms", "by country", "in total": the follow-up
+is read with the template slot extractor, and the previous SQL (whichever
+planner wrote it) is parsed with app/sql/query.py and changed structurally.
+Filters are replaced in the block that reads app_metrics, a metric is
+swapped in the select list and ORDER BY, grouping is changed on flat
+aggregates, and top-N and sort direction go on the outer query. If the
+follow-up has words no slot explains, or the SQL is outside what the parser
+covers, there is no rewrite and the question is planned from scratch.
+"""
+import re, logging
+from typing import Any, Dict, List, Optional, Tuple
+from .templates import extract_slots, FOLLOWUP_FILLER, METRICS, GROUPS
+from ..sql.lexer import Token, tokenize
+from ..sql.query import Item, Select, parse, canonical, mentions, is_aggregate
+
+logger = logging.getLogger(__name__)
+
+ALL_DIMS = re.compile(r"\b(all|both|every|any)\s+(platforms?|countries|country|markets?)\b", re.I)
+IN_TOTAL = re.compile(r"\b(in\s+total|overall|altogether|combined|in\s+aggregate)\b", re.I)
+EXPLICIT_GROUP = re.compile(r"\b(by|per|each)\s+(day|date|month|country|countries|platforms?|apps?)\b"
+                            r"|\b(daily|monthly)\b", re.I)
+DESCENDING = re.compile(r"\b(top|best|highest|most|largest|biggest)\b", re.I)
+# words that only carry the "same again, but..." of a follow-up
+FOLLOWUP_WORDS = FOLLOWUP_FILLER | {
+    "users", "side", "version", "versions", "those", "these", "them", "that", "one", "ones", "results",
+    "numbers", "data", "see", "again", "like", "filter", "filtered", "restrict", "switch", "change",
+    "look", "let", "i", "want", "can", "you", "could", "would", "rather", "than", "same", "query",
+}
+
+_METRIC_EXPR = {alias: expr for _, alias, expr in METRICS}
+_METRIC_OF = {canonical(tokenize(expr), []): alias for alias, expr in _METRIC_EXPR.items()}
+_METRIC_OF[canonical(tokenize("SUM(ads_revenue + in_app_revenue)"), [])] = "total_revenue"
+_DIM_EXPR = {dim: expr for _, dim, expr in GROUPS}
+
+def read_followup(text: str) -> Optional[Dict[str, Any]]:
+    """What a follow-up changes, or None if it isn't only a change to the previous question."""
+    changes: Dict[str, Any] = {}
+    work = text or ""
+    for m in ALL_DIMS.finditer(work):
+        changes["platform" if m.group(2).lower().startswith("platform") else "countries"] = None
+    work = ALL_DIMS.sub(" ", work)
+    if IN_TOTAL.search(work):
+        changes["group"] = []
+        work = IN_TOTAL.sub(" ", work)
+    slots, leftover = extract_slots(work)
+    if slots.get("count_apps") or [w for w in leftover if w not in FOLLOWUP_WORDS]:
+        return None
+    for key in ("platform", "countries", "date_range", "metrics", "top_n"):
+        if key in slots:
+            if key in changes:  # "all platforms ... iOS"
+                return None
+            changes[key] = slots[key]
+    if slots.get("group") and "group" not in changes:
+        if EXPLICIT_GROUP.search(work):
+            changes["group"] = slots["group"]
+        else:
+            # "what about android apps?" names what the previous query already shows;
+            # "which country ...?" after a per-app answer is a new question
+            changes["mentioned"] = slots["group"]
+    if slots.get("ascending"):
+        changes["descending"] = False
+    elif DESCENDING.search(work):
+        changes["descending"] = True
+    return changes or None
+
+def _name(text: str) -> List[Token]:
+    return [Token("ident", text, -1)]
+
+def _replace_filter(block: Select, column: str, conds: List[Tuple[str, Any]]) -> bool:
+    """Swap the block's conditions on column for conds [(op, value)]; False if an existing one isn't simple."""
+    keep = []
+    for c in block.where:
+        if mentions(c, column):
+            p = block.predicate(c)
+            if p is None or p.column != column:
+                return False
+        else:
+            keep.append(c)
+    for op, value in conds:
+        if op == "in":
+            toks = _name(column) + [Token("ident", "IN", -1), Token("op", "(", -1)]
+            for i, v in enumerate(value):
+                toks += ([Token("op", ",", -1)] if i else []) + [block.bind(v)]
+            keep.append(toks + [Token("op", ")", -1)])
+        else:
+            keep.append(_name(column) + [Token("op", op, -1), block.bind(value)])
+    block.where = keep
+    return True
+
+def _metric(item: Item, params) -> Optional[str]:
+    return _METRIC_OF.get(canonical(item.expr, params))
+
+def _refs(item: Item, params) -> set:
+    # ways ORDER BY can point at a select item: its expression or its name
+    refs = {canonical(item.expr, params)}
+    if item.name:
+        refs.add((("i", item.name.lower()),))
+    return refs
+
+def rewrite(sql: str, params, changes: Dict[str, Any]) -> Optional[Tuple[str, List[Any], str, List[str]]]:
+    """(sql, params, answer_type, notes) of the previous query with changes applied, or None."""
+    try:
+        q = parse(sql, params)
+    except ValueError:
+        return None
+    blocks = q.blocks()
+    base = blocks[-1]
+    if str(base.source).lower() != "app_metrics":
+        return None
+    exprs = [t for b in blocks for it in b.items for t in it.expr] + [t for b in blocks for c in b.where for t in c]
+    if any(t.is_("select") for t in exprs):
+        return None  # subqueries in expressions: filters would not reach them
+    answer_type, notes = None, []
+    for dim in changes.get("mentioned", []):
+        column = "date" if dim == "month" else dim
+        if not any(mentions(it.expr, column) for it in q.items):
+            return None
+
+    for key, column in (("platform", "platform"), ("countries", "country")):
+        if key not in changes:
+            continue
+        value = changes[key]
+        if value is None:
+            conds, note = [], f"all {'platforms' if key == 'platform' else 'countries'}"
+        elif key == "platform":
+            conds, note = [("=", value)], f"{value} only"
+        else:
+            conds, note = ([("=", value[0])] if len(value) == 1 else [("in", value)]), "country " + "/".join(value)
+        if not _replace_filter(base, column, conds):
+            return None
+        notes.append(note)
+
+    if "date_range" in changes:
+        dr = changes["date_range"]
+        # periods compared inside CASE expressions would be emptied by a date filter
+        if any(mentions(it.expr, "date") and any(t.is_("case") for t in it.expr) for b in blocks for it in b.items):
+            return None
+        conds = [(">=", dr["start"])] + ([("<=", dr["end"])] if dr.get("end") else [])
+        if not _replace_filter(base, "date", conds):
+            return None
+        notes.append(dr["label"])
+
+    if "metrics" in changes:
+        at = [i for i, it in enumerate(q.items) if _metric(it, q.params)]
+        if len(blocks) > 1 or len(at) != 1 or q.having:
+            return None
+        old = q.items[at[0]]
+        if [_metric(old, q.params)] != changes["metrics"]:
+            new = [Item(tokenize(_METRIC_EXPR[a]), a) for a in changes["metrics"]]
+            q.items[at[0]:at[0] + 1] = new
+            refs = _refs(old, q.params)
+            q.order_by = [(_name(new[0].alias) if canonical(e, q.params) in refs else e, d) for e, d in q.order_by]
+            notes.append("metric " + ", ".join(changes["metrics"]))
+
+    if "group" in changes:
+        dims = [it for it in q.items if not is_aggregate(it.expr)]
+        aggs = [it for it in q.items if is_aggregate(it.expr)]
+        if len(blocks) > 1 or q.having or q.distinct or not aggs:
+            return None
+        if {canonical(it.expr, q.params) for it in dims} != {canonical(g, q.params) for g in q.group_exprs()}:
+            return None
+        group = changes["group"]
+        q.items = [Item(tokenize(_DIM_EXPR[d]), None if _DIM_EXPR[d] == d else d) for d in group] + aggs
+        q.group_by = [tokenize(_DIM_EXPR[d]) for d in group]
+        refs = set().union(*(_refs(it, q.params) for it in aggs))
+        q.order_by = [(e, d) for e, d in q.order_by if canonical(e, q.params) in refs]
+        if not group:
+            q.order_by, q.limit, answer_type = [], None, "simple"
+            notes.append("in total")
+        else:
+            if group[0] in ("date", "month"):  # a trend reads in time order, as the templates write it
+                q.order_by = [(_name(d), False) for d in group]
+            elif not q.order_by:
+                q.order_by = [(_name(aggs[0].name), True)] if aggs[0].name else []
+            answer_type = "table"
+            notes.append("grouped by " + ", ".join(group))
+
+    if "descending" in changes:
+        if q.order_by:
+            q.order_by[0] = (q.order_by[0][0], changes["descending"])
+        elif set(changes) == {"descending"}:
+            return None
+    if "top_n" in changes:
+        q.limit = changes["top_n"]
+        notes.append(f"{'top' if changes.get('descending', True) else 'bottom'} {changes['top_n']}")
+    elif changes.get("descending") is False:
+        notes.append("lowest first")
+
+    new_sql, new_params = q.render()
+    return new_sql, new_params, answer_type, notes
+
+def followup_plan(text: str, last_plan: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """A plan for the follow-up made by editing last_plan's SQL, or None."""
+    if not last_plan.get("sql"):
+        return None
+    changes = read_followup(text)
+    if not changes:
+        return None
+    out = rewrite(last_plan["sql"], last_plan.get("params"), changes)
+    if out is None:
+        logger.info("[nlp] follow-up %s doesn't fit the previous SQL", sorted(changes))
+        return None
+    sql, params, answer_type, notes = out
+    assumptions = "Follow-up on the previous question."
+    if "date_range" in changes:
+        assumptions += f" Date range: {changes['date_range']['label']}."
+    return {"sql": sql, "params": params or None,
+            "answer_type": answer_type or last_plan.get("answer_type", "table"),
+            "explanation": f"Previous query changed to: {'; '.join(notes)}." if notes else "Previous query, reordered.",
+            "assumptions": assumptions}
@@ -0,0 +1,104 @@
+"""
+Incremental parser for the planner's JSON object, fed as the LLM streams it.
+
+    p = IncrementalJSON()
+    for piece in chunks:
+        for key, value in p.feed(piece):   # each top-level field once it is complete
+            ...
+    p.done, p.fields
+
+Anything before the opening brace (a ```json fence, a stray sentence) is
+skipped. Values of any JSON type are handed to json.loads once their extent
+is known, so escapes and nesting behave exactly as in json.loads. Raises
+ValueError as soon as the text stops being a JSON object.
+"""
+import json
+from typing import Any, Dict, List, Tuple
+
+class IncrementalJSON:
+    def __init__(self):
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._buf = ""
+        self._i = 0
+        self._state = "start"   # start, key, key_str, colon, value_start, value, after, end
+        self._start = 0         # where the current key or value began in _buf
+        self._key = ""
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+
+    def _fail(self, c: str):
+        raise ValueError(f"unexpected {c!r} at offset {self._i} of streamed JSON ({self._state})")
+
+    def _complete(self, end: int, out: List[Tuple[str, Any]]):
+        value = json.loads(self._buf[self._start:end])
+        self.fields[self._key] = value
+        out.append((self._key, value))
+        self._state = "after"
+
+    def feed(self, text: str) -> List[Tuple[str, Any]]:
+        """Consume the next piece; returns the (key, value) fields it completed, in order."""
+        self._buf += text
+        buf, out = self._buf, []
+        while self._i < len(buf) and self._state != "end":
+            c, st = buf[self._i], self._state
+            if st == "start":
+                if c == "{":
+                    self._state = "key"
+            elif st == "key":
+                if c == '"':
+                    self._start, self._esc, self._state = self._i, False, "key_str"
+                elif c == "}" and not self.fields:
+                    self._state, self.done = "end", True
+                elif not c.isspace():
+                    self._fail(c)
+            elif st == "key_str":
+                if self._esc:
+                    self._esc = False
+                elif c == "\\":
+                    self._esc = True
+                elif c == '"':
+                    self._key = json.loads(buf[self._start:self._i + 1])
+                    self._state = "colon"
+            elif st == "colon":
+                if c == ":":
+                    self._state = "value_start"
+                elif not c.isspace():
+                    self._fail(c)
+            elif st == "value_start":
+                if not c.isspace():
+                    self._start, self._depth, self._in_str, self._esc = self._i, 0, False, False
+                    self._state = "value"
+                    continue  # the first character belongs to the value
+            elif st == "value":
+                if self._in_str:
+                    if self._esc:
+                        self._esc = False
+                    elif c == "\\":
+                        self._esc = True
+                    elif c == '"':
+                        self._in_str = False
+                        if self._depth == 0:
+                            self._complete(self._i + 1, out)
+                elif c == '"':
+                    self._in_str = True
+                elif c in "{[":
+                    self._depth += 1
+                elif c in "}]" and self._depth > 0:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        self._complete(self._i + 1, out)
+                elif self._depth == 0 and (c in ",}" or c.isspace()):
+                    # end of a number / true / false / null; the delimiter is the next state's
+                    self._complete(self._i, out)
+                    continue
+            elif st == "after":
+                if c == ",":
+                    self._state = "key"
+                elif c == "}":
+                    self._state, self.done = "end", True
+                elif not c.isspace():
+                    self._fail(c)
+            self._i += 1
+        return out
@@ -0,0 +1,286 @@
+"""
+Persistent cache of LLM plans, keyed on the normalized question plus the SQL dialect and prior-plan context.
+
+    python -m app.nlp.plan_cache stats
+    python -m app.nlp.plan_cache pin "which apps grew fastest last month?"
+    python -m app.nlp.plan_cache unpin "which apps grew fastest last month?"
+"""
+import os, re, sys, json, math, time, atexit, hashlib, logging, tempfile, threading
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Words that change the meaning of a question even when the rest is identical
+# ("top 3" vs "top 5", "ios" vs "android"); similar-question hits must agree on them.
+GUARD_WORDS = {
+    "ios", "android", "us", "gb", "de", "fr", "ca", "br", "in", "au",
+    "installs", "install", "revenue", "ads", "iap", "ua", "cost", "spend", "popularity", "popular",
+    "most", "least", "top", "bottom", "highest", "lowest", "best", "worst", "increase", "decrease",
+    "today", "yesterday", "day", "days", "week", "weeks", "month", "months", "year", "years",
+    "jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec",
+    "january", "february", "march", "april", "june", "july", "august", "september",
+    "october", "november", "december", "not", "without", "except",
+}
+
+def normalize_question(text: str) -> str:
+    text = re.sub(r"<@[^>]+>", " ", (text or "").lower())
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+def context_key(last_plan: Optional[Dict[str, Any]], dialect: str = "sqlite") -> str:
+    """The SQL dialect plans are written in (DB_ENGINE changes the prompt), plus the previous plan's SQL."""
+    if not last_plan:
+        return dialect
+    sql = " ".join((last_plan.get("sql") or "").split())
+    return f"{dialect}:{hashlib.sha1(sql.encode('utf-8')).hexdigest()[:12]}"
+
+def _guard(words) -> Tuple[str, ...]:
+    return tuple(sorted({w for w in words if w in GUARD_WORDS or w.isdigit()}))
+
+class PlanCache:
+    """LRU + TTL plan cache persisted as JSON.
+
+    Exact hits match the normalized question and context (SQL dialect and
+    prior plan). When
+    `similarity` > 0, a miss falls back to the most similar cached question
+    (TF-IDF cosine) in the same context whose guard words match exactly.
+    Pinned entries never expire and are never evicted.
+
+    New plans are written back at most once per `save_delay` seconds (0 =
+    on every put). Each save first merges pin changes another process (the
+    pin/unpin CLI) made to the file, newest `pinned_at` winning, so a running
+    bot doesn't overwrite them.
+    """
+
+    def __init__(self, path: Optional[str], max_entries: int = 2000, ttl_seconds: int = 7 * 24 * 3600,
+                 similarity: float = 0.0, save_delay: float = 5.0, dialect: str = "sqlite"):
+        self.path = Path(path) if path else None
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.similarity = similarity
+        self.save_delay = save_delay
+        self.dialect = dialect
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.df: Counter = Counter()  # document frequency of words across cached questions
+        self.counters = Counter()
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()  # one writer at a time, held across merge, write and replace
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        self._load()
+        if self.path:
+            atexit.register(self.flush)
+
+    # ---------- persistence ----------
+
+    def _read(self) -> List[Dict[str, Any]]:
+        if not self.path or not self.path.exists():
+            return []
+        try:
+            return json.loads(self.path.read_text(encoding="utf-8")).get("entries", [])
+        except (OSError, ValueError):
+            logger.warning("[nlp] plan cache at %s unreadable", self.path)
+            return []
+
+    def _load(self):
+        for e in self._read():
+            self._add(e)
+        self._evict()
+        if self.entries:
+            logger.info("[nlp] plan cache loaded %d entries", len(self.entries))
+
+    def _merge_pins(self, on_disk: List[Dict[str, Any]]):
+        # caller holds the lock
+        for e in on_disk:
+            k = self._key(e["ctx"], e["question"])
+            mine = self.entries.get(k)
+            if mine is None:
+                if e.get("pinned"):
+                    self._add(e)
+            elif e.get("pinned_at", 0) > mine.get("pinned_at", 0):
+                mine["pinned"], mine["pinned_at"] = bool(e.get("pinned")), e["pinned_at"]
+
+    def save(self):
+        if not self.path:
+            return
+        with self._save_lock:
+            on_disk = self._read()
+            with self._lock:
+                self._merge_pins(on_disk)
+                self._dirty = False
+                payload = json.dumps({"entries": list(self.entries.values())})
+            tmp = None
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.path.parent,
+                                                 prefix=self.path.name + ".", suffix=".tmp", delete=False) as f:
+                    tmp = f.name
+                    f.write(payload)
+                os.replace(tmp, self.path)
+            except OSError:
+                logger.exception("[nlp] could not persist plan cache")
+                if tmp and os.path.exists(tmp):
+                    os.unlink(tmp)
+
+    def flush(self):
+        """Write pending changes now (also runs at exit)."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            dirty = self._dirty
+        if dirty:
+            self.save()
+
+    def _save_later(self):
+        if not self.path:
+            return
+        if self.save_delay <= 0:
+            self.save()
+            return
+        with self._lock:
+            self._dirty = True
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.save_delay, self._timed_save)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_save(self):
+        with self._lock:
+            self._timer = None
+        self.save()
+
+    # ---------- internals (caller holds the lock) ----------
+
+    @staticmethod
+    def _key(ctx: str, question: str) -> str:
+        return f"{ctx}|{question}"
+
+    def _add(self, entry: Dict[str, Any]):
+        k = self._key(entry["ctx"], entry["question"])
+        if k in self.entries:
+            self._drop(k)
+        self.entries[k] = entry
+        self.df.update(set(entry["question"].split()))
+
+    def _drop(self, k: str):
+        e = self.entries.pop(k)
+        self.df.subtract(set(e["question"].split()))
+
+    def _expired(self, e: Dict[str, Any], now: float) -> bool:
+        return not e.get("pinned") and now - e["created"] > self.ttl
+
+    def _evict(self):
+        now = time.time()
+        for k in [k for k, e in self.entries.items() if self._expired(e, now)]:
+            self._drop(k)
+        for k in list(self.entries):
+            if len(self.entries) <= self.max_entries:
+                break
+            if not self.entries[k].get("pinned"):
+                self._drop(k)
+                self.counters["evictions"] += 1
+
+    def _vector(self, words) -> Dict[str, float]:
+        n = len(self.entries) + 1
+        tf = Counter(words)
+        vec = {w: c * (math.log(n / (1 + self.df.get(w, 0))) + 1.0) for w, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {w: v / norm for w, v in vec.items()}
+
+    def _similar(self, ctx: str, question: str) -> Optional[Dict[str, Any]]:
+        words = question.split()
+        guard = _guard(words)
+        qv = self._vector(words)
+        best, best_score = None, self.similarity
+        now = time.time()
+        for e in self.entries.values():
+            if e["ctx"] != ctx or self._expired(e, now) or _guard(e["question"].split()) != guard:
+                continue
+            ev = self._vector(e["question"].split())
+            score = sum(v * ev.get(w, 0.0) for w, v in qv.items())
+            if score >= best_score:
+                best, best_score = e, score
+        return best
+
+    # ---------- public API ----------
+
+    def get(self, user_text: str, last_plan: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        question, ctx = normalize_question(user_text), context_key(last_plan, self.dialect)
+        if not question:
+            return None
+        with self._lock:
+            k = self._key(ctx, question)
+            e = self.entries.get(k)
+            if e and self._expired(e, time.time()):
+                self._drop(k)
+                e = None
+            kind = "hits"
+            if e is None and self.similarity > 0:
+                e = self._similar(ctx, question)
+                kind = "similar_hits"
+            if e is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters[kind] += 1
+            e["hits"] = e.get("hits", 0) + 1
+            e["last_used"] = time.time()
+            self.entries.move_to_end(self._key(e["ctx"], e["question"]))
+            return dict(e["plan"])
+
+    def put(self, user_text: str, last_plan: Optional[Dict[str, Any]], plan: Dict[str, Any], pinned: bool = False):
+        question = normalize_question(user_text)
+        if not question or not plan.get("sql"):
+            return
+        now = time.time()
+        with self._lock:
+            prev = self.entries.get(self._key(context_key(last_plan, self.dialect), question)) or {}
+            entry = {"question": question, "ctx": context_key(last_plan, self.dialect), "plan": dict(plan),
+                     "created": now, "last_used": now, "hits": 0,
+                     "pinned": pinned or bool(prev.get("pinned")), "pinned_at": prev.get("pinned_at", 0)}
+            if pinned:
+                entry["pinned_at"] = now
+            self._add(entry)
+            self._evict()
+        self._save_later()
+
+    def pin(self, user_text: str, last_plan: Optional[Dict[str, Any]] = None,
+            plan: Optional[Dict[str, Any]] = None, pinned: bool = True) -> bool:
+        """Mark a verified plan as permanent (or unpin it). Returns False if there is nothing to pin."""
+        if plan is not None:
+            self.put(user_text, last_plan, plan, pinned=pinned)
+        with self._lock:
+            e = self.entries.get(self._key(context_key(last_plan, self.dialect), normalize_question(user_text)))
+            if not e:
+                return False
+            e["pinned"], e["pinned_at"] = pinned, time.time()
+        self.save()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self.entries),
+                    "pinned": sum(1 for e in self.entries.values() if e.get("pinned")),
+                    **{k: self.counters.get(k, 0) for k in ("hits", "similar_hits", "misses", "evictions")}}
+
+def _build() -> Optional[PlanCache]:
+    from .config import (PLAN_CACHE_ENABLED, PLAN_CACHE_PATH, PLAN_CACHE_MAX_ENTRIES,
+                         PLAN_CACHE_TTL, PLAN_CACHE_SIMILARITY, PLAN_CACHE_SAVE_SECONDS)
+    if not PLAN_CACHE_ENABLED:
+        return None
+    from ..sql.engines import get_dialect
+    return PlanCache(PLAN_CACHE_PATH, PLAN_CACHE_MAX_ENTRIES, PLAN_CACHE_TTL, PLAN_CACHE_SIMILARITY,
+                     PLAN_CACHE_SAVE_SECONDS, dialect=get_dialect().name)
+
+plan_cache = _build()
+
+if __name__ == "__main__":
+    if plan_cache is None:
+        sys.exit("plan cache disabled (PLAN_CACHE_ENABLED=false)")
+    cmd, rest = (sys.argv[1] if len(sys.argv) > 1 else "stats"), " ".join(sys.argv[2:])
+    if cmd in ("pin", "unpin"):
+        print("ok" if plan_cache.pin(rest, pinned=cmd == "pin") else "not cached")
+    else:
+        print(json.dumps(plan_cache.stats(), indent=2))
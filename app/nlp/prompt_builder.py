@@ -0,0 +1,124 @@
+"""
+Prompt assembly for the LLM planner.
+
+The prompt is two messages. The system message (rules, dialect, schema) is
+identical for every question, so it is built once per dialect and the
+provider can cache it as a prompt prefix. The user message carries only what
+varies: the k few-shots most similar to the question (TF-IDF over the shot
+questions, indexed once), the prior plan for follow-ups, and the question.
+Shots are dropped, least relevant first, to stay within the token budget.
+"""
+import json, math, logging, threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from .plan_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # optional: falls back to ~4 characters per token
+    tiktoken = None
+
+def _encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:  # encoding files not downloadable here
+        return None
+
+class ShotIndex:
+    """TF-IDF index over few-shot questions, built once; `top(q, k)` ranks shots by cosine similarity."""
+
+    def __init__(self, shots: Sequence[Dict[str, Any]]):
+        self.shots = list(shots)
+        docs = [normalize_question(s["user"]).split() for s in self.shots]
+        df = Counter(w for words in docs for w in set(words))
+        n = len(docs) + 1
+        self.idf = {w: math.log(n / (1 + c)) + 1.0 for w, c in df.items()}
+        self.default_idf = math.log(n) + 1.0
+        self.vectors = [self._vector(words) for words in docs]
+
+    def _vector(self, words) -> Dict[str, float]:
+        tf = Counter(words)
+        vec = {w: c * self.idf.get(w, self.default_idf) for w, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {w: v / norm for w, v in vec.items()}
+
+    def top(self, question: str, k: int) -> List[Tuple[int, float]]:
+        """(shot index, score) of the k most similar shots, best first; ties keep FEW_SHOTS order."""
+        qv = self._vector(normalize_question(question).split())
+        scores = [(i, sum(v * vec.get(w, 0.0) for w, v in qv.items())) for i, vec in enumerate(self.vectors)]
+        return sorted(scores, key=lambda s: -s[1])[:max(k, 0)]
+
+class PromptBuilder:
+    """Builds [system, user] planner messages within `max_tokens` (0 = no budget)."""
+
+    def __init__(self, system_prompt: str, schema_text: str, shots: Sequence[Dict[str, Any]],
+                 k: int = 3, max_tokens: int = 0):
+        self.system_prompt = system_prompt
+        self.schema_text = schema_text
+        self.k = k
+        self.max_tokens = max_tokens
+        self.index = ShotIndex(shots)
+        # serialized once; JSON is compact because every separator is a token
+        self.shot_texts = [f"User: {s['user']}\nJSON: {json.dumps(s['json'], separators=(',', ':'))}"
+                           for s in shots]
+        self._prefixes: Dict[str, str] = {}
+        self._enc = _encoding()
+        self._lock = threading.Lock()
+
+    def count_tokens(self, text: str) -> int:
+        if self._enc is not None:
+            return len(self._enc.encode(text, disallowed_special=()))
+        return (len(text) + 3) // 4
+
+    def prefix(self, dialect_rule: str) -> str:
+        """The static system message for one dialect (cached)."""
+        p = self._prefixes.get(dialect_rule)
+        if p is None:
+            p = (self.system_prompt.replace("{DIALECT}", dialect_rule).strip()
+                 + "\n\nSCHEMA:\n" + self.schema_text.strip())
+            with self._lock:
+                self._prefixes[dialect_rule] = p
+        return p
+
+    @staticmethod
+    def _prior(last_plan: Optional[Dict[str, Any]]) -> str:
+        if not last_plan:
+            return ""
+        return ("Previous query context:"
+                f"\nSQL: {last_plan.get('sql','')}"
+                f"\nAnswer type: {last_plan.get('answer_type','')}"
+                f"\nExplanation: {last_plan.get('explanation','')}")
+
+    def build(self, user_text: str, dialect_rule: str,
+              last_plan: Optional[Dict[str, Any]] = None) -> Tuple[List[Tuple[str, str]], Dict[str, int]]:
+        """(messages, info): chat messages for `llm.invoke` and {"shots", "tokens"} for logging."""
+        system = self.prefix(dialect_rule)
+        tail = f"User: {user_text}\nReturn ONLY the JSON."
+        prior = self._prior(last_plan)
+        picked = [i for i, _ in self.index.top(user_text, self.k)]
+        parts = lambda ids: [self.shot_texts[i] for i in ids] + ([prior] if prior else []) + [tail]
+        fixed = self.count_tokens(system) + self.count_tokens(prior) + self.count_tokens(tail)
+        if self.max_tokens:
+            used = fixed + sum(self.count_tokens(self.shot_texts[i]) for i in picked)
+            while picked and used > self.max_tokens:
+                used -= self.count_tokens(self.shot_texts[picked.pop()])
+            if used > self.max_tokens:
+                logger.warning("[nlp] prompt is %d tokens with no few-shots (budget %d)", used, self.max_tokens)
+        user = "\n\n".join(parts(picked))
+        tokens = self.count_tokens(system) + self.count_tokens(user)
+        return [("system", system), ("human", user)], {"shots": len(picked), "tokens": tokens}
+
+_builder: Optional[PromptBuilder] = None
+
+def get_prompt_builder() -> PromptBuilder:
+    global _builder
+    if _builder is None:
+        from .prompts import SYSTEM_PROMPT, FEW_SHOTS
+        from .schema_doc import SCHEMA_TEXT
+        from .config import LLM_FEW_SHOTS_K, LLM_PROMPT_MAX_TOKENS
+        _builder = PromptBuilder(SYSTEM_PROMPT, SCHEMA_TEXT, FEW_SHOTS, LLM_FEW_SHOTS_K, LLM_PROMPT_MAX_TOKENS)
+    return _builder
@@ -10,7 +10,7 @@ IMPORTANT RULES:
 6. Be smart about aggregations - use SUM, COUNT, AVG when appropriate
 7. Handle platform filters (iOS/Android) intelligently
 8. Consider country-based analysis when relevant
-9. Use proper SQL syntax for SQLite
+9. {DIALECT}
 
 RESPONSE FORMAT:
 Return a JSON object with these exact fields:
@@ -68,7 +68,7 @@ FEW_SHOTS = [
     {
         "user": "Which apps had the biggest change in UA spend comparing Jan 2025 to Dec 2024?",
         "json": {
-            "sql": "SELECT app_name, ua_dec_2024_12 AS ua_dec_2024_12, ua_jan_2025_01 AS ua_jan_2025_01, (ua_jan_2025_01 - ua_dec_2024_12) AS delta, CASE WHEN ua_dec_2024_12=0 THEN NULL ELSE (ua_jan_2025_01 - ua_dec_2024_12)*1.0/ua_dec_2024_12 END AS pct_change FROM ( SELECT app_name, SUM(CASE WHEN date BETWEEN '2024-12-01' AND '2024-12-31' THEN ua_cost ELSE 0 END) AS ua_dec_2024_12, SUM(CASE WHEN date BETWEEN '2025-01-01' AND '2025-01-31' THEN ua_cost ELSE 0 END) AS ua_jan_2025_01 FROM app_metrics GROUP BY app_name ) t ORDER BY ABS(delta) DESC LIMIT 100",            "answer_type": "table",
+            "sql": "SELECT app_name, ua_dec_2024_12 AS ua_dec_2024_12, ua_jan_2025_01 AS ua_jan_2025_01, (ua_jan_2025_01 - ua_dec_2024_12) AS delta, CASE WHEN ua_dec_2024_12=0 THEN NULL ELSE (ua_jan_2025_01 - ua_dec_2024_12)*1.0/ua_dec_2024_12 END AS pct_change FROM ( SELECT app_name, SUM(CASE WHEN date BETWEEN '2024-12-01' AND '2024-12-31' THEN ua_cost ELSE 0 END) AS ua_dec_2024_12, SUM(CASE WHEN date BETWEEN '2025-01-01' AND '2025-01-31' THEN ua_cost ELSE 0 END) AS ua_jan_2025_01 FROM app_metrics GROUP BY app_name ) t ORDER BY ABS(ua_jan_2025_01 - ua_dec_2024_12) DESC LIMIT 100",            "answer_type": "table",
             "explanation": "Compares monthly UA cost and ranks by absolute change.",
             "assumptions": "Months fixed to Dec 2024 vs Jan 2025."
         }
@@ -0,0 +1,147 @@
+import re, threading
+from collections import Counter, deque
+from typing import Any, Dict, List, NamedTuple, Optional, Pattern, Sequence, Set, Tuple, Union
+
+try:  # the regex parser moved in 3.11; both expose the same parse tree
+    import re._parser as _sre
+    from re._constants import LITERAL, SUBPATTERN, BRANCH, MAX_REPEAT, MIN_REPEAT
+except ImportError:  # pragma: no cover
+    import sre_parse as _sre
+    from sre_constants import LITERAL, SUBPATTERN, BRANCH, MAX_REPEAT, MIN_REPEAT
+
+class Intent(NamedTuple):
+    kind: str       # e.g. "export", "show_sql", "offtopic", "rule"
+    label: str      # unique per rule, e.g. "rule:3"; used for match statistics
+    payload: Any = None
+
+# ---------- required-keyword extraction ----------
+
+def _clauses(parsed) -> List[Set[str]]:
+    """Literal strings a match must contain: a list of clauses, each satisfied by any one member."""
+    out: List[Set[str]] = []
+    run: List[str] = []
+
+    def flush():
+        if run:
+            out.append({"".join(run)})
+            run.clear()
+
+    for op, av in parsed:
+        if op is LITERAL:
+            run.append(chr(av).lower())
+            continue
+        flush()
+        if op is SUBPATTERN:
+            out.extend(_clauses(av[-1]))
+        elif op is BRANCH:
+            alts = [_best(_clauses(b)) for b in av[1]]
+            if all(alts):
+                out.append(set().union(*alts))
+        elif op in (MAX_REPEAT, MIN_REPEAT) and av[0] >= 1:
+            out.extend(_clauses(av[2]))
+    flush()
+    return out
+
+def _best(clauses: List[Set[str]]) -> Optional[Set[str]]:
+    # most selective clause: the one whose shortest alternative is longest
+    return max(clauses, key=lambda c: min(len(w) for w in c), default=None)
+
+def required_keywords(pattern: str) -> Optional[Set[str]]:
+    """A set of lowercase keywords at least one of which appears in any text the pattern matches."""
+    try:
+        return _best(_clauses(_sre.parse(pattern)))
+    except Exception:
+        return None
+
+# ---------- Aho-Corasick ----------
+
+class _AhoCorasick:
+    def __init__(self, words):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Set[str]] = [set()]
+        for w in words:
+            s = 0
+            for ch in w:
+                if ch not in self.goto[s]:
+                    self.goto.append({}); self.fail.append(0); self.out.append(set())
+                    self.goto[s][ch] = len(self.goto) - 1
+                s = self.goto[s][ch]
+            self.out[s].add(w)
+        q = deque(self.goto[0].values())
+        while q:
+            s = q.popleft()
+            for ch, t in self.goto[s].items():
+                q.append(t)
+                f = self.fail[s]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[t] = self.goto[f].get(ch, 0) if self.goto[f].get(ch, 0) != t else 0
+                self.out[t] |= self.out[self.fail[t]]
+
+    def find(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        goto, fail, out = self.goto, self.fail, self.out
+        s = 0
+        for ch in text:
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s]:
+                found |= out[s]
+        return found
+
+# ---------- router ----------
+
+class IntentRouter:
+    """All intent rules compiled once at import and matched in one pass.
+
+    Each rule's regex is analysed for keywords it cannot match without; an
+    Aho-Corasick automaton over all keywords scans the lowercased text once,
+    and only the rules whose keywords occurred are confirmed with their
+    compiled regex, in priority order. The first confirmed rule wins, exactly
+    as if every rule were tried in turn with re.search (case-insensitive).
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, Union[str, Pattern], Any]]):
+        """rules: (kind, pattern, payload) in priority order."""
+        self.rules: List[Intent] = []
+        self._patterns: List[Pattern] = []
+        self._always: List[int] = []
+        self._by_keyword: Dict[str, List[int]] = {}
+        seen: Counter = Counter()
+        for i, (kind, pattern, payload) in enumerate(rules):
+            src = pattern.pattern if isinstance(pattern, re.Pattern) else pattern
+            self._patterns.append(re.compile(src, re.I))
+            self.rules.append(Intent(kind, f"{kind}:{seen[kind]}", payload))
+            seen[kind] += 1
+            keywords = required_keywords(src)
+            if not keywords:
+                self._always.append(i)
+            for w in keywords or ():
+                self._by_keyword.setdefault(w, []).append(i)
+        self._ac = _AhoCorasick(self._by_keyword)
+        self.counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def candidates(self, text: str) -> List[int]:
+        idx = set(self._always)
+        for w in self._ac.find(text.lower()):
+            idx.update(self._by_keyword[w])
+        return sorted(idx)
+
+    def route(self, text: str) -> Optional[Intent]:
+        text = text or ""
+        intent = None
+        for i in self.candidates(text):
+            if self._patterns[i].search(text):
+                intent = self.rules[i]
+                break
+        with self._lock:
+            self.counters["routed"] += 1
+            self.counters[intent.label if intent else "no_match"] += 1
+        return intent
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
@@ -0,0 +1,286 @@
+"""
+Parameterized question templates: deterministic slot extraction + SQL with bound parameters.
+
+A template only answers when every word of the question is accounted for by a
+slot (platform, country, date range, metric, top-N, grouping) or by filler
+words; anything else ("change", "comparing", "retention"...) is left to the
+LLM planner.
+"""
+import re, calendar
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+MAX_LIMIT = 1000
+
+PLATFORMS = [
+    (re.compile(r"\b(ios|iphone|ipad|apple)\b", re.I), "iOS"),
+    (re.compile(r"\b(android|google\s+play)\b", re.I), "Android"),
+]
+
+COUNTRY_NAMES = {
+    "US": r"united\s+states|usa|america",
+    "GB": r"united\s+kingdom|uk|britain|great\s+britain|england",
+    "DE": r"germany",
+    "FR": r"france",
+    "CA": r"canada",
+    "BR": r"brazil",
+    "IN": r"india",
+    "AU": r"australia",
+}
+# codes only count when written in capitals ("in US"), so "in"/"us" stay filler
+COUNTRY_CODES = re.compile(r"\b(" + "|".join(COUNTRY_NAMES) + r")\b")
+COUNTRY_WORDS = [(re.compile(rf"\b({pat})\b", re.I), code) for code, pat in COUNTRY_NAMES.items()]
+
+# (pattern, alias, SQL expression); more specific phrases first
+METRICS = [
+    (re.compile(r"\b(in[-\s]?app\s+revenue|iap(\s+revenue)?)\b", re.I), "in_app_revenue", "SUM(in_app_revenue)"),
+    (re.compile(r"\b(ads?\s+revenue|advertising\s+revenue)\b", re.I), "ads_revenue", "SUM(ads_revenue)"),
+    (re.compile(r"\b(ua(\s+(spend|cost|costs))?|user\s+acquisition(\s+(spend|cost))?|marketing\s+spend)\b", re.I),
+     "ua_cost", "SUM(ua_cost)"),
+    (re.compile(r"\b(total\s+revenue|revenue|revenues|income)\b", re.I), "total_revenue", "SUM(in_app_revenue + ads_revenue)"),
+    (re.compile(r"\b(installs?|downloads?|popularity|popular)\b", re.I), "installs", "SUM(installs)"),
+]
+
+GROUPS = [
+    (re.compile(r"\b(daily|by\s+day|per\s+day|each\s+day|by\s+date)\b", re.I), "date", "date"),
+    (re.compile(r"\b(monthly|by\s+month|per\s+month|each\s+month)\b", re.I), "month", "substr(date,1,7)"),
+    (re.compile(r"\b(countries|country)\b", re.I), "country", "country"),
+    (re.compile(r"\b(platforms?)\b", re.I), "platform", "platform"),
+    # "apps" alone is usually the subject ("revenue for iOS apps"); it's a dimension only when ranked or split by
+    (re.compile(r"\b(?:by|per|each|which|top|bottom|best|worst|list)\s+(?:(?:all|the|\d+)\s+)*(apps?)\b", re.I),
+     "app_name", "app_name"),
+]
+
+TOP_N = re.compile(r"\b(top|bottom|best|worst|first)\s+(\d{1,4})\b", re.I)
+ASCENDING = re.compile(r"\b(bottom|worst|least|lowest|fewest|smallest)\b", re.I)
+HOW_MANY_APPS = re.compile(r"\bhow\s+many\b(?=.*\bapps?\b)", re.I)
+TOTAL = re.compile(r"\b(total|overall|sum)\b", re.I)
+GROUPING_HINT = re.compile(r"\b(by|per|each|which|top|bottom|best|worst|list|rank|ranked|ranking|compare|breakdown)\b", re.I)
+
+MONTHS = {m.lower(): i for i, m in enumerate(calendar.month_name) if m}
+MONTHS.update({m.lower(): i for i, m in enumerate(calendar.month_abbr) if m})
+MONTH_RX = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+FILLER = set("""
+how many much what which who is are was were be the a an of for in on at by per from to do does did we our us
+have has had show me list give tell get all total sum overall number count apps app top bottom best worst most
+least highest lowest fewest largest smallest generate generates generated generating make makes made sorted sort
+order ordered rank ranked ranking between and during over within last past this days day weeks week months month
+years year please across each breakdown split compare vs versus with their its there currently so far far it
+brings bring earn earns earned spend spent cost costs countries country platforms platform s whats
+""".split())
+# extra words that are fine in a follow-up ("what about iOS instead?")
+FOLLOWUP_FILLER = FILLER | {"about", "instead", "only", "just", "now", "same", "then", "but", "also", "and", "for"}
+
+def _today() -> date:
+    # SQLite's date('now') is UTC; keep templates consistent with it
+    return datetime.now(timezone.utc).date()
+
+def _month_range(y: int, m: int) -> Tuple[str, str]:
+    return date(y, m, 1).isoformat(), date(y, m, calendar.monthrange(y, m)[1]).isoformat()
+
+def _date_range(text: str, today: date) -> Optional[Tuple[re.Match, Dict[str, Any]]]:
+    """First recognised date expression -> (match, {"start","end","label"})."""
+    rx = [
+        (rf"\b(?:in\s+|for\s+|during\s+)?({MONTH_RX})\.?\s+(\d{{4}})\b", "month_year"),
+        (r"\b(?:from\s+|between\s+)?(\d{4}-\d{2}-\d{2})\s+(?:to|and|until|-)\s+(\d{4}-\d{2}-\d{2})\b", "iso_range"),
+        (r"\bsince\s+(\d{4}-\d{2}-\d{2})\b", "since"),
+        (r"\b(?:in\s+the\s+|over\s+the\s+|for\s+the\s+|in\s+|over\s+|for\s+)?(?:last|past|previous)\s+(\d{1,4})\s+(days?|weeks?|months?|years?)\b", "last_n"),
+        (r"\b(?:in\s+|for\s+|during\s+)?(this|last|previous|current)\s+(week|month|year)\b", "calendar"),
+        (r"\b(today|yesterday)\b", "day"),
+        (r"\b(?:in|for|during)\s+(20\d{2})\b", "year"),
+    ]
+    for pat, kind in rx:
+        m = re.search(pat, text, re.I)
+        if not m:
+            continue
+        if kind == "month_year":
+            start, end = _month_range(int(m.group(2)), MONTHS[m.group(1).lower()])
+            return m, {"start": start, "end": end, "label": f"{m.group(1).title()} {m.group(2)}"}
+        if kind == "iso_range":
+            return m, {"start": m.group(1), "end": m.group(2), "label": f"{m.group(1)} to {m.group(2)}"}
+        if kind == "since":
+            return m, {"start": m.group(1), "end": None, "label": f"since {m.group(1)}"}
+        if kind == "last_n":
+            n, unit = int(m.group(1)), m.group(2).lower().rstrip("s")
+            days = n * {"day": 1, "week": 7, "month": 30, "year": 365}[unit]
+            return m, {"start": (today - timedelta(days=days)).isoformat(), "end": None,
+                       "label": f"last {n} {unit}{'s' if n != 1 else ''}"}
+        if kind == "calendar":
+            which, unit = m.group(1).lower(), m.group(2).lower()
+            prev = which in ("last", "previous")
+            if unit == "week":
+                start = today - timedelta(days=today.weekday()) - timedelta(days=7 if prev else 0)
+                end = start + timedelta(days=6) if prev else None
+            elif unit == "month":
+                first = today.replace(day=1)
+                start = (first - timedelta(days=1)).replace(day=1) if prev else first
+                end = first - timedelta(days=1) if prev else None
+            else:
+                start = date(today.year - (1 if prev else 0), 1, 1)
+                end = date(today.year - 1, 12, 31) if prev else None
+            return m, {"start": start.isoformat(), "end": end.isoformat() if end else None,
+                       "label": f"{'last' if prev else 'this'} {unit}"}
+        if kind == "day":
+            d = today - timedelta(days=1 if m.group(1).lower() == "yesterday" else 0)
+            return m, {"start": d.isoformat(), "end": d.isoformat(), "label": m.group(1).lower()}
+        if kind == "year":
+            y = int(m.group(1))
+            return m, {"start": f"{y}-01-01", "end": f"{y}-12-31", "label": str(y)}
+    return None
+
+def extract_slots(text: str, today: Optional[date] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """Fill slots from the question. Returns (slots, words not explained by any slot)."""
+    today = today or _today()
+    work = list(text or "")
+
+    def consume(m: re.Match, group: int = 0):
+        for i in range(m.start(group), m.end(group)):
+            work[i] = " "
+
+    def current() -> str:
+        return "".join(work)
+
+    slots: Dict[str, Any] = {}
+    # before the metric phrase ("total revenue") consumes the word
+    wants_total = TOTAL.search(text or "") and not GROUPING_HINT.search(text or "")
+
+    dr = _date_range(current(), today)
+    if dr:
+        consume(dr[0])
+        slots["date_range"] = dr[1]
+
+    found = []
+    for rx, alias, expr in METRICS:
+        for m in rx.finditer(current()):
+            found.append((m.start(), alias))
+            consume(m)
+    metrics = []
+    for _, alias in sorted(found):  # keep the order they were asked in
+        if alias not in metrics:
+            metrics.append(alias)
+    if metrics:
+        slots["metrics"] = metrics
+
+    countries = []
+    for m in COUNTRY_CODES.finditer(current()):
+        countries.append(m.group(1)); consume(m)
+    for rx, code in COUNTRY_WORDS:
+        for m in rx.finditer(current()):
+            countries.append(code); consume(m)
+    if countries:
+        slots["countries"] = sorted(set(countries))
+
+    platforms = set()
+    for rx, name in PLATFORMS:
+        for m in rx.finditer(current()):
+            platforms.add(name); consume(m)
+    if len(platforms) == 1:
+        slots["platform"] = platforms.pop()
+
+    m = TOP_N.search(current())
+    if m:
+        slots["top_n"] = min(int(m.group(2)), MAX_LIMIT)
+        consume(m, 2)
+    if ASCENDING.search(current()):
+        slots["ascending"] = True
+
+    if HOW_MANY_APPS.search(current()):
+        slots["count_apps"] = True
+    else:
+        group = []
+        for rx, dim, _ in GROUPS:
+            m = rx.search(current())
+            if m:
+                consume(m)
+                if not wants_total and dim not in group:
+                    group.append(dim)
+        if group:
+            slots["group"] = group[:2]
+
+    leftover = [w for w in re.findall(r"[a-z0-9]+", current().lower()) if w not in FILLER]
+    return slots, leftover
+
+def _where(slots: Dict[str, Any]) -> Tuple[str, List[Any]]:
+    conds, params = [], []
+    if slots.get("platform"):
+        conds.append("platform = ?"); params.append(slots["platform"])
+    if slots.get("countries"):
+        conds.append(f"country IN ({', '.join('?' * len(slots['countries']))})"); params.extend(slots["countries"])
+    dr = slots.get("date_range")
+    if dr and dr.get("start"):
+        conds.append("date >= ?"); params.append(dr["start"])
+    if dr and dr.get("end"):
+        conds.append("date <= ?"); params.append(dr["end"])
+    return (" WHERE " + " AND ".join(conds)) if conds else "", params
+
+def _describe_filters(slots: Dict[str, Any]) -> str:
+    parts = []
+    if slots.get("platform"):
+        parts.append(slots["platform"])
+    if slots.get("countries"):
+        parts.append("/".join(slots["countries"]))
+    if slots.get("date_range"):
+        parts.append(slots["date_range"]["label"])
+    return ", ".join(parts)
+
+def render(slots: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Build a plan from filled slots, or None if no template fits."""
+    where, params = _where(slots)
+    filters = _describe_filters(slots)
+    scope = f" ({filters})" if filters else ""
+    assumptions = "All available data." if not slots.get("date_range") else f"Date range: {slots['date_range']['label']}."
+
+    if slots.get("count_apps"):
+        return {"sql": f"SELECT COUNT(DISTINCT app_name) AS app_count FROM app_metrics{where}",
+                "params": params, "answer_type": "simple", "template": "app_count", "slots": slots,
+                "explanation": f"Counts distinct apps{scope}.", "assumptions": assumptions}
+
+    metrics = slots.get("metrics")
+    if not metrics:
+        return None
+    exprs = {alias: expr for _, alias, expr in METRICS}
+    select_metrics = ", ".join(f"{exprs[a]} AS {a}" for a in metrics)
+    group = slots.get("group") or []
+    if not group:
+        return {"sql": f"SELECT {select_metrics} FROM app_metrics{where}",
+                "params": params, "answer_type": "simple", "template": "metric_total", "slots": slots,
+                "explanation": f"Total {', '.join(metrics)}{scope}.", "assumptions": assumptions}
+
+    dim_sql = {dim: expr for _, dim, expr in GROUPS}
+    select_dims = ", ".join(dim if dim_sql[dim] == dim else f"{dim_sql[dim]} AS {dim}" for dim in group)
+    group_by = ", ".join(dim_sql[d] for d in group)
+    time_grain = group[0] in ("date", "month")
+    if time_grain:
+        order = ", ".join(group)
+        limit = slots.get("top_n") or MAX_LIMIT
+        name = "metric_trend"
+    else:
+        order = f"{metrics[0]} {'ASC' if slots.get('ascending') else 'DESC'}"
+        limit = slots.get("top_n") or 100
+        name = "metric_by_dim"
+    return {"sql": f"SELECT {select_dims}, {select_metrics} FROM app_metrics{where} "
+                   f"GROUP BY {group_by} ORDER BY {order} LIMIT {int(limit)}",
+            "params": params, "answer_type": "table", "template": name, "slots": slots,
+            "explanation": f"{', '.join(metrics)} by {', '.join(group)}{scope}.",
+            "assumptions": assumptions}
+
+def plan_from_template(text: str) -> Optional[Dict[str, Any]]:
+    slots, leftover = extract_slots(text)
+    if leftover:
+        return None
+    return render(slots)
+
+def followup_from_template(text: str, last_plan: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Re-render a templated previous plan with the slots this follow-up changes."""
+    if not last_plan.get("template") or not last_plan.get("slots"):
+        return None
+    slots, leftover = extract_slots(text)
+    leftover = [w for w in leftover if w not in FOLLOWUP_FILLER]
+    changed = {k: v for k, v in slots.items() if k in ("platform", "countries", "date_range", "metrics", "top_n", "ascending")}
+    if leftover or not changed:
+        return None
+    plan = render({**last_plan["slots"], **changed})
+    if plan:
+        plan["assumptions"] = f"Follow-up on the previous question. {plan['assumptions']}"
+    return plan
@@ -0,0 +1,153 @@
+import time, bisect, threading, logging
+from contextlib import ContextDecorator
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# In-process metrics in Prometheus text format; scraped from GET /metrics, no collector needed.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self.values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, k)} {v:g}" for k, v in items]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., +Inf count], sum
+        self.series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self.series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[i] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        with self._lock:
+            items = sorted((k, (list(c), t[0])) for k, (c, t) in self.series.items())
+        for key, (counts, total) in items:
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {running}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+        # callables returning (name, help, type, [(labels dict, value)]) read at scrape time
+        self.collectors: List[Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self.metrics:
+            lines += m.render()
+        for collect in self.collectors:
+            try:
+                for name, help, kind, samples in collect():
+                    lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                    for labels, value in samples:
+                        lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value:g}")
+            except Exception:
+                logger.exception("[obs] metrics collector failed")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "bi_stage_seconds", "Latency of each stage of answering a message", ["stage"]))
+PLAN_SECONDS = REGISTRY.register(Histogram(
+    "bi_plan_seconds", "Planner latency by the path that produced the plan", ["path"]))
+ROWS_RETURNED = REGISTRY.register(Counter(
+    "bi_rows_returned_total", "Rows returned by run_sql to answers"))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "bi_llm_tokens_total", "LLM tokens used by the planner", ["kind"]))
+THREAD_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "bi_thread_cache_lookups_total", "Thread cache lookups for follow-ups, exports and Show SQL", ["result"]))
+ANSWERS = REGISTRY.register(Counter(
+    "bi_answers_total", "Answered messages by outcome", ["outcome"]))
+
+class span(ContextDecorator):
+    """Time a block or function into bi_stage_seconds{stage=...}.
+
+        with span("run_sql"): ...
+        @span("answer")
+        def _answer_query(...): ...
+    """
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def _recreate_cm(self):
+        # a fresh timer per call, so a decorated function is safe across threads
+        return span(self.stage)
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self._t0
+        STAGE_SECONDS.observe(dt, stage=self.stage)
+        logger.debug("[obs] %s %.1fms", self.stage, dt * 1000)
+        return False
+
+def stats_collector(name: str, help: str, stats: Callable[[], Dict], keys: Sequence[str], label: str = "event"):
+    """Expose counters a component already keeps in stats() (e.g. cache hits) as one labelled metric."""
+    def collect():
+        s = stats() or {}
+        yield name, help, "counter", [({label: k}, float(s.get(k, 0))) for k in keys]
+    REGISTRY.collectors.append(collect)
+
+def render_metrics() -> str:
+    return REGISTRY.render()
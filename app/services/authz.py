@@ -7,7 +7,9 @@ ADMINS = set(filter(None, (os.getenv("ADMIN_USER_IDS","").split(","))))
 def is_admin(user_id: str) -> bool:
     return user_id in ADMINS
 
-# Column-level access control (example: hide ua_cost from non-admins)
+# Column-level access control (example: hide ua_cost from non-admins).
+# Dropping a column of an Arrow-backed result (app/sql/results.py) shares the
+# remaining columns' buffers, so this projection doesn't copy the data.
 def filter_columns(df, user_id: str):
     if is_admin(user_id):
         return df
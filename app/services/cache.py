@@ -1,23 +1,273 @@
-import time
-from typing import Any, Dict, Optional
+import re, time, logging, threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
+from typing import Any, Callable, Dict, Optional, Tuple
+from ..sql.cost_guard import QueryAborted
+from ..sql.lexer import tokenize
+from ..sql.results import is_arrow
 
-class ThreadCache:
-    def __init__(self, ttl_seconds: int = 3600):
-        self.ttl = ttl_seconds
-        self.store: Dict[str, Any] = {}
+logger = logging.getLogger(__name__)
+
+SQL_KEYWORDS = {
+    "select", "distinct", "from", "where", "and", "or", "not", "in", "is", "null", "like",
+    "between", "group", "by", "order", "asc", "desc", "limit", "offset", "having", "as",
+    "case", "when", "then", "else", "end", "union", "all", "with", "join", "left", "inner", "on",
+}
+
+# SQL whose answer moves with the clock: date('now', ...) in SQLite, CURRENT_DATE & co. elsewhere
+_CLOCK_SQL = re.compile(r"'now'|\b(?:current_date|current_timestamp|current_time|localtimestamp|now\s*\()",
+                        re.IGNORECASE)
+
+# Low-cardinality dimensions stored as categoricals in cached results
+CATEGORY_COLUMNS = ("app_name", "platform", "country")
+
+def compact_df(df):
+    """Shrink a result DataFrame for caching: categorical dims, downcast ints.
+
+    Floats are left alone so revenue/cost values keep full precision. Arrow-backed
+    results are kept as-is: re-encoding would copy the buffers the result cache
+    already holds.
+    """
+    import pandas as pd
+    if not isinstance(df, pd.DataFrame) or df.empty or is_arrow(df):
+        return df
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype == object and (col in CATEGORY_COLUMNS or s.nunique(dropna=True) * 2 < len(s)):
+            s = s.astype("category")
+        elif pd.api.types.is_integer_dtype(s) and not pd.api.types.is_bool_dtype(s):
+            s = pd.to_numeric(s, downcast="integer")
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+def _nbytes(value: Dict[str, Any]) -> int:
+    df = value.get("df") if isinstance(value, dict) else None
+    return ResultCache.sizeof(df) if df is not None else 0
+
+class ThreadCacheBackend(ABC):
+    """Interface for the per-thread result store used by the Slack handlers.
+
+    Values are dicts {"plan": dict, "df": DataFrame, "sql": str}. Backends:
+    ThreadCache (in-process, default) and RedisThreadCache
+    (app/services/redis_cache.py) for running several replicas.
+    """
 
     def key(self, channel: str, thread_ts: str) -> str:
         return f"{channel}:{thread_ts}"
 
-    def set(self, channel: str, thread_ts: str, value: Dict[str, Any]):
-        self.store[self.key(channel, thread_ts)] = {"value": value, "ts": time.time()}
+    @abstractmethod
+    def set(self, channel: str, thread_ts: str, value: Dict[str, Any], aliases: Tuple[str, ...] = ()):
+        ...
+
+    @abstractmethod
+    def get(self, channel: str, thread_ts: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    def start_sweeper(self):
+        """Start background housekeeping, if the backend needs any."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+class ThreadCache(ThreadCacheBackend):
+    """Per-thread last result, with a TTL and a global byte budget.
+
+    A result cached under several keys (the thread and the channel-level
+    "__last__") is stored once and counted once. Expired entries are dropped
+    on read and by the background sweeper, which also evicts the oldest
+    entries while the total exceeds max_bytes.
+    """
+
+    def __init__(self, ttl_seconds: int = 3600, max_bytes: Optional[int] = None, sweep_interval: int = 60):
+        self.ttl = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.store: Dict[str, Dict[str, Any]] = {}
+        self.bytes = 0
+        self._lock = threading.RLock()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def _unlink(self, k: str):
+        # caller holds the lock
+        item = self.store.pop(k, None)
+        if item is None:
+            return
+        item["keys"].discard(k)
+        if not item["keys"]:
+            self.bytes -= item["bytes"]
+
+    def set(self, channel: str, thread_ts: str, value: Dict[str, Any], aliases: Tuple[str, ...] = ()):
+        """Cache value for the thread; `aliases` are extra thread keys in the same channel sharing it."""
+        if isinstance(value, dict) and "df" in value:
+            value = {**value, "df": compact_df(value["df"])}
+        keys = {self.key(channel, t) for t in (thread_ts, *aliases)}
+        item = {"value": value, "ts": time.time(), "bytes": _nbytes(value), "keys": set(keys)}
+        with self._lock:
+            for k in keys:
+                self._unlink(k)
+                self.store[k] = item
+            self.bytes += item["bytes"]
 
     def get(self, channel: str, thread_ts: str) -> Optional[Dict[str, Any]]:
         k = self.key(channel, thread_ts)
-        item = self.store.get(k)
-        if not item:
-            return None
-        if time.time() - item["ts"] > self.ttl:
-            del self.store[k]
-            return None
-        return item["value"]
+        with self._lock:
+            item = self.store.get(k)
+            if not item:
+                return None
+            if time.time() - item["ts"] > self.ttl:
+                self._unlink(k)
+                return None
+            return item["value"]
+
+    def sweep(self) -> int:
+        """Drop expired entries, then the oldest ones until under max_bytes. Returns entries removed."""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            items = {id(it): it for it in self.store.values()}.values()
+            for it in sorted(items, key=lambda it: it["ts"]):
+                if now - it["ts"] <= self.ttl and (self.max_bytes is None or self.bytes <= self.max_bytes):
+                    break
+                for k in list(it["keys"]):
+                    self._unlink(k)
+                removed += 1
+        return removed
+
+    def start_sweeper(self):
+        if self._sweeper is not None:
+            return
+
+        def loop():
+            while True:
+                time.sleep(self.sweep_interval)
+                try:
+                    self.sweep()
+                except Exception:
+                    logger.exception("[cache] sweep failed")
+
+        self._sweeper = threading.Thread(target=loop, name="thread-cache-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"keys": len(self.store), "entries": len({id(it) for it in self.store.values()}),
+                    "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+class ResultCache:
+    """Process-wide query result cache shared across threads and channels.
+
+    Keyed on (data version, canonical SQL, params), plus today's date for SQL
+    that reads the clock, so relative date ranges roll over at midnight. Evicts least-recently-used entries
+    once the summed DataFrame memory exceeds max_bytes, and coalesces
+    concurrent misses for the same key into a single execution. A new data
+    version needs no flush: its keys differ, and older entries age out. Cached
+    DataFrames are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.store: "OrderedDict[Tuple[str, str], Tuple[Any, int]]" = OrderedDict()
+        self.bytes = 0
+        self.version: Optional[str] = None
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def canonical(sql: str) -> str:
+        # collapse whitespace and keyword case; identifiers, aliases and
+        # literals keep their spelling since they shape the result
+        try:
+            tokens = tokenize(sql.strip().rstrip(";"))
+        except ValueError:
+            return " ".join(sql.split())
+        return " ".join(t.text.upper() if t.kind == "ident" and t.low in SQL_KEYWORDS else t.text
+                        for t in tokens)
+
+    @staticmethod
+    def sizeof(df) -> int:
+        try:
+            return int(df.memory_usage(index=True, deep=True).sum())
+        except Exception:
+            return 0
+
+    def _put(self, key, df):
+        size = self.sizeof(df)
+        if size > self.max_bytes:
+            return
+        old = self.store.pop(key, None)
+        if old:
+            self.bytes -= old[1]
+        self.store[key] = (df, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and self.store:
+            _, (_, evicted) = self.store.popitem(last=False)
+            self.bytes -= evicted
+
+    def get_or_compute(self, sql: str, version: str, compute: Callable[[], Any], params=None):
+        canon = self.canonical(sql)
+        day = date.today().isoformat() if _CLOCK_SQL.search(canon) else ""
+        key = (version, canon, tuple(params or ()), day)
+        with self._lock:
+            # entries of older versions are never hit again and age out through the LRU,
+            # so a version flapping between replicas doesn't empty the cache
+            self.version = version
+            item = self.store.get(key)
+            if item is not None:
+                self.store.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                self.misses += 1
+                fut = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            try:
+                return fut.result()
+            except QueryAborted as e:
+                if e.kind != "cancelled":
+                    raise
+            # the leader was an abandoned early run; its cancellation isn't ours
+            return self.get_or_compute(sql, version, compute, params=params)
+        try:
+            df = compute()
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(df)
+            with self._lock:
+                self._put(key, df)
+            return df
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.store.clear()
+            self.bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self.store), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses,
+                    "coalesced": self.coalesced, "version": self.version}
+
+def make_thread_cache(ttl_seconds: int = 3600) -> ThreadCacheBackend:
+    """Build the thread cache selected by CACHE_BACKEND ("memory" or "redis")."""
+    import os
+    backend = os.getenv("CACHE_BACKEND", "memory").lower()
+    if backend == "redis":
+        from .redis_cache import RedisThreadCache
+        return RedisThreadCache.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl_seconds=ttl_seconds)
+    return ThreadCache(ttl_seconds=ttl_seconds,
+                       max_bytes=int(os.getenv("THREAD_CACHE_MAX_MB", "512")) * 1024 * 1024)
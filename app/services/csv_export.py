@@ -1,7 +1,17 @@
-import os
+import os, gzip, time, logging, threading
 from pathlib import Path
 import pandas as pd
 from slack_bolt import App
+from ..sql.lexer import tokenize
+from ..sql.runner import stream_sql
+from ..sql.results import to_arrow, write_csv
+from .authz import filter_columns
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "50000"))
+EXPORT_MAX_AGE_SECONDS = int(os.getenv("EXPORT_MAX_AGE_SECONDS", "3600"))
+EXPORT_CLEANUP_INTERVAL = int(os.getenv("EXPORT_CLEANUP_INTERVAL", "600"))
 
 def ensure_exports_dir() -> Path:
     p = Path("data/exports")
@@ -11,7 +21,65 @@ def ensure_exports_dir() -> Path:
 def df_to_csv(df: pd.DataFrame, basename: str) -> str:
     exports = ensure_exports_dir()
     path = exports / f"{basename}.csv"
-    df.to_csv(path, index=False)
+    with open(path, "wb") as f:
+        write_csv(df, f)
+    return str(path)
+
+def strip_outer_limit(sql: str) -> str:
+    """Drop a trailing top-level LIMIT/OFFSET (the display cap); subquery limits are kept."""
+    sql = sql.strip().rstrip(";").strip()
+    tokens = tokenize(sql)
+    depth = 0
+    for i, t in enumerate(tokens):
+        if t.text == "(":
+            depth += 1
+        elif t.text == ")":
+            depth -= 1
+        elif depth == 0 and t.is_("limit"):
+            rest = tokens[i + 1:]
+            if all(r.kind == "num" or r.is_("offset") or r.text == "," for r in rest):
+                return sql[:t.start].rstrip()
+    return sql
+
+def stream_export(sql: str, basename: str, user_id: str, fmt: str = "csv.gz", params=None) -> str:
+    """Re-run `sql` without its display LIMIT and stream it to a file chunk by chunk.
+
+    fmt is "csv.gz" or "parquet" (needs pyarrow; falls back to csv.gz).
+    Memory stays bounded by EXPORT_CHUNK_ROWS regardless of result size.
+    """
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            logger.warning("[export] pyarrow not installed; exporting csv.gz instead")
+            fmt = "csv.gz"
+    path = ensure_exports_dir() / f"{basename}.{fmt}"
+    chunks = (filter_columns(c, user_id) for c in stream_sql(strip_outer_limit(sql), EXPORT_CHUNK_ROWS, params))
+    rows = 0
+    try:
+        if fmt == "parquet":
+            writer = None
+            try:
+                for chunk in chunks:
+                    table = to_arrow(chunk)
+                    if writer is None:
+                        writer = pq.ParquetWriter(str(path), table.schema, compression="zstd")
+                    else:
+                        table = table.cast(writer.schema)
+                    writer.write_table(table)
+                    rows += len(chunk)
+            finally:
+                if writer is not None:
+                    writer.close()
+        else:
+            with gzip.open(path, "wb", compresslevel=6) as f:
+                for i, chunk in enumerate(chunks):
+                    write_csv(chunk, f, header=(i == 0))
+                    rows += len(chunk)
+    except Exception:
+        path.unlink(missing_ok=True)
+        raise
+    logger.info("[export] streamed %d rows to %s", rows, path)
     return str(path)
 
 def upload_csv(app: App, channel: str, file_path: str, title: str = "export.csv", thread_ts: str = None):
@@ -23,3 +91,38 @@ def upload_csv(app: App, channel: str, file_path: str, title: str = "export.csv"
             title=title,
             thread_ts=thread_ts
         )
+
+def cleanup_exports(max_age_seconds: int = EXPORT_MAX_AGE_SECONDS) -> int:
+    """Delete export files older than max_age_seconds; returns how many were removed."""
+    cutoff = time.time() - max_age_seconds
+    removed = 0
+    for p in ensure_exports_dir().iterdir():
+        try:
+            if p.is_file() and p.stat().st_mtime < cutoff:
+                p.unlink()
+                removed += 1
+        except OSError:
+            pass
+    if removed:
+        logger.info("[export] removed %d old export files", removed)
+    return removed
+
+_janitor = None
+
+def start_export_janitor(interval_seconds: int = EXPORT_CLEANUP_INTERVAL):
+    """Background thread that runs cleanup_exports() every interval (idempotent)."""
+    global _janitor
+    if _janitor is not None:
+        return _janitor
+
+    def loop():
+        while True:
+            try:
+                cleanup_exports()
+            except Exception:
+                logger.exception("[export] cleanup failed")
+            time.sleep(interval_seconds)
+
+    _janitor = threading.Thread(target=loop, name="export-janitor", daemon=True)
+    _janitor.start()
+    return _janitor
@@ -0,0 +1,121 @@
+import os, time, uuid, logging, threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EVENT_DEDUP_TTL = int(os.getenv("EVENT_DEDUP_TTL", "600"))
+EVENT_DEDUP_MAX_KEYS = int(os.getenv("EVENT_DEDUP_MAX_KEYS", "50000"))
+
+def delivery_keys(event: Dict[str, Any], body: Optional[Dict[str, Any]] = None) -> List[str]:
+    """Identities of one Slack delivery, the message itself first.
+
+    The `message` and `app_mention` events for one mention share channel+ts
+    and client_msg_id but carry different event_ids; a redelivery after a
+    slow ack repeats the event_id.
+    """
+    keys = []
+    if event.get("channel") and event.get("ts"):
+        keys.append(f"msg:{event['channel']}:{event['ts']}")
+    if event.get("client_msg_id"):
+        keys.append(f"cmid:{event['client_msg_id']}")
+    if body and body.get("event_id"):
+        keys.append(f"evt:{body['event_id']}")
+    return keys
+
+class RedisClaims:
+    """First-delivery claims shared by replicas (SET NX with a TTL on the message key).
+
+    Only decides who answers: a duplicate on another replica is dropped
+    rather than attached. Fails open, so a Redis outage can't silence the bot.
+    """
+
+    def __init__(self, client, ttl_seconds: int = EVENT_DEDUP_TTL, prefix: str = "bi:event:"):
+        self.client = client
+        self.ttl = ttl_seconds
+        self.prefix = prefix
+        self.owner = uuid.uuid4().hex
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisClaims":
+        import redis
+        return cls(redis.Redis.from_url(url, socket_keepalive=True, health_check_interval=30), **kwargs)
+
+    def claim(self, key: str) -> bool:
+        try:
+            return bool(self.client.set(self.prefix + key, self.owner, nx=True, ex=self.ttl))
+        except Exception:
+            logger.exception("[dedup] redis claim failed; answering anyway")
+            return True
+
+class EventDeduper:
+    """Idempotency for Slack deliveries, with in-flight coalescing.
+
+    The first delivery of a message claims all of its keys and gets a `done`
+    callback to call when its answer is complete. Any delivery sharing a key
+    within `ttl_seconds` is a duplicate and returns at once, so it never holds
+    a listener thread; one that lands while the original is still running is
+    counted as attached to it. At most `max_keys` keys are kept, oldest
+    evicted first.
+    """
+
+    def __init__(self, ttl_seconds: int = EVENT_DEDUP_TTL, max_keys: int = EVENT_DEDUP_MAX_KEYS,
+                 shared: Optional[RedisClaims] = None):
+        self.ttl = ttl_seconds
+        self.max_keys = max_keys
+        self.shared = shared
+        self.store: "OrderedDict[str, Tuple[float, Future]]" = OrderedDict()
+        self.counters = Counter()
+        self._lock = threading.Lock()
+
+    def _find(self, keys: List[str], now: float) -> Optional[Future]:
+        # caller holds the lock
+        for k in keys:
+            item = self.store.get(k)
+            if item is None:
+                continue
+            if item[0] <= now:
+                del self.store[k]
+                continue
+            return item[1]
+        return None
+
+    def claim(self, keys: List[str]) -> Optional[Callable[[], None]]:
+        """`done` callback if this delivery should be answered, None for a duplicate."""
+        if not keys:
+            return lambda: None
+        now = time.monotonic()
+        with self._lock:
+            original = self._find(keys, now)
+            if original is None:
+                fut: Future = Future()
+                for k in keys:
+                    self.store[k] = (now + self.ttl, fut)
+                    self.store.move_to_end(k)
+                while len(self.store) > self.max_keys:
+                    self.store.popitem(last=False)
+        if original is None:
+            if self.shared is not None and not self.shared.claim(keys[0]):
+                fut.set_result(None)
+                self.counters["duplicate_remote"] += 1
+                logger.info("[dedup] %s is being answered by another replica", keys[0])
+                return None
+            self.counters["first"] += 1
+            return lambda: fut.done() or fut.set_result(None)
+        self.counters["duplicate"] += 1
+        if not original.done():
+            self.counters["attached"] += 1
+            logger.info("[dedup] duplicate delivery of %s attached to the running answer", keys[0])
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"keys": len(self.store), **self.counters}
+
+def make_deduper() -> EventDeduper:
+    """In-process deduper; with CACHE_BACKEND=redis, first-delivery claims are also shared across replicas."""
+    shared = None
+    if os.getenv("CACHE_BACKEND", "memory").lower() == "redis":
+        shared = RedisClaims.from_url(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    return EventDeduper(shared=shared)
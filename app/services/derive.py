@@ -0,0 +1,207 @@
+"""
+Answering a follow-up from the previous answer's DataFrame, without the database.
+
+The thread cache keeps the last result of every thread. When a follow-up's
+SQL differs from that result's SQL only in ways the DataFrame can absorb, the
+new result is computed in memory:
+
+- extra filters on columns the result shows at full grain (e.g. `platform = 'iOS'`
+  on a per-platform result, a narrower date range on a daily one)
+- coarser grouping over SUM/MIN/MAX/COUNT columns (per app+country -> per app,
+  or a grand total)
+- a different ORDER BY over result columns, or a smaller LIMIT
+
+Both statements are parsed with app/sql/query.py and compared clause by
+clause; anything else (a metric that isn't in the result, a wider filter, a
+result that was cut off by its LIMIT) returns None and the query runs as usual.
+"""
+import os, math, logging
+from typing import Any, Dict, List, Optional, Tuple
+import pandas as pd
+from ..sql.query import Pred, Select, parse, canonical, is_aggregate
+
+logger = logging.getLogger(__name__)
+
+DERIVE_RESULTS = os.getenv("DERIVE_RESULTS", "true").lower() == "true"
+REAGGREGATE = {"sum": "sum", "total": "sum", "min": "min", "max": "max", "count": "sum"}
+
+def _key(q: Select, conj) -> Tuple:
+    return canonical(conj, q.params)
+
+def _holds(p: Pred, lo, hi, eq) -> bool:
+    """Whether every value allowed by the new bounds on p's column also satisfies p."""
+    if p.values is None:
+        return False
+    try:
+        return _implied(p, lo, hi, eq)
+    except TypeError:
+        return False
+
+def _implied(p: Pred, lo, hi, eq) -> bool:
+    if eq is not None:
+        test = pd.Series(list(eq), dtype=object)
+        return bool(_mask(p, test).all())
+    if p.op in (">=", ">") and lo is not None:
+        return lo[0] > p.values[0] or (lo[0] == p.values[0] and (p.op == ">=" or not lo[1]))
+    if p.op in ("<=", "<") and hi is not None:
+        return hi[0] < p.values[0] or (hi[0] == p.values[0] and (p.op == "<=" or not hi[1]))
+    if p.op == "between" and lo is not None and hi is not None:
+        return lo[0] >= p.values[0] and hi[0] <= p.values[1]
+    return False
+
+def _bounds(preds: List[Pred]):
+    """(lo, hi, eq) implied by simple predicates on one column; lo/hi are (value, inclusive)."""
+    lo = hi = eq = None
+    for p in preds:
+        if p.values is None:
+            continue
+        if p.op in ("=", "in"):
+            eq = set(p.values) if eq is None else eq & set(p.values)
+        elif p.op in (">=", ">"):
+            lo = max(lo, (p.values[0], p.op == ">="), key=lambda b: (b[0], not b[1])) if lo else (p.values[0], p.op == ">=")
+        elif p.op in ("<=", "<"):
+            hi = min(hi, (p.values[0], p.op == "<="), key=lambda b: (b[0], b[1])) if hi else (p.values[0], p.op == "<=")
+        elif p.op == "between":
+            lo = max(lo, (p.values[0], True), key=lambda b: (b[0], not b[1])) if lo else (p.values[0], True)
+            hi = min(hi, (p.values[1], True), key=lambda b: (b[0], b[1])) if hi else (p.values[1], True)
+    return lo, hi, eq
+
+def _mask(p: Pred, s: pd.Series) -> pd.Series:
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype(object)
+    v = p.values
+    if p.op == "=":
+        return s == v[0]
+    if p.op == "!=":
+        return s != v[0]
+    if p.op == "in":
+        return s.isin(list(v))
+    if p.op == "between":
+        return (s >= v[0]) & (s <= v[1])
+    return {"<": s < v[0], "<=": s <= v[0], ">": s > v[0], ">=": s >= v[0]}[p.op]
+
+def _grain(q: Select) -> Optional[List[Tuple]]:
+    """Canonical GROUP BY of an aggregate query, [] for a grand total, None for a plain row query."""
+    if q.group_by:
+        return [canonical(g, q.params) for g in q.group_exprs()]
+    return [] if any(is_aggregate(it.expr) for it in q.items) else None
+
+def derive(last: Dict[str, Any], plan: Dict[str, Any]) -> Optional[pd.DataFrame]:
+    """The result of plan computed from last["df"] (the result of last["sql"]), or None."""
+    df = last.get("df")
+    if not isinstance(df, pd.DataFrame) or not last.get("sql") or not plan.get("sql"):
+        return None
+    try:
+        old, new = parse(last["sql"], last.get("params")), parse(plan["sql"], plan.get("params"))
+    except ValueError:
+        return None
+    if (isinstance(old.source, Select) or isinstance(new.source, Select)
+            or str(old.source).lower() != str(new.source).lower()
+            or old.offset is not None or new.offset is not None or old.distinct != new.distinct):
+        return None
+    # was the previous result cut off? (run_sql refuses results over QUERY_MAX_ROWS rather than truncating)
+    cap = old.limit if old.limit is not None else math.inf
+    complete = len(df) < cap
+
+    old_grain, new_grain = _grain(old), _grain(new)
+    old_names = {canonical(it.expr, old.params): it.name for it in old.items if it.name}
+    same_grain = old_grain == new_grain
+    if not same_grain:
+        # coarser grouping only, from an aggregate result with no HAVING
+        if old_grain is None or new_grain is None or old.having or new.having or old.distinct \
+                or not set(new_grain) < set(old_grain):
+            return None
+    elif [canonical(old.having, old.params)] != [canonical(new.having, new.params)]:
+        return None
+
+    # WHERE: the new conditions must be the old ones plus filters the result can apply itself
+    old_where = {_key(old, c): c for c in old.where}
+    new_where = {_key(new, c): c for c in new.where}
+    added = [new.predicate(new_where[k]) for k in new_where if k not in old_where]
+    removed = [old.predicate(old_where[k]) for k in old_where if k not in new_where]
+    if None in added or None in removed:
+        return None
+    for p in removed:
+        on_col = [new.predicate(c) for c in new.where]
+        if not _holds(p, *_bounds([q for q in on_col if q is not None and q.column == p.column])):
+            return None
+    group_cols = {g for g in (old_grain or [])}
+    filters = []
+    for p in added:
+        it = old.column(p.column)
+        if p.values is None or it is None or it.name not in df.columns:
+            return None
+        if old_grain is not None and canonical(it.expr, old.params) not in group_cols:
+            return None  # a filter on a column the rows were aggregated over
+        filters.append((p, it.name))
+    if (added or not same_grain) and not complete:
+        return None
+
+    # SELECT: every new column is an old column, or (when regrouping) re-aggregates one
+    columns, aggs = [], {}
+    for it in new.items:
+        src = old_names.get(canonical(it.expr, new.params))
+        if src is None or src not in df.columns or not it.name:
+            return None
+        columns.append((src, it.name))
+        if not same_grain and is_aggregate(it.expr):
+            fn = it.expr[0].low if it.expr[0].kind == "ident" and len(it.expr) > 1 and it.expr[1].text == "(" else None
+            if fn not in REAGGREGATE or any(t.is_("distinct") for t in it.expr):
+                return None
+            aggs[src] = REAGGREGATE[fn]
+    dims = []
+    if not same_grain:
+        for g in new_grain:
+            src = old_names.get(g)
+            if src is None or all(src != c[0] for c in columns):
+                return None
+            dims.append(src)
+        if len(dims) + len(aggs) != len(columns):
+            return None
+
+    # ORDER BY: result columns only
+    by_name = {c[1].lower(): c[1] for c in columns}
+    by_expr = {canonical(it.expr, new.params): it.name for it in new.items}
+    order = []
+    for e, desc in new.order_by:
+        k = canonical(e, new.params)
+        name = by_name.get(k[0][1]) if len(k) == 1 and k[0][0] == "i" else None
+        name = name or by_expr.get(k)
+        if name is None:
+            return None
+        order.append((name, desc))
+    same_order = same_grain and [(canonical(e, old.params), d) for e, d in old.order_by] == \
+        [(canonical(e, new.params), d) for e, d in new.order_by]
+    if not complete and not (same_order and not added and new.limit is not None and new.limit <= len(df)):
+        return None
+
+    try:
+        out = _compute(df, filters, columns, same_grain, dims, aggs, order, same_order, new.limit)
+    except (TypeError, ValueError):
+        return None  # e.g. a text filter value against a numeric column
+    if out is not None:
+        logger.info("[derive] answered from the cached result (%d -> %d rows)", len(df), len(out))
+    return out
+
+def _compute(df, filters, columns, same_grain, dims, aggs, order, same_order, limit) -> Optional[pd.DataFrame]:
+    out = df
+    for p, col in filters:
+        out = out[_mask(p, out[col]).to_numpy(dtype=bool, na_value=False)]
+    out = out[[c[0] for c in columns]]
+    if not same_grain:
+        if out.empty:
+            return None  # SQL gives NULL totals / no groups; let the database say which
+        if dims:
+            out = out.groupby(dims, sort=True, observed=True, dropna=False).agg(aggs).reset_index()
+        else:
+            out = pd.DataFrame({c: [getattr(out[c], fn)()] for c, fn in aggs.items()})
+        out = out[[c[0] for c in columns]]
+    out = out.rename(columns={src: name for src, name in columns if src != name})
+    if order and not same_order:
+        cols = [n for n, _ in order]
+        if out[cols].isna().any().any():
+            return None  # NULL placement differs between engines
+        out = out.sort_values(cols, ascending=[not d for _, d in order], kind="stable")
+    if limit is not None:
+        out = out.head(limit)
+    return out.reset_index(drop=True)
@@ -1,31 +1,93 @@
+from typing import Callable, Dict, List
+import numpy as np
 import pandas as pd
 
-def _fmt_cell(val, col):
-    # ints -> 1,234 ; floats -> 12.34 ; pct columns -> 12.3%
-    try:
-        if isinstance(val, bool):
-            return "true" if val else "false"
-        if isinstance(val, int):
-            return f"{val:,}"
-        if isinstance(val, float):
-            if "pct" in col.lower() or "percent" in col.lower():
-                return f"{val*100:.1f}%"
-            return f"{val:.2f}"
-    except Exception:
-        pass
-    return str(val)
+# Slack caps a section block's text at 3000 characters
+SLACK_SECTION_LIMIT = 3000
+MISSING = "—"
+
+def _is_pct(col: str) -> bool:
+    col = col.lower()
+    return "pct" in col or "percent" in col
+
+def _float_fmt(pattern: str, scale: float = 1.0) -> Callable[[pd.Series], np.ndarray]:
+    def fmt(s: pd.Series) -> np.ndarray:
+        vals = s.to_numpy(dtype="float64", na_value=np.nan) * scale
+        out = np.char.mod(pattern, np.nan_to_num(vals))
+        return np.where(np.isnan(vals), MISSING, out)
+    return fmt
+
+def _int_fmt(s: pd.Series) -> np.ndarray:
+    # the one per-cell step left: numpy has no thousands-separator format, and building
+    # the groups with np.char measured ~5x slower than str.format over 10k ints
+    mask = s.isna().to_numpy()
+    vals = s.fillna(0).astype("int64")
+    return np.where(mask, MISSING, vals.map("{:,}".format).to_numpy())
+
+def _bool_fmt(s: pd.Series) -> np.ndarray:
+    mask = s.isna().to_numpy()
+    return np.where(mask, MISSING, np.where(s.fillna(False).astype(bool).to_numpy(), "true", "false"))
+
+def _str_fmt(s: pd.Series) -> np.ndarray:
+    return s.astype("string").fillna(MISSING).to_numpy(dtype=object)
+
+def column_formatter(col: str, s: pd.Series) -> Callable[[pd.Series], np.ndarray]:
+    """Pick the formatter for a whole column once, from its dtype and name.
+
+    ints -> 1,234 ; floats -> 12.34 ; pct/percent columns -> 12.3% ; bools -> true/false
+    """
+    if pd.api.types.is_bool_dtype(s):
+        return _bool_fmt
+    if pd.api.types.is_integer_dtype(s):
+        return _int_fmt
+    if pd.api.types.is_float_dtype(s):
+        return _float_fmt("%.1f%%", 100.0) if _is_pct(col) else _float_fmt("%.2f")
+    return _str_fmt
+
+def format_columns(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    return {col: column_formatter(str(col), df[col])(df[col]) for col in df.columns}
+
+def _table_lines(df: pd.DataFrame) -> List[str]:
+    # header, separator, then one fixed-width line per row; numbers right-aligned
+    headers = [str(c) for c in df.columns]
+    if df.empty:
+        # np.char pads via a max() over the widths, which has no identity on zero rows
+        return ["| " + " | ".join(headers) + " |", "|" + "|".join("-" * (len(h) + 2) for h in headers) + "|"]
+    cols = format_columns(df)
+    cells, widths = [], []
+    for h, col in zip(headers, df.columns):
+        vals = cols[col].astype(str)
+        width = max([len(h)] + [len(v) for v in vals])
+        numeric = pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+        cells.append(np.char.rjust(vals, width) if numeric else np.char.ljust(vals, width))
+        widths.append(width)
+    lines = ["| " + " | ".join(h.ljust(w) for h, w in zip(headers, widths)) + " |",
+             "|" + "|".join("-" * (w + 2) for w in widths) + "|"]
+    for i in range(len(df)):
+        lines.append("| " + " | ".join(c[i] for c in cells) + " |")
+    return lines
+
+def df_to_table_blocks(df: pd.DataFrame, max_rows: int = 10, max_chars: int = SLACK_SECTION_LIMIT) -> List[dict]:
+    """Render the first max_rows as fixed-width tables split across section blocks under max_chars each."""
+    lines = _table_lines(df.head(max_rows))
+    head, rows = lines[:2], lines[2:]
+    budget = max_chars - len("```\n\n```")
+    texts, cur = [], list(head)
+    for line in rows:
+        if len("\n".join(cur + [line])) > budget and len(cur) > len(head):
+            texts.append(cur)
+            cur = list(head)
+        cur.append(line)
+    texts.append(cur)
+    blocks = [{"type": "section", "text": {"type": "mrkdwn", "text": "```\n" + "\n".join(t)[:budget] + "\n```"}}
+              for t in texts]
+    if len(df) > max_rows:
+        blocks.append({"type": "context", "elements": [
+            {"type": "mrkdwn", "text": f"_…plus {len(df)-max_rows} more rows_"}]})
+    return blocks
 
 def df_to_markdown_table(df: pd.DataFrame, max_rows: int = 10) -> str:
-    df_disp = df.head(max_rows)
-    headers = list(df_disp.columns)
-    lines = []
-    lines.append("| " + " | ".join(headers) + " |")
-    lines.append("| " + " | ".join(["---"]*len(headers)) + " |")
-    for _, row in df_disp.iterrows():
-        vals = []
-        for col, val in zip(headers, row.tolist()):
-            vals.append(_fmt_cell(val, col))
-        lines.append("| " + " | ".join(vals) + " |")
+    lines = _table_lines(df.head(max_rows))
     if len(df) > max_rows:
         lines.append(f"_…plus {len(df)-max_rows} more rows_")
-    return "\n".join(lines)
\ No newline at end of file
+    return "\n".join(lines)
@@ -0,0 +1,111 @@
+import os, logging, threading
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_ENABLED = os.getenv("PIPELINE_ENABLED", "true").lower() == "true"
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))
+PIPELINE_MAX_QUEUE = int(os.getenv("PIPELINE_MAX_QUEUE", "32"))
+PIPELINE_PER_USER = int(os.getenv("PIPELINE_PER_USER", "2"))
+# full exports get a separate, smaller pool (one per user)
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+EXPORT_MAX_QUEUE = int(os.getenv("EXPORT_MAX_QUEUE", "8"))
+
+BUSY = "busy"
+USER_LIMIT = "user_limit"
+
+class QueryPipeline:
+    """Bounded worker pool for question answering, off the Bolt listener threads.
+
+    At most `workers` jobs run at once and at most `max_queue` more wait;
+    each user may have `per_user` jobs queued or running. `submit` never
+    blocks: when a limit is hit it returns the rejection reason instead.
+    """
+
+    def __init__(self, workers: int = PIPELINE_WORKERS, max_queue: int = PIPELINE_MAX_QUEUE,
+                 per_user: int = PIPELINE_PER_USER, name: str = "bi-query"):
+        self.workers = workers
+        self.capacity = workers + max_queue
+        self.per_user = per_user
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        # speculative work a running job waits on; a pool of its own so it never queues behind that job
+        self._side = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"{name}-early")
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._by_user: Counter = Counter()
+        self.counters = Counter()
+
+    def submit(self, user_id: str, fn: Callable[..., Any], *args, **kwargs) -> Optional[str]:
+        with self._lock:
+            if self._inflight >= self.capacity:
+                self.counters["rejected_busy"] += 1
+                return BUSY
+            if self.per_user and self._by_user[user_id] >= self.per_user:
+                self.counters["rejected_user"] += 1
+                return USER_LIMIT
+            self._inflight += 1
+            self._by_user[user_id] += 1
+            self.counters["submitted"] += 1
+        try:
+            self._executor.submit(self._run, user_id, fn, args, kwargs)
+        except RuntimeError:
+            self._release(user_id)
+            raise
+        return None
+
+    def speculate(self, user_id: str, fn: Callable[..., Any], *args, **kwargs) -> Optional[Future]:
+        """Start `fn` for a job of user_id's that will wait on it, e.g. SQL run before the plan is final.
+
+        It takes a slot under the same global and per-user limits as `submit`;
+        when a limit is hit nothing runs and None is returned, so the caller
+        just does the work itself later.
+        """
+        with self._lock:
+            if self._inflight >= self.capacity or (self.per_user and self._by_user[user_id] >= self.per_user):
+                self.counters["speculation_skipped"] += 1
+                return None
+            self._inflight += 1
+            self._by_user[user_id] += 1
+            self.counters["speculated"] += 1
+        try:
+            future = self._side.submit(self._run_speculative, user_id, fn, args, kwargs)
+        except RuntimeError:
+            self._release(user_id)
+            raise
+        # cancelled before it started: _run_speculative never runs to release the slot
+        future.add_done_callback(lambda f: f.cancelled() and self._release(user_id))
+        return future
+
+    def _run_speculative(self, user_id, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release(user_id)
+
+    def _run(self, user_id, fn, args, kwargs):
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.counters["failed"] += 1
+            logger.exception("[pipeline] job failed")
+        finally:
+            self._release(user_id)
+
+    def _release(self, user_id: str):
+        with self._lock:
+            self._inflight -= 1
+            self._by_user[user_id] -= 1
+            if self._by_user[user_id] <= 0:
+                del self._by_user[user_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"inflight": self._inflight, "capacity": self.capacity, "workers": self.workers,
+                    "users": len(self._by_user), **self.counters}
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        self._side.shutdown(wait=wait)
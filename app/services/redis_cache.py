@@ -0,0 +1,93 @@
+import io, json, uuid, logging
+from typing import Any, Dict, Optional, Tuple
+import pandas as pd
+from .cache import ThreadCacheBackend, compact_df
+
+logger = logging.getLogger(__name__)
+
+# ---------- DataFrame serialization ----------
+
+def serialize_df(df: pd.DataFrame) -> Tuple[str, bytes]:
+    """Arrow IPC stream when pyarrow is installed (keeps dtypes incl. categoricals), else JSON."""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return "json", df.to_json(orient="table", index=False).encode("utf-8")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return "arrow", sink.getvalue().to_pybytes()
+
+def deserialize_df(fmt: str, data: bytes) -> pd.DataFrame:
+    if fmt == "arrow":
+        import pyarrow as pa
+        return pa.ipc.open_stream(data).read_all().to_pandas()
+    return pd.read_json(io.StringIO(data.decode("utf-8")), orient="table")
+
+# ---------- backend ----------
+
+class RedisThreadCache(ThreadCacheBackend):
+    """Thread cache shared by all replicas through any Redis-protocol server.
+
+    Each result is written once as a hash (meta JSON + serialized DataFrame);
+    every thread key is a small pointer to it. Both expire after the TTL, so
+    memory is bounded by Redis itself (configure maxmemory + an LRU policy).
+    Works with redis-py's client or fakeredis.FakeRedis for tests.
+    """
+
+    def __init__(self, client, ttl_seconds: int = 3600, prefix: str = "bi:"):
+        self.client = client
+        self.ttl = ttl_seconds
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisThreadCache":
+        import redis
+        return cls(redis.Redis.from_url(url, socket_keepalive=True, health_check_interval=30), **kwargs)
+
+    def _ptr(self, channel: str, thread_ts: str) -> str:
+        return f"{self.prefix}thread:{self.key(channel, thread_ts)}"
+
+    def set(self, channel: str, thread_ts: str, value: Dict[str, Any], aliases: Tuple[str, ...] = ()):
+        value = dict(value)
+        df = value.pop("df", None)
+        blob_key = f"{self.prefix}result:{uuid.uuid4().hex}"
+        mapping = {"meta": json.dumps(value, default=str)}
+        if df is not None:
+            mapping["fmt"], mapping["df"] = serialize_df(compact_df(df))
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hset(blob_key, mapping=mapping)
+        pipe.expire(blob_key, self.ttl)
+        for t in (thread_ts, *aliases):
+            pipe.set(self._ptr(channel, t), blob_key, ex=self.ttl)
+        try:
+            pipe.execute()
+        except Exception:
+            # a cache outage must not fail the answer itself
+            logger.exception("[cache] redis set failed")
+
+    def get(self, channel: str, thread_ts: str) -> Optional[Dict[str, Any]]:
+        try:
+            blob_key = self.client.get(self._ptr(channel, thread_ts))
+            if not blob_key:
+                return None
+            item = self.client.hgetall(blob_key)
+        except Exception:
+            logger.exception("[cache] redis get failed")
+            return None
+        if not item:
+            return None
+        item = {(k.decode() if isinstance(k, bytes) else k): v for k, v in item.items()}
+        value = json.loads(item["meta"])
+        if "df" in item:
+            fmt = item["fmt"].decode() if isinstance(item["fmt"], bytes) else item["fmt"]
+            value["df"] = deserialize_df(fmt, item["df"])
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            info = self.client.info("memory")
+            return {"backend": "redis", "used_memory": info.get("used_memory")}
+        except Exception:
+            return {"backend": "redis"}
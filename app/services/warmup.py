@@ -0,0 +1,235 @@
+"""
+Cache warming: re-run the questions people ask most so nobody pays for a cold cache.
+
+Every answered question is counted (keyed on the normalized question, or on the
+SQL for follow-ups) and the most frequent ones are persisted with their plan
+to WARMUP_PATH. A background thread re-runs the top WARMUP_TOP_N of them, plus
+the canned SIMPLE_RULES/FEW_SHOTS queries, through run_sql, which primes the
+shared result cache (and the connection pool, rollup routing and prompt
+builder on the way):
+
+- at startup
+- when the data version changes (an ingest from any process)
+- when the date changes (relative date ranges name new days)
+- every WARMUP_INTERVAL_SECONDS (0 = only on the events above)
+
+Templated questions are re-planned at warm-up so their date parameters are
+today's; every other entry re-runs its stored SQL. Queries run one at a time
+so warming never takes more than one connection from live questions.
+
+    python -m app.services.warmup          # the persisted top entries
+"""
+import os, sys, json, time, logging, threading
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_PATH = os.getenv("WARMUP_PATH", "data/warm_queries.json")
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "20"))
+WARMUP_MAX_ENTRIES = int(os.getenv("WARMUP_MAX_ENTRIES", "200"))
+WARMUP_MAX_AGE_DAYS = float(os.getenv("WARMUP_MAX_AGE_DAYS", "14"))
+WARMUP_INTERVAL_SECONDS = int(os.getenv("WARMUP_INTERVAL_SECONDS", "3600"))
+WARMUP_POLL_SECONDS = int(os.getenv("WARMUP_POLL_SECONDS", "30"))
+WARMUP_CANNED = os.getenv("WARMUP_CANNED", "true").lower() == "true"
+
+def _sql_key(sql: str, params) -> str:
+    return " ".join(sql.split()) + "|" + json.dumps(list(params or []), default=str)
+
+class QueryWarmer:
+    """Question frequency tracker + background re-runner of the most frequent questions."""
+
+    def __init__(self, path: Optional[str], top_n: int = WARMUP_TOP_N, max_entries: int = WARMUP_MAX_ENTRIES,
+                 max_age_seconds: float = WARMUP_MAX_AGE_DAYS * 86400):
+        self.path = Path(path) if path else None
+        self.top_n = top_n
+        self.max_entries = max_entries
+        self.max_age = max_age_seconds
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.counters = Counter()
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._dirty = False
+        self._thread: Optional[threading.Thread] = None
+        self._load()
+
+    # ---------- persistence ----------
+
+    def _load(self):
+        if not self.path or not self.path.exists():
+            return
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            logger.warning("[warmup] %s unreadable; starting empty", self.path)
+            return
+        for e in data.get("entries", []):
+            if e.get("key") and e.get("sql"):
+                self.entries[e["key"]] = e
+        self._prune()
+        logger.info("[warmup] loaded %d questions", len(self.entries))
+
+    def save(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            payload = {"entries": sorted(self.entries.values(), key=lambda e: -e["hits"])}
+            self._dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+            tmp.write_text(json.dumps(payload, default=str), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError:
+            logger.exception("[warmup] could not persist %s", self.path)
+
+    # ---------- recording ----------
+
+    def _prune(self):
+        # caller holds the lock (or is __init__)
+        now = time.time()
+        for k in [k for k, e in self.entries.items() if now - e.get("last_seen", 0) > self.max_age]:
+            del self.entries[k]
+        if len(self.entries) > self.max_entries:
+            keep = sorted(self.entries.values(), key=lambda e: (-e["hits"], -e.get("last_seen", 0)))
+            self.entries = {e["key"]: e for e in keep[:self.max_entries]}
+
+    def record(self, user_text: str, plan: Dict[str, Any], followup: bool = False):
+        """Count one answered question. Follow-ups are keyed on their SQL, since their text needs the thread."""
+        from ..nlp.plan_cache import normalize_question
+        sql = plan.get("sql")
+        if not sql:
+            return
+        question = normalize_question(user_text)
+        key = "s|" + _sql_key(sql, plan.get("params")) if followup or not question else "q|" + question
+        with self._lock:
+            e = self.entries.get(key)
+            if e is None:
+                if len(self.entries) >= self.max_entries:
+                    self._prune()
+                    if len(self.entries) >= self.max_entries:  # make room: the least asked goes
+                        del self.entries[min(self.entries.values(), key=lambda e: (e["hits"], e.get("last_seen", 0)))["key"]]
+                e = self.entries[key] = {"key": key, "question": user_text, "hits": 0}
+            e.update(sql=sql, params=plan.get("params"), last_seen=time.time(),
+                     template=bool(plan.get("template")) and not followup)
+            e["hits"] += 1
+            self._dirty = True
+
+    def top(self, n: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            ranked = sorted(self.entries.values(), key=lambda e: (-e["hits"], -e.get("last_seen", 0)))
+            return [dict(e) for e in ranked[:self.top_n if n is None else n]]
+
+    # ---------- warming ----------
+
+    def queries(self) -> List[Tuple[str, Any]]:
+        """(sql, params) to warm: the top questions, then the canned queries, without repeats."""
+        from ..nlp.config import TEMPLATES_ENABLED
+        from ..nlp.templates import plan_from_template
+        out, seen = [], set()
+
+        def add(sql, params):
+            k = _sql_key(sql, params)
+            if k not in seen:
+                seen.add(k)
+                out.append((sql, params))
+
+        for e in self.top():
+            # relative dates ("last 7 days") are bound as parameters: re-plan for today's
+            plan = plan_from_template(e["question"]) if e.get("template") and TEMPLATES_ENABLED else None
+            add(plan["sql"], plan.get("params")) if plan else add(e["sql"], e.get("params"))
+        if WARMUP_CANNED:
+            from ..sql.plan_check import canned_queries
+            for sql in canned_queries():
+                add(sql, None)
+        return out
+
+    def warm(self, reason: str = "manual") -> int:
+        """Run the warm-up queries now (one warm-up at a time); returns how many succeeded."""
+        from ..sql.runner import run_sql, RESULT_CACHE
+        if not self._run_lock.acquire(blocking=False):
+            return 0
+        try:
+            t0, ok = time.perf_counter(), 0
+            _prime_planner()
+            work = self.queries() if RESULT_CACHE else []
+            for sql, params in work:
+                try:
+                    run_sql(sql, params)
+                    ok += 1
+                except Exception as ex:  # aborted by the cost guard, SQL the engine can't run, ...
+                    self.counters["failed"] += 1
+                    logger.debug("[warmup] skipped %s: %s", sql, ex)
+            self.counters["runs"] += 1
+            self.counters["queries"] += ok
+            logger.info("[warmup] %s: warmed %d/%d queries in %.2fs", reason, ok, len(work), time.perf_counter() - t0)
+            return ok
+        finally:
+            self._run_lock.release()
+
+    def start(self, interval_seconds: int = WARMUP_INTERVAL_SECONDS, poll_seconds: int = WARMUP_POLL_SECONDS):
+        """Background thread: warm now, then on data loads, date changes and every interval (idempotent)."""
+        if self._thread is not None:
+            return self._thread
+        from ..sql.runner import data_version
+
+        def loop():
+            version, day, last = None, None, 0.0
+            while True:
+                try:
+                    reason = None
+                    v, d = data_version(), date.today()
+                    if version is None:
+                        reason = "startup"
+                    elif v != version:
+                        reason = "data load"
+                    elif d != day:
+                        reason = "new day"
+                    elif interval_seconds and time.time() - last >= interval_seconds:
+                        reason = "schedule"
+                    if reason:
+                        version, day, last = v, d, time.time()
+                        self.warm(reason)
+                    self.save()
+                except Exception:
+                    logger.exception("[warmup] warm-up failed")
+                time.sleep(poll_seconds)
+
+        self._thread = threading.Thread(target=loop, name="cache-warmer", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"questions": len(self.entries),
+                    **{k: self.counters.get(k, 0) for k in ("runs", "queries", "failed")}}
+
+def _prime_planner():
+    # lazily built planner state: the prompt prefix/few-shot index and the pooled LLM client
+    from ..nlp.config import USE_OPENAI
+    if not USE_OPENAI:
+        return
+    from ..nlp.agent import _get_llm
+    from ..nlp.prompt_builder import get_prompt_builder
+    from ..sql.engines import get_dialect
+    get_prompt_builder().prefix(get_dialect().prompt_rule)
+    _get_llm()
+
+def _build() -> Optional[QueryWarmer]:
+    if not WARMUP_ENABLED:
+        return None
+    return QueryWarmer(WARMUP_PATH)
+
+warmer = _build()
+
+if __name__ == "__main__":
+    if warmer is None:
+        sys.exit("cache warming disabled (WARMUP_ENABLED=false)")
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else None
+    for e in warmer.top(n):
+        print(f"{e['hits']:6d}  {e['question']}")
@@ -0,0 +1,221 @@
+import os, re, time, sqlite3, threading, logging
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import pandas as pd
+from .lexer import tokenize
+from .results import rows_to_frame
+
+logger = logging.getLogger(__name__)
+
+COST_GUARD = os.getenv("COST_GUARD", "true").lower() == "true"
+QUERY_TIMEOUT_SECONDS = float(os.getenv("QUERY_TIMEOUT_SECONDS", "15"))
+EXPORT_TIMEOUT_SECONDS = float(os.getenv("EXPORT_TIMEOUT_SECONDS", "300"))
+QUERY_MAX_ROWS = int(os.getenv("QUERY_MAX_ROWS", "10000"))
+QUERY_MAX_MB = int(os.getenv("QUERY_MAX_MB", "64"))
+# rough number of rows the plan may visit, estimated from sqlite_stat1
+QUERY_MAX_COST = float(os.getenv("QUERY_MAX_COST", "1e8"))
+FETCH_ROWS = 1000
+PROGRESS_STEPS = 1000  # VM instructions between deadline checks
+STATS_TTL = 60
+
+class QueryAborted(ValueError):
+    """A query refused or stopped by the guard; `reason` is safe to show the user."""
+
+    def __init__(self, kind: str, reason: str):
+        super().__init__(reason)
+        self.kind = kind
+        self.reason = reason
+
+_counters: Counter = Counter()
+_lock = threading.Lock()
+
+def aborted(kind: str, reason: str) -> QueryAborted:
+    with _lock:
+        _counters[kind] += 1
+    logger.warning("[sql] query aborted (%s): %s", kind, reason)
+    return QueryAborted(kind, reason)
+
+def guard_stats() -> Dict[str, int]:
+    with _lock:
+        return dict(_counters)
+
+# ---------- LIMIT injection ----------
+
+def has_outer_limit(sql: str) -> bool:
+    depth = 0
+    for t in tokenize(sql):
+        if t.text == "(":
+            depth += 1
+        elif t.text == ")":
+            depth -= 1
+        elif depth == 0 and t.is_("limit"):
+            return True
+    return False
+
+def ensure_limit(sql: str, limit: int) -> str:
+    """Append LIMIT when the outer query has none, so an unbounded SELECT can't fetch everything.
+
+    Callers pass one more than the row cap: a result that would have been cut
+    off then trips the cap and is refused with a reason, instead of coming
+    back silently truncated.
+    """
+    return sql if has_outer_limit(sql) else f"{sql} LIMIT {limit}"
+
+# ---------- plan cost ----------
+
+_stats_cache: Dict[str, Tuple[float, Dict[str, int], Dict[str, List[int]]]] = {}
+
+def _table_stats(con: sqlite3.Connection, db_path: str):
+    """(rows per table, stat columns per index) from sqlite_stat1, cached for STATS_TTL."""
+    hit = _stats_cache.get(db_path)
+    if hit and time.monotonic() - hit[0] < STATS_TTL:
+        return hit[1], hit[2]
+    tables: Dict[str, int] = {}
+    indexes: Dict[str, List[int]] = {}
+    try:
+        for tbl, idx, stat in con.execute("SELECT tbl, idx, stat FROM sqlite_stat1"):
+            nums = [int(x) for x in str(stat).split() if x.isdigit()]
+            if not nums:
+                continue
+            tables[tbl] = max(tables.get(tbl, 0), nums[0])
+            if idx:
+                indexes[idx] = nums
+    except sqlite3.Error:
+        pass  # not ANALYZEd yet: every table falls back to the largest guess
+    _stats_cache[db_path] = (time.monotonic(), tables, indexes)
+    return tables, indexes
+
+_STEP = re.compile(r"^(SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?(?: USING (?:COVERING )?INDEX (\w+) \(([^)]*)\))?", re.I)
+_SUBQUERY = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)", re.I)
+
+def plan_cost(plan: Sequence[Tuple[int, int, str]], tables: Dict[str, int],
+              indexes: Dict[str, List[int]]) -> float:
+    """Estimate how many rows an EXPLAIN QUERY PLAN visits.
+
+    Sibling SCAN/SEARCH steps are nested loops, so their row estimates
+    multiply; a correlated subquery runs once per outer row. SCAN counts the
+    whole table; SEARCH uses sqlite_stat1's rows-per-key for the number of
+    leading equality columns in the index.
+    """
+    children: Dict[int, List[Tuple[int, str]]] = defaultdict(list)
+    for node, parent, detail in plan:
+        children[parent].append((node, detail))
+    unknown = max(tables.values(), default=1_000_000)
+    derived: Dict[str, float] = {}
+
+    def rows(detail: str) -> float:
+        m = _STEP.match(detail)
+        name, index, cond = m.group(2), m.group(4), m.group(5) or ""
+        if name in derived:
+            return derived[name]
+        n = tables.get(name, unknown)
+        if m.group(1).upper() == "SCAN":
+            return n
+        if "rowid=" in cond.lower() or "primary key" in detail.lower():
+            return 1
+        eq = len(re.findall(r"\w+=\?", cond))
+        stat = indexes.get(index or "", [])
+        return stat[eq] if 0 < eq < len(stat) else (1 if eq else n)
+
+    def walk(parent: int) -> Tuple[float, float]:
+        cost, loop = 0.0, 1.0
+        for node, detail in children.get(parent, ()):
+            if _STEP.match(detail):
+                loop *= max(rows(detail), 1)
+                cost += loop
+                continue
+            sub_cost, sub_rows = walk(node)
+            m = _SUBQUERY.match(detail)
+            if m:
+                derived[m.group(1)] = sub_rows
+            cost += sub_cost * (loop if detail.upper().startswith("CORRELATED") else 1)
+        return cost, loop
+
+    return walk(0)[0]
+
+def check_cost(con: sqlite3.Connection, db_path: str, sql: str, params: Optional[Sequence] = None) -> float:
+    """Refuse the query before it runs if its plan is estimated to visit more than QUERY_MAX_COST rows."""
+    plan = [(r[0], r[1], r[-1]) for r in con.execute("EXPLAIN QUERY PLAN " + sql, tuple(params or ()))]
+    cost = plan_cost(plan, *_table_stats(con, db_path))
+    if cost > QUERY_MAX_COST:
+        raise aborted("cost", f"that query would read roughly {cost:,.0f} rows (limit {QUERY_MAX_COST:,.0f}); "
+                             "try narrowing it with filters")
+    return cost
+
+# ---------- execution budget ----------
+
+_scope = threading.local()
+
+@contextmanager
+def cancel_scope(cancel: threading.Event):
+    """Stop guarded queries this thread runs inside the block once `cancel` is set."""
+    outer = getattr(_scope, "cancel", None)
+    _scope.cancel = cancel
+    try:
+        yield
+    finally:
+        _scope.cancel = outer
+
+@contextmanager
+def deadline(con: sqlite3.Connection, seconds: float):
+    """Interrupt whatever `con` is running once `seconds` have passed, or its cancel_scope is cancelled."""
+    expired, cancelled = [], []
+    end = time.monotonic() + seconds
+    cancel = getattr(_scope, "cancel", None)
+
+    def check():
+        if cancel is not None and cancel.is_set():
+            cancelled.append(True)
+            return 1
+        if time.monotonic() > end:
+            expired.append(True)
+            return 1
+        return 0
+
+    con.set_progress_handler(check, PROGRESS_STEPS)
+    try:
+        yield
+    except sqlite3.OperationalError:
+        if expired:
+            raise aborted("timeout", f"that query ran longer than {seconds:g}s and was stopped") from None
+        if cancelled:
+            raise aborted("cancelled", "that query was no longer needed and was stopped") from None
+        raise
+    finally:
+        # the connection goes back to the pool
+        con.set_progress_handler(None, 0)
+
+def _frames(cur, columns: List[str], chunk_rows: int) -> Iterator[pd.DataFrame]:
+    while True:
+        rows = cur.fetchmany(chunk_rows)
+        if not rows:
+            return
+        yield rows_to_frame(rows, columns)
+
+def iter_frames(cur, chunk_rows: int = FETCH_ROWS) -> Iterator[pd.DataFrame]:
+    """DataFrame chunks from an executed DB-API cursor."""
+    yield from _frames(cur, [d[0] for d in cur.description], chunk_rows)
+
+def cap_frames(frames: Iterator[pd.DataFrame], columns: List[str], max_rows: int = QUERY_MAX_ROWS,
+               max_bytes: int = QUERY_MAX_MB * 1024 * 1024) -> pd.DataFrame:
+    """Concatenate result chunks, aborting as soon as they pass max_rows or max_bytes."""
+    out, n, size = [], 0, 0
+    for frame in frames:
+        n += len(frame)
+        size += int(frame.memory_usage(index=False, deep=True).sum())
+        if n > max_rows:
+            raise aborted("rows", f"the result has more than {max_rows:,} rows; "
+                                 "add filters, or use `export full csv` for the whole table")
+        if size > max_bytes:
+            raise aborted("bytes", f"the result is larger than {max_bytes // (1024 * 1024)} MB; "
+                                  "select fewer columns or add filters")
+        out.append(frame)
+    if not out:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(out, ignore_index=True) if len(out) > 1 else out[0]
+
+def read_capped(cur, max_rows: int = QUERY_MAX_ROWS, max_bytes: int = QUERY_MAX_MB * 1024 * 1024) -> pd.DataFrame:
+    """Fetch an executed DB-API cursor in chunks, aborting as soon as the result passes max_rows or max_bytes."""
+    columns = [d[0] for d in cur.description]
+    return cap_frames(_frames(cur, columns, FETCH_ROWS), columns, max_rows, max_bytes)
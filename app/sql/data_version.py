@@ -0,0 +1,44 @@
+import os, time, sqlite3, threading
+from typing import Dict, Optional, Tuple
+
+# How long a read of the version row is trusted before asking the DB again
+DATA_VERSION_TTL = float(os.getenv("DATA_VERSION_TTL", "2"))
+
+_lock = threading.Lock()
+_cached: Dict[str, Tuple[float, str]] = {}  # resolved db path -> (read at, version)
+
+def bump_data_version(con: sqlite3.Connection) -> int:
+    """Increment the counter; call inside the loading transaction."""
+    con.execute("INSERT OR IGNORE INTO data_version (id, version, updated_at) VALUES (1, 0, datetime('now'))")
+    con.execute("UPDATE data_version SET version = version + 1, updated_at = datetime('now') WHERE id = 1")
+    return con.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+
+def cached_data_version(db_path: str) -> Optional[str]:
+    """The version read_data_version saw for db_path, if still within DATA_VERSION_TTL; no DB access."""
+    with _lock:
+        hit = _cached.get(os.path.realpath(db_path))
+    return hit[1] if hit and time.time() - hit[0] < DATA_VERSION_TTL else None
+
+def read_data_version(con: sqlite3.Connection, db_path: str) -> str:
+    """Current data version of the DB at db_path as a short stamp, cached per DB for DATA_VERSION_TTL seconds.
+
+    Falls back to the DB file's mtime/size on databases that predate the
+    data_version table.
+    """
+    value = cached_data_version(db_path)
+    if value is not None:
+        return value
+    try:
+        value = f"v{con.execute('SELECT version FROM data_version WHERE id = 1').fetchone()[0]}"
+    except (sqlite3.Error, TypeError):
+        stamps = []
+        for p in (db_path, db_path + "-wal"):
+            try:
+                st = os.stat(p)
+                stamps.append(f"{st.st_mtime_ns}:{st.st_size}")
+            except OSError:
+                pass
+        value = "f" + "|".join(stamps)
+    with _lock:
+        _cached[os.path.realpath(db_path)] = (time.time(), value)
+    return value
@@ -0,0 +1,481 @@
+import os, re, sys, time, uuid, sqlite3, threading, logging
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
+import pandas as pd
+from dotenv import load_dotenv
+from .lexer import tokenize
+from .pool import get_pool, POOL_SIZE, POOL_TIMEOUT
+from .rollups import ROLLUP_REWRITE, rewrite_for_rollup
+from .data_version import cached_data_version, read_data_version, DATA_VERSION_TTL
+from .results import ARROW_RESULTS, from_arrow
+from .cost_guard import (COST_GUARD, QUERY_TIMEOUT_SECONDS, EXPORT_TIMEOUT_SECONDS, QUERY_MAX_ROWS, FETCH_ROWS,
+                         aborted, cap_frames, check_cost, deadline, ensure_limit, iter_frames, read_capped)
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# DB_ENGINE=postgres reads DATABASE_URL and needs `pip install "psycopg[binary,pool]"`
+DB_ENGINE = os.getenv("DB_ENGINE", "sqlite").lower()
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+# DB_ENGINE=duckdb reads month-partitioned Parquet under COLUMNAR_DIR and needs `pip install duckdb`
+COLUMNAR_DIR = os.getenv("COLUMNAR_DIR", "data/columnar")
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0"))  # 0: one per core
+# Postgres planner cost units (EXPLAIN "Total Cost") above which a query is refused
+PG_MAX_COST = float(os.getenv("PG_MAX_COST", "5e6"))
+
+# ---------- dialects ----------
+
+class Dialect:
+    """SQL flavour: a rule for the planner prompt plus rewrites for the SQLite idioms in canned SQL."""
+    name = "sqlite"
+    prompt_rule = ("Use SQLite syntax. `date` is TEXT 'YYYY-MM-DD': use date('now','-30 day'), "
+                   "date('now','start of month') and substr(date,1,7) for months.")
+
+    def translate(self, sql: str) -> str:
+        """Rewrite SQLite idioms into this dialect."""
+        return sql
+
+    def bind(self, sql: str) -> str:
+        """Rewrite `?` placeholders into the driver's paramstyle."""
+        return sql
+
+class PostgresDialect(Dialect):
+    name = "postgres"
+    prompt_rule = ("Use PostgreSQL syntax. `date` is a DATE column: use CURRENT_DATE - 30, "
+                   "date_trunc('month', CURRENT_DATE)::date and to_char(date, 'YYYY-MM') for months. "
+                   "Do not use SQLite functions such as date('now', ...) or strftime.")
+
+    _REWRITES = [
+        (re.compile(r"\bdate\(\s*'now'\s*,\s*'([-+]?\d+)\s+days?'\s*\)", re.I),
+         lambda m: f"(CURRENT_DATE + {int(m.group(1))})"),
+        (re.compile(r"\bdate\(\s*'now'\s*,\s*'start of (month|year)'\s*\)", re.I),
+         lambda m: f"date_trunc('{m.group(1).lower()}', CURRENT_DATE)::date"),
+        (re.compile(r"\bdate\(\s*'now'\s*\)", re.I), lambda m: "CURRENT_DATE"),
+        (re.compile(r"\bsubstr\(\s*(\w+)\s*,\s*1\s*,\s*(7|4)\s*\)", re.I),
+         lambda m: f"to_char({m.group(1)}, '{'YYYY-MM' if m.group(2) == '7' else 'YYYY'}')"),
+        (re.compile(r"\bstrftime\(\s*'%Y-%m'\s*,\s*(\w+)\s*\)", re.I), lambda m: f"to_char({m.group(1)}, 'YYYY-MM')"),
+    ]
+
+    def translate(self, sql: str) -> str:
+        for rx, repl in self._REWRITES:
+            sql = rx.sub(repl, sql)
+        return sql
+
+    def bind(self, sql: str) -> str:
+        # psycopg uses %s and treats a bare % as a placeholder when params are passed
+        out, last = [], 0
+        for t in tokenize(sql):
+            if t.text == "?" or "%" in t.text:
+                out.append(sql[last:t.start])
+                out.append("%s" if t.text == "?" else t.text.replace("%", "%%"))
+                last = t.start + len(t.text)
+        out.append(sql[last:])
+        return "".join(out)
+
+class DuckDBDialect(Dialect):
+    """SQLite syntax in, DuckDB out: the prompt rule stays SQLite's and the idioms are rewritten.
+
+    `date` stays TEXT 'YYYY-MM-DD' in the Parquet files, so comparisons and
+    substr() behave exactly as in SQLite.
+    """
+    name = "duckdb"
+
+    _DATE_NOW = re.compile(r"\bdate\(\s*'now'((?:\s*,\s*'[^']*')*)\s*\)", re.I)
+    _MODIFIER = re.compile(r"^([-+]?\d+)\s+(day|month|year)s?$")
+    _STRFTIME = re.compile(r"\bstrftime\(\s*'%Y(-%m)?'\s*,\s*(\w+)\s*\)", re.I)
+
+    def _date_now(self, m: re.Match) -> str:
+        expr = "current_date"
+        for mod in re.findall(r"'([^']*)'", m.group(1)):
+            mod = mod.strip().lower()
+            step = self._MODIFIER.match(mod)
+            if mod in ("start of month", "start of year"):
+                expr = f"date_trunc('{mod.split()[-1]}', {expr})"
+            elif step:
+                expr = f"({expr} + INTERVAL ({int(step.group(1))}) {step.group(2).upper()})"
+            else:
+                return m.group(0)  # leave anything else for DuckDB to reject
+        return f"strftime({expr}, '%Y-%m-%d')"
+
+    def translate(self, sql: str) -> str:
+        sql = self._DATE_NOW.sub(self._date_now, sql)
+        sql = self._STRFTIME.sub(lambda m: f"substr({m.group(2)}, 1, {7 if m.group(1) else 4})", sql)
+        # SQLite's LIKE ignores ASCII case, DuckDB's doesn't
+        out, last = [], 0
+        for t in tokenize(sql):
+            if t.is_("like"):
+                out.append(sql[last:t.start])
+                out.append("ILIKE")
+                last = t.start + len(t.text)
+        out.append(sql[last:])
+        return "".join(out)
+
+# ---------- engines ----------
+
+class Engine(ABC):
+    """What run_sql needs from a database; `read` applies the cost guard."""
+    name = "base"
+    dialect = Dialect()
+
+    @abstractmethod
+    def read(self, sql: str, params: Optional[Sequence] = None) -> pd.DataFrame:
+        ...
+
+    @abstractmethod
+    def stream(self, sql: str, params: Optional[Sequence] = None, chunk_rows: int = 50000) -> Iterator[pd.DataFrame]:
+        ...
+
+    @abstractmethod
+    def data_version(self) -> str:
+        ...
+
+    def close(self):
+        pass
+
+class SQLiteEngine(Engine):
+    name = "sqlite"
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def read(self, sql, params=None):
+        with get_pool(self.db_path).connection() as con:
+            if ROLLUP_REWRITE:
+                sql = rewrite_for_rollup(sql, con, self.db_path)
+            if not COST_GUARD:
+                cur = con.execute(sql, tuple(params or ()))
+                return cap_frames(iter_frames(cur), [d[0] for d in cur.description], float("inf"), float("inf"))
+            # refuse expensive plans, bound the fetch, and stop anything still running at the deadline
+            sql = ensure_limit(sql, QUERY_MAX_ROWS + 1)
+            check_cost(con, self.db_path, sql, params)
+            with deadline(con, QUERY_TIMEOUT_SECONDS):
+                return read_capped(con.execute(sql, tuple(params or ())))
+
+    def stream(self, sql, params=None, chunk_rows=50000):
+        with get_pool(self.db_path).connection() as con:
+            if ROLLUP_REWRITE:
+                sql = rewrite_for_rollup(sql, con, self.db_path)
+            if not COST_GUARD:
+                yield from iter_frames(con.execute(sql, tuple(params or ())), chunk_rows)
+                return
+            check_cost(con, self.db_path, sql, params)
+            with deadline(con, EXPORT_TIMEOUT_SECONDS):
+                yield from iter_frames(con.execute(sql, tuple(params or ())), chunk_rows)
+
+    def data_version(self):
+        # cached per DB for DATA_VERSION_TTL; only a miss takes a pooled connection
+        version = cached_data_version(self.db_path)
+        if version is not None:
+            return version
+        with get_pool(self.db_path).connection() as con:
+            return read_data_version(con, self.db_path)
+
+class PostgresEngine(Engine):
+    """Pooled psycopg 3 connections; results are read through server-side (named) cursors.
+
+    Every query runs in a read-only transaction with a statement_timeout, so
+    the server itself cancels runaway work.
+    """
+    name = "postgres"
+    dialect = PostgresDialect()
+
+    def __init__(self, dsn: str, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        from psycopg_pool import ConnectionPool
+        self.pool = ConnectionPool(dsn, min_size=1, max_size=max(1, max_size), timeout=timeout,
+                                   configure=self._configure, open=True)
+        self._version = (0.0, None)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _configure(con):
+        con.read_only = True
+
+    @contextmanager
+    def _transaction(self, timeout: float):
+        import psycopg
+        with self.pool.connection() as con:
+            try:
+                con.execute(f"SET LOCAL statement_timeout = {int(timeout * 1000)}")
+                yield con
+            except psycopg.errors.QueryCanceled:
+                raise aborted("timeout", f"that query ran longer than {timeout:g}s and was stopped") from None
+
+    def _check_cost(self, con, sql, params):
+        plan = con.execute("EXPLAIN (FORMAT JSON) " + sql, params).fetchone()[0]
+        cost = plan[0]["Plan"]["Total Cost"]
+        if cost > PG_MAX_COST:
+            raise aborted("cost", f"that query's estimated cost is {cost:,.0f} (limit {PG_MAX_COST:,.0f}); "
+                                  "try narrowing it with filters")
+
+    def _prepare(self, sql, params):
+        sql = self.dialect.translate(sql)
+        return (self.dialect.bind(sql), tuple(params)) if params else (sql, None)
+
+    def read(self, sql, params=None):
+        if COST_GUARD:
+            sql = ensure_limit(sql, QUERY_MAX_ROWS + 1)
+        sql, params = self._prepare(sql, params)
+        with self._transaction(QUERY_TIMEOUT_SECONDS) as con:
+            if COST_GUARD:
+                self._check_cost(con, sql, params)
+            with con.cursor(name=f"bi_{uuid.uuid4().hex}") as cur:
+                cur.itersize = FETCH_ROWS
+                cur.execute(sql, params)
+                if not COST_GUARD:
+                    return pd.concat(list(iter_frames(cur)) or [pd.DataFrame(columns=[d[0] for d in cur.description])],
+                                     ignore_index=True)
+                return read_capped(cur)
+
+    def stream(self, sql, params=None, chunk_rows=50000):
+        sql, params = self._prepare(sql, params)
+        with self._transaction(EXPORT_TIMEOUT_SECONDS) as con:
+            if COST_GUARD:
+                self._check_cost(con, sql, params)
+            with con.cursor(name=f"bi_{uuid.uuid4().hex}") as cur:
+                cur.itersize = chunk_rows
+                cur.execute(sql, params)
+                yield from iter_frames(cur, chunk_rows)
+
+    def data_version(self):
+        with self._lock:
+            at, value = self._version
+            if value is not None and time.time() - at < DATA_VERSION_TTL:
+                return value
+        with self.pool.connection() as con:
+            row = con.execute("SELECT version FROM data_version WHERE id = 1").fetchone()
+        value = f"v{row[0] if row else 0}"
+        with self._lock:
+            self._version = (time.time(), value)
+        return value
+
+    def close(self):
+        self.pool.close()
+
+class DuckDBEngine(Engine):
+    """In-process DuckDB over app_metrics exported to one Parquet file per month.
+
+    Aggregates read only the columns they name, and row-group min/max stats
+    on `date` skip months outside the filter. There is no plan cost estimate
+    here: results are still row/byte capped and interrupted at the deadline.
+    Refresh the files with `python -m app.sql.engines columnar` (ingest.py
+    re-exports the months it touched).
+    """
+    name = "duckdb"
+    dialect = DuckDBDialect()
+
+    def __init__(self, data_dir: str, threads: int = DUCKDB_THREADS):
+        import duckdb
+        self.data_dir = Path(data_dir)
+        files = str(self.data_dir / "app_metrics_*.parquet").replace("'", "''")
+        self._db = duckdb.connect(":memory:", config={"threads": threads} if threads else {})
+        try:
+            # the glob is expanded per query, so re-exported or new months show up without a reopen
+            self._db.execute(f"CREATE VIEW app_metrics AS SELECT * FROM read_parquet('{files}')")
+        except duckdb.IOException:
+            raise RuntimeError(f"DB_ENGINE=duckdb found no Parquet in {data_dir}; "
+                               "run `python -m app.sql.engines columnar`") from None
+        self._version = (0.0, None)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _cursor(self, timeout: float):
+        import duckdb
+        cur = self._db.cursor()
+        # SQLite semantics: integer / integer truncates
+        cur.execute("SET integer_division = true")
+        timer = threading.Timer(timeout, cur.interrupt)
+        timer.start()
+        try:
+            yield cur
+        except duckdb.InterruptException:
+            raise aborted("timeout", f"that query ran longer than {timeout:g}s and was stopped") from None
+        finally:
+            timer.cancel()
+            cur.close()
+
+    @staticmethod
+    def _chunks(cur, chunk_rows: int) -> Iterator[pd.DataFrame]:
+        if ARROW_RESULTS:
+            # record batches straight from DuckDB's vectors
+            reader = getattr(cur, "to_arrow_reader", None) or cur.fetch_record_batch
+            for batch in reader(chunk_rows):
+                if batch.num_rows:
+                    yield from_arrow(batch)
+            return
+        # SUM over integers is HUGEINT, which pandas gets as float; SQLite returns int
+        wide = [d[0] for d in cur.description if str(d[1]) == "HUGEINT"]
+        vectors = max(1, -(-chunk_rows // 2048))
+        while True:
+            frame = cur.fetch_df_chunk(vectors)
+            if frame.empty:
+                return
+            if wide:
+                frame[wide] = frame[wide].astype("Int64" if frame[wide].isna().any().any() else "int64")
+            yield frame
+
+    def read(self, sql, params=None):
+        sql = self.dialect.translate(sql)
+        if COST_GUARD:
+            sql = ensure_limit(sql, QUERY_MAX_ROWS + 1)
+        with self._cursor(QUERY_TIMEOUT_SECONDS) as cur:
+            cur.execute(sql, list(params or ()))
+            limits = () if COST_GUARD else (float("inf"), float("inf"))
+            return cap_frames(self._chunks(cur, FETCH_ROWS), [d[0] for d in cur.description], *limits)
+
+    def stream(self, sql, params=None, chunk_rows=50000):
+        sql = self.dialect.translate(sql)
+        with self._cursor(EXPORT_TIMEOUT_SECONDS) as cur:
+            cur.execute(sql, list(params or ()))
+            yield from self._chunks(cur, chunk_rows)
+
+    def data_version(self):
+        with self._lock:
+            at, value = self._version
+            if value is not None and time.time() - at < DATA_VERSION_TTL:
+                return value
+        try:
+            value = (self.data_dir / "VERSION").read_text(encoding="utf-8").strip()
+        except OSError:
+            value = "v0"
+        with self._lock:
+            self._version = (time.time(), value)
+        return value
+
+    def close(self):
+        self._db.close()
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    """The configured engine (DB_ENGINE), created on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            if DB_ENGINE == "postgres":
+                if not DATABASE_URL:
+                    raise RuntimeError("DB_ENGINE=postgres needs DATABASE_URL")
+                _engine = PostgresEngine(DATABASE_URL)
+            elif DB_ENGINE == "duckdb":
+                _engine = DuckDBEngine(COLUMNAR_DIR)
+            else:
+                _engine = SQLiteEngine(os.getenv("DB_PATH", "data/rounds.db"))
+        return _engine
+
+def get_dialect() -> Dialect:
+    """Dialect for the prompt, without opening any connections."""
+    return {"postgres": PostgresDialect, "duckdb": DuckDBDialect}.get(DB_ENGINE, Dialect)()
+
+# ---------- CLI: load the SQLite demo data into Postgres / Parquet, compare results ----------
+
+def load_postgres(dsn: str, db_path: str, batch_rows: int = 50000) -> int:
+    """Create schema_pg.sql in `dsn` and copy app_metrics from the SQLite file; bumps data_version."""
+    import psycopg
+    src = sqlite3.connect(db_path)
+    cols = "app_name, platform, date, country, installs, in_app_revenue, ads_revenue, ua_cost"
+    n = 0
+    with psycopg.connect(dsn) as con:
+        con.execute(Path(__file__).with_name("schema_pg.sql").read_text(encoding="utf-8"))
+        con.execute("TRUNCATE app_metrics")
+        with con.cursor().copy(f"COPY app_metrics ({cols}) FROM STDIN") as copy:
+            cur = src.execute(f"SELECT {cols} FROM app_metrics")
+            while True:
+                rows = cur.fetchmany(batch_rows)
+                if not rows:
+                    break
+                for row in rows:
+                    copy.write_row(row)
+                n += len(rows)
+        con.execute("UPDATE data_version SET version = version + 1, updated_at = now() WHERE id = 1")
+    with psycopg.connect(dsn, autocommit=True) as con:
+        con.execute("ANALYZE app_metrics")
+    src.close()
+    return n
+
+def export_columnar(db_path: str, data_dir: str = COLUMNAR_DIR, months: Optional[Iterable[str]] = None) -> int:
+    """Write app_metrics from the SQLite file as one Parquet file per month (all months, or just `months`).
+
+    Each file is written beside its target and renamed into place, so a
+    running DuckDBEngine sees either the old or the new month. VERSION gets
+    the SQLite data_version last. Returns rows written.
+    """
+    import duckdb
+    out = Path(data_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    src = sqlite3.connect(db_path)
+    cols = "app_name, platform, date, country, installs, in_app_revenue, ads_revenue, ua_cost"
+    present = [r[0] for r in src.execute("SELECT DISTINCT substr(date,1,7) FROM app_metrics ORDER BY 1")]
+    todo = present if months is None else sorted(set(months))
+    if months is None:
+        for stale in out.glob("app_metrics_*.parquet"):
+            if stale.stem.rsplit("_", 1)[-1] not in present:
+                stale.unlink()
+    duck = duckdb.connect()
+    n = 0
+    for month in todo:
+        target = out / f"app_metrics_{month}.parquet"
+        df = pd.read_sql_query(f"SELECT {cols} FROM app_metrics WHERE date BETWEEN ? AND ? "
+                               "ORDER BY date, app_name, platform, country",
+                               src, params=(month + "-01", month + "-31"))
+        if df.empty:
+            target.unlink(missing_ok=True)
+            continue
+        df["installs"] = df["installs"].astype("int64")
+        duck.register("month_rows", df)
+        tmp = target.with_suffix(".tmp")
+        duck.execute(f"COPY month_rows TO '{tmp}' (FORMAT PARQUET, COMPRESSION ZSTD)")
+        duck.unregister("month_rows")
+        os.replace(tmp, target)
+        n += len(df)
+    version = read_data_version(src, db_path)
+    src.close()
+    duck.close()
+    (out / "VERSION.tmp").write_text(version, encoding="utf-8")
+    os.replace(out / "VERSION.tmp", out / "VERSION")
+    return n
+
+def parity(engine: Engine, reference: Engine, sqls: Sequence[str]) -> int:
+    """Run each query on both engines and report mismatches; returns how many differ."""
+    bad = 0
+    for sql in sqls:
+        try:
+            a = engine.read(sql).reset_index(drop=True)
+            b = reference.read(sql).reset_index(drop=True)
+            a.columns, b.columns = list(b.columns), list(b.columns)
+            for col in a.columns:
+                # DATE comes back as datetime.date (or date32) from Postgres
+                a[col] = a[col] if pd.api.types.is_numeric_dtype(a[col]) else a[col].astype(str)
+            pd.testing.assert_frame_equal(a, b, check_dtype=False, check_exact=False, rtol=1e-6)
+            print(f"ok    {sql[:90]}")
+        except Exception as e:
+            bad += 1
+            print(f"FAIL  {sql[:90]}\n      {str(e).splitlines()[0] if str(e) else type(e).__name__}")
+    return bad
+
+if __name__ == "__main__":
+    import argparse
+    from .plan_check import canned_queries
+    from .runner import _sanitize
+    ap = argparse.ArgumentParser(prog="python -m app.sql.engines")
+    ap.add_argument("command", choices=["load", "parity", "columnar"])
+    ap.add_argument("--dsn", default=DATABASE_URL)
+    ap.add_argument("--db", default=os.getenv("DB_PATH", "data/rounds.db"))
+    ap.add_argument("--dir", default=COLUMNAR_DIR, help="Parquet directory (columnar, parity --engine duckdb)")
+    ap.add_argument("--engine", choices=["postgres", "duckdb"], default="duckdb" if DB_ENGINE == "duckdb" else "postgres",
+                    help="engine that `parity` checks against SQLite")
+    args = ap.parse_args()
+    if args.command == "columnar":
+        print(f"Wrote {export_columnar(args.db, args.dir)} rows to {args.dir}")
+        sys.exit(0)
+    if args.command == "parity" and args.engine == "duckdb":
+        duck, lite = DuckDBEngine(args.dir), SQLiteEngine(args.db)
+        sys.exit(1 if parity(duck, lite, [_sanitize(s) for s in canned_queries()]) else 0)
+    if not args.dsn:
+        ap.error("--dsn or DATABASE_URL is required")
+    if args.command == "load":
+        print(f"Copied {load_postgres(args.dsn, args.db)} rows into Postgres")
+    else:
+        pg, lite = PostgresEngine(args.dsn), SQLiteEngine(args.db)
+        sys.exit(1 if parity(pg, lite, [_sanitize(s) for s in canned_queries()]) else 0)
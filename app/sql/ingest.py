@@ -0,0 +1,193 @@
+"""
+Incremental loads of daily app_metrics batches from CSV or Parquet files.
+
+    python -m app.sql.ingest data/incoming/2025-08-16.csv
+    python -m app.sql.ingest exports/*.parquet --mode append
+
+Rows are upserted on the natural key (app_name, platform, date, country) in
+chunks, inside one transaction per load. The same transaction bumps
+data_version and re-aggregates only the rollup periods the load touched, so
+result caches and rollups move to the new data together (or not at all).
+With DB_ENGINE=duckdb the touched months are then re-exported to Parquet.
+Parquet files need `pip install pyarrow`.
+"""
+import os, sys, time, sqlite3, logging
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Sequence, Set
+import pandas as pd
+from dotenv import load_dotenv
+from .rollups import refresh_rollups
+from .data_version import bump_data_version
+from .engines import DB_ENGINE, DATABASE_URL, COLUMNAR_DIR, export_columnar
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("DB_PATH", "data/rounds.db")
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "50000"))
+SCHEMA = Path(__file__).with_name("schema.sql").read_text(encoding="utf-8")
+
+KEY = ("app_name", "platform", "date", "country")
+MEASURES = ("installs", "in_app_revenue", "ads_revenue", "ua_cost")
+COLUMNS = KEY + MEASURES
+PLATFORMS = {"ios": "iOS", "android": "Android"}
+MODES = ("upsert", "append")
+
+def upsert_sql(mode: str = "upsert", placeholder: str = "?") -> str:
+    """INSERT for one row; "upsert" overwrites the measures of an existing key, "append" fails on it."""
+    sql = (f"INSERT INTO app_metrics ({', '.join(COLUMNS)}) "
+           f"VALUES ({', '.join([placeholder] * len(COLUMNS))})")
+    if mode == "upsert":
+        sql += (f" ON CONFLICT ({', '.join(KEY)}) DO UPDATE SET "
+                + ", ".join(f"{m} = excluded.{m}" for m in MEASURES))
+    return sql
+
+# ---------- reading ----------
+
+def read_batches(path: str, chunk_rows: int = INGEST_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """DataFrame chunks of a .csv / .csv.gz or .parquet file."""
+    name = str(path).lower()
+    if name.endswith(".parquet") or name.endswith(".pq"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError(f"{path}: reading Parquet needs `pip install pyarrow`") from None
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+    yield from pd.read_csv(path, chunksize=chunk_rows, dtype={c: str for c in KEY})
+
+def normalize(df: pd.DataFrame, source: str = "batch") -> pd.DataFrame:
+    """Check and coerce one chunk to app_metrics' columns; raises ValueError naming the first bad row."""
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+    missing = [c for c in COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"{source}: missing column(s) {', '.join(missing)}")
+    out = pd.DataFrame(index=df.index)
+    for col in ("app_name", "country"):
+        out[col] = df[col].astype("string").str.strip()
+    out["country"] = out["country"].str.upper()
+    out["platform"] = df["platform"].astype("string").str.strip().str.lower().map(PLATFORMS)
+    out["date"] = pd.to_datetime(df["date"], errors="coerce").dt.strftime("%Y-%m-%d")
+    for col in MEASURES:
+        out[col] = pd.to_numeric(df[col], errors="coerce")
+    bad = out[list(COLUMNS)].isna().any(axis=1) | (out["app_name"] == "") | (out["country"] == "")
+    if bad.any():
+        row = df.loc[bad.idxmax()]
+        raise ValueError(f"{source}: {int(bad.sum())} invalid row(s), first: {row.to_dict()}")
+    out["installs"] = out["installs"].round().astype("int64")
+    # the same key twice in one file: the later row wins, as it would across files
+    return out[list(COLUMNS)].drop_duplicates(subset=list(KEY), keep="last")
+
+def _rows(df: pd.DataFrame) -> List[tuple]:
+    cols = [df[c].astype(object).tolist() if c in KEY else df[c].tolist() for c in COLUMNS]
+    return list(zip(*cols))
+
+# ---------- loading ----------
+
+def ingest(paths: Sequence[str], db_path: str = DB_PATH, mode: str = "upsert",
+           chunk_rows: int = INGEST_CHUNK_ROWS) -> Dict:
+    """Load files into the SQLite app_metrics table as one transaction.
+
+    Returns {"rows", "changed", "days", "version", "rollups", "seconds"};
+    on any error nothing is written.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    t0 = time.perf_counter()
+    con = sqlite3.connect(db_path, timeout=30)
+    con.executescript(SCHEMA)
+    sql = upsert_sql(mode)
+    days: Set[str] = set()
+    rows = 0
+    try:
+        # take the write lock up front; readers keep seeing the previous version until COMMIT
+        con.execute("BEGIN IMMEDIATE")
+        before = con.total_changes
+        for path in paths:
+            for chunk in read_batches(path, chunk_rows):
+                df = normalize(chunk, str(path))
+                try:
+                    con.executemany(sql, _rows(df))
+                except sqlite3.IntegrityError as e:
+                    raise ValueError(f"{path}: {e} (already loaded? use --mode upsert)") from None
+                days.update(df["date"].unique())
+                rows += len(df)
+        changed = con.total_changes - before
+        version = bump_data_version(con)
+        # commits the load, the version bump and the touched rollup periods together
+        counts = refresh_rollups(con, days=days)
+    except BaseException:
+        con.rollback()
+        con.close()
+        raise
+    con.execute("PRAGMA optimize")  # refresh planner stats the cost guard reads, if they drifted
+    con.close()
+    if DB_ENGINE == "duckdb":
+        # the columnar copy is per month: rewrite just the months this load touched
+        export_columnar(db_path, COLUMNAR_DIR, months={d[:7] for d in days})
+    result = {"rows": rows, "changed": changed, "days": len(days), "version": version,
+              "rollups": counts, "seconds": round(time.perf_counter() - t0, 3)}
+    logger.info("[sql] ingested %s", result)
+    return result
+
+def ingest_postgres(paths: Sequence[str], dsn: str, mode: str = "upsert",
+                    chunk_rows: int = INGEST_CHUNK_ROWS) -> Dict:
+    """The same load for DB_ENGINE=postgres (schema_pg.sql); Postgres keeps no rollups."""
+    import psycopg
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    t0 = time.perf_counter()
+    sql = upsert_sql(mode, "%s")
+    days: Set[str] = set()
+    rows = 0
+    with psycopg.connect(dsn) as con:
+        con.execute(Path(__file__).with_name("schema_pg.sql").read_text(encoding="utf-8"))
+        with con.cursor() as cur:
+            for path in paths:
+                for chunk in read_batches(path, chunk_rows):
+                    df = normalize(chunk, str(path))
+                    try:
+                        cur.executemany(sql, _rows(df))
+                    except psycopg.errors.UniqueViolation as e:
+                        raise ValueError(f"{path}: {str(e).splitlines()[0]} (already loaded? use --mode upsert)") from None
+                    days.update(df["date"].unique())
+                    rows += len(df)
+            version = cur.execute("UPDATE data_version SET version = version + 1, updated_at = now() "
+                                  "WHERE id = 1 RETURNING version").fetchone()[0]
+    result = {"rows": rows, "days": len(days), "version": version,
+              "seconds": round(time.perf_counter() - t0, 3)}
+    logger.info("[sql] ingested into postgres %s", result)
+    return result
+
+def expand(paths: Iterable[str]) -> List[str]:
+    """Files as given, with directories expanded to the CSV/Parquet files in them (sorted)."""
+    out: List[str] = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            out += sorted(str(f) for f in p.iterdir()
+                          if f.name.lower().endswith((".csv", ".csv.gz", ".parquet", ".pq")))
+        else:
+            out.append(str(p))
+    return out
+
+if __name__ == "__main__":
+    import argparse
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(prog="python -m app.sql.ingest")
+    ap.add_argument("paths", nargs="+", help="CSV/Parquet files or directories of them")
+    ap.add_argument("--mode", choices=MODES, default="upsert")
+    ap.add_argument("--chunk-rows", type=int, default=INGEST_CHUNK_ROWS)
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--dsn", default=DATABASE_URL if DB_ENGINE == "postgres" else "",
+                    help="load into Postgres instead (default with DB_ENGINE=postgres)")
+    args = ap.parse_args()
+    files = expand(args.paths)
+    try:
+        if args.dsn:
+            res = ingest_postgres(files, args.dsn, args.mode, args.chunk_rows)
+        else:
+            res = ingest(files, args.db, args.mode, args.chunk_rows)
+    except (ValueError, OSError) as e:
+        sys.exit(f"ingest failed, nothing loaded: {e}")
+    print(res)
@@ -0,0 +1,52 @@
+import re
+from typing import List, NamedTuple
+
+class Token(NamedTuple):
+    kind: str   # "str", "num", "ident", "qident", "op"
+    text: str   # original text
+    start: int  # offset into the SQL string
+
+    @property
+    def low(self) -> str:
+        return self.text.lower()
+
+    def is_(self, *words: str) -> bool:
+        return self.kind == "ident" and self.low in words
+
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<str>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*")
+  | (?P<num>\d+(?:\.\d*)?|\.\d+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>>=|<=|<>|!=|==|\|\||[-+*/%=<>(),.?])
+""", re.X)
+
+def tokenize(sql: str) -> List[Token]:
+    """Split SQL into tokens, skipping whitespace. Raises ValueError on junk."""
+    out: List[Token] = []
+    pos = 0
+    while pos < len(sql):
+        m = _TOKEN.match(sql, pos)
+        if not m:
+            raise ValueError(f"Cannot tokenize SQL near: {sql[pos:pos+20]!r}")
+        if m.lastgroup != "ws":
+            out.append(Token(m.lastgroup, m.group(), pos))
+        pos = m.end()
+    return out
+
+def literal(tok: Token) -> str:
+    """Value of a single-quoted string token."""
+    return tok.text[1:-1].replace("''", "'")
+
+def match_paren(tokens: List[Token], i: int) -> int:
+    """Index of the ')' closing the '(' at tokens[i]."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j].text == "(":
+            depth += 1
+        elif tokens[j].text == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    raise ValueError("Unbalanced parentheses")
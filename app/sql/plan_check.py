@@ -0,0 +1,45 @@
+import re, logging
+from typing import Iterable, List, Optional
+from .runner import DB_PATH, _sanitize
+from .pool import get_pool
+from .engines import DB_ENGINE
+
+logger = logging.getLogger(__name__)
+
+# "SCAN app_metrics" without "USING ... INDEX" means a full table scan
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?app_metrics\b(?!.*\bINDEX\b)", re.I)
+
+def canned_queries() -> List[str]:
+    """SQL from SIMPLE_RULES and FEW_SHOTS, i.e. what the bot runs most."""
+    from ..nlp.agent import SIMPLE_RULES
+    from ..nlp.prompts import FEW_SHOTS
+    sqls = [plan.get("sql", "") for _, plan in SIMPLE_RULES]
+    sqls += [s["json"].get("sql", "") for s in FEW_SHOTS]
+    return [s for s in sqls if s and s.strip()]
+
+def explain(sql: str) -> List[str]:
+    with get_pool(DB_PATH).connection() as con:
+        rows = con.execute("EXPLAIN QUERY PLAN " + _sanitize(sql)).fetchall()
+    return [r[-1] for r in rows]
+
+def check_query_plans(sqls: Optional[Iterable[str]] = None) -> List[str]:
+    """Run EXPLAIN QUERY PLAN on the canned queries and warn about full scans.
+
+    Returns the SQL strings that still scan app_metrics. Never raises, so it
+    is safe to call at startup even before the demo DB exists.
+    """
+    scanning = []
+    if DB_ENGINE != "sqlite":
+        return scanning
+    try:
+        for sql in (sqls if sqls is not None else canned_queries()):
+            details = explain(sql)
+            if any(FULL_SCAN.search(d) for d in details):
+                scanning.append(sql)
+                logger.warning("[sql] full scan of app_metrics: %s | plan: %s", sql, "; ".join(details))
+    except Exception as e:
+        logger.warning("[sql] query plan check skipped: %s", e)
+        return scanning
+    if not scanning:
+        logger.info("[sql] query plan check ok")
+    return scanning
@@ -0,0 +1,124 @@
+import os, queue, sqlite3, threading, logging
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "65536"))
+
+class ConnectionPool:
+    """Bounded pool of read-only SQLite connections shared by Bolt worker threads.
+
+    Connections are opened lazily (up to max_size), tuned once with pragmas and
+    handed back to the pool after each query. A connection that fails its
+    health check on checkout is discarded and replaced.
+    """
+
+    def __init__(self, db_path: str, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self.db_path = db_path
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue(maxsize=self.max_size)
+        self._lock = threading.Lock()
+        self._opened = 0
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        # journal_mode=WAL is persisted in the DB file by seeds.ensure_db();
+        # a read-only handle can only observe it.
+        con.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        con.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+        con.execute("PRAGMA query_only=ON")
+        con.execute("PRAGMA temp_store=MEMORY")
+        return con
+
+    @staticmethod
+    def _healthy(con: sqlite3.Connection) -> bool:
+        try:
+            con.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, con: sqlite3.Connection):
+        try:
+            con.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                con = None
+                with self._lock:
+                    can_open = self._opened < self.max_size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    try:
+                        return self._connect()
+                    except Exception:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+                try:
+                    con = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No DB connection available after {self.timeout}s")
+            if self._healthy(con):
+                return con
+            logger.warning("[sql] dropping unhealthy pooled connection")
+            self._discard(con)
+
+    def release(self, con: sqlite3.Connection):
+        if self._closed:
+            self._discard(con)
+            return
+        try:
+            if con.in_transaction:
+                con.rollback()
+        except sqlite3.Error:
+            self._discard(con)
+            return
+        self._idle.put_nowait(con)
+
+    @contextmanager
+    def connection(self):
+        con = self.acquire()
+        try:
+            yield con
+        finally:
+            # broken handles are caught by the health check on next checkout
+            self.release(con)
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(con)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(db_path: str) -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.db_path != db_path:
+            if _pool is not None:
+                _pool.close()
+            _pool = ConnectionPool(db_path)
+        return _pool
@@ -0,0 +1,333 @@
+"""
+A structured form of the SELECT statements the planners write, for editing them.
+
+    q = parse(sql, params)
+    q.where.append([Token("ident", "platform", -1), Token("op", "=", -1), q.bind("iOS")])
+    q.limit = 5
+    sql, params = q.render()
+
+Covers one SELECT (no WITH, UNION or JOIN) reading from a table or from a
+parenthesized sub-SELECT; anything else raises ValueError. Expressions stay
+token lists. WHERE is split into AND-ed conjuncts, and the simple ones
+(`col op value`, `col IN (...)`, `col BETWEEN a AND b`) can be read as
+predicates. Bound `?` parameters travel inside their tokens, so conjuncts can
+be dropped or added without renumbering.
+"""
+from typing import Any, List, NamedTuple, Optional, Tuple, Union
+from .lexer import Token, tokenize, literal, match_paren
+
+REFUSED = {"with", "union", "intersect", "except", "join", "natural", "window", "recursive"}
+CLAUSES = ("from", "where", "group", "having", "order", "limit", "offset")
+COMPARISONS = {"=": "=", "==": "=", "!=": "!=", "<>": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+AGGREGATES = {"sum", "count", "avg", "min", "max", "total", "group_concat"}
+# keywords followed by a space before "(" when rendering; other identifiers are function calls
+_SPACED = {"and", "or", "not", "in", "from", "as", "select", "where", "on", "exists", "when", "then",
+           "else", "between", "like", "is", "by", "having", "limit", "offset", "case", "end"}
+_KEYWORDS = _SPACED | {"null", "asc", "desc", "distinct", "group", "order", "true", "false"}
+
+class Item(NamedTuple):
+    expr: List[Token]
+    alias: Optional[str]
+
+    @property
+    def name(self) -> Optional[str]:
+        """Result column name: the alias, or a bare column's own name."""
+        if self.alias:
+            return self.alias
+        if len(self.expr) == 1 and self.expr[0].kind in ("ident", "qident"):
+            return ident_name(self.expr[0])
+        return None
+
+class Pred(NamedTuple):
+    column: str
+    op: str                        # =, !=, <, <=, >, >=, in, between
+    values: Optional[Tuple]        # None when an operand is an expression (e.g. date('now', ...))
+
+def ident_name(tok: Token) -> str:
+    return tok.text[1:-1].replace('""', '"') if tok.kind == "qident" else tok.text
+
+def _depths(tokens: List[Token]) -> List[int]:
+    # nesting depth of each token; CASE ... END counts as a level so its ANDs stay inside
+    out, d = [], 0
+    for t in tokens:
+        if t.text == ")" or t.is_("end"):
+            d -= 1
+        out.append(d)
+        if t.text == "(" or t.is_("case"):
+            d += 1
+    return out
+
+def _split(tokens: List[Token], sep: str = ",") -> List[List[Token]]:
+    parts, cur = [], []
+    for t, d in zip(tokens, _depths(tokens)):
+        if d == 0 and t.text == sep:
+            parts.append(cur)
+            cur = []
+        else:
+            cur.append(t)
+    parts.append(cur)
+    if any(not p for p in parts):
+        raise ValueError("empty list element")
+    return parts
+
+def conjuncts(tokens: List[Token]) -> List[List[Token]]:
+    """AND-ed parts of a condition; one part if it has a top-level OR."""
+    parts, cur, between = [], [], False
+    for t, d in zip(tokens, _depths(tokens)):
+        if d == 0 and t.is_("or"):
+            return [tokens]
+        if d == 0 and t.is_("between"):
+            between = True
+        if d == 0 and t.is_("and"):
+            if between:
+                between = False
+            else:
+                parts.append(cur)
+                cur = []
+                continue
+        cur.append(t)
+    parts.append(cur)
+    if any(not p for p in parts):
+        raise ValueError("dangling AND")
+    return parts
+
+def canonical(tokens: List[Token], params: List[Any]) -> Tuple:
+    """Comparable form of an expression: case-folded words, literal and bound values resolved."""
+    out = []
+    for t in tokens:
+        if t.kind in ("str", "num", "param"):
+            out.append(("v", value_of(t, params)))
+        elif t.kind == "qident":
+            out.append(("i", ident_name(t).lower()))
+        else:
+            out.append((t.kind[0], t.low))
+    return tuple(out)
+
+def value_of(tok: Token, params: List[Any]) -> Any:
+    if tok.kind == "param":
+        return params[tok.start]
+    if tok.kind == "str":
+        return literal(tok)
+    if tok.kind == "num":
+        return float(tok.text) if "." in tok.text else int(tok.text)
+    raise ValueError(f"not a value: {tok.text}")
+
+def _values(tokens: List[Token], params: List[Any]) -> Optional[Tuple]:
+    if len(tokens) == 1 and tokens[0].kind in ("str", "num", "param"):
+        return (value_of(tokens[0], params),)
+    return None
+
+def _has_or(tokens: List[Token]) -> bool:
+    return any(d == 0 and t.is_("or") for t, d in zip(tokens, _depths(tokens)))
+
+def mentions(tokens: List[Token], column: str) -> bool:
+    return any(t.kind in ("ident", "qident") and ident_name(t).lower() == column for t in tokens)
+
+def is_aggregate(tokens: List[Token]) -> bool:
+    return any(t.kind == "ident" and t.low in AGGREGATES and i + 1 < len(tokens) and tokens[i + 1].text == "("
+               for i, t in enumerate(tokens))
+
+class Select:
+    def __init__(self, params: List[Any]):
+        self.params = params
+        self.distinct = False
+        self.items: List[Item] = []
+        self.source: Union[str, "Select", None] = None   # table name or sub-SELECT
+        self.source_alias: Optional[str] = None
+        self.where: List[List[Token]] = []
+        self.group_by: List[List[Token]] = []
+        self.having: List[Token] = []
+        self.order_by: List[Tuple[List[Token], bool]] = []   # (expr, descending)
+        self.limit: Optional[int] = None
+        self.offset: Optional[int] = None
+
+    # ---------- reading ----------
+
+    def blocks(self) -> List["Select"]:
+        """This block and the sub-SELECTs it reads from, outermost first."""
+        out = [self]
+        while isinstance(out[-1].source, Select):
+            out.append(out[-1].source)
+        return out
+
+    def predicate(self, conj: List[Token]) -> Optional[Pred]:
+        """The conjunct as `column op values`, or None if it has another shape."""
+        if len(conj) < 3 or conj[0].kind not in ("ident", "qident") or conj[0].low in _KEYWORDS:
+            return None
+        col, op, rest = ident_name(conj[0]).lower(), conj[1], conj[2:]
+        if op.kind == "op" and op.text in COMPARISONS:
+            return Pred(col, COMPARISONS[op.text], _values(rest, self.params))
+        if op.is_("in") and rest[0].text == "(" and match_paren(conj, 2) == len(conj) - 1:
+            vals = [_values(v, self.params) for v in _split(rest[1:-1])]
+            return Pred(col, "in", None if None in vals else tuple(v[0] for v in vals))
+        if op.is_("between"):
+            ands = [i for i, (t, d) in enumerate(zip(rest, _depths(rest))) if d == 0 and t.is_("and")]
+            if len(ands) != 1:
+                return None
+            lo, hi = _values(rest[:ands[0]], self.params), _values(rest[ands[0] + 1:], self.params)
+            return Pred(col, "between", lo + hi if lo and hi else None)
+        return None
+
+    def column(self, name: str) -> Optional[Item]:
+        """The select item that outputs table column `name` unchanged, if any."""
+        for it in self.items:
+            if len(it.expr) == 1 and it.expr[0].kind in ("ident", "qident") \
+                    and ident_name(it.expr[0]).lower() == name and (it.name or "").lower() == name:
+                return it
+        return None
+
+    def group_exprs(self) -> List[List[Token]]:
+        """GROUP BY entries with references to select aliases resolved to their expressions."""
+        by_alias = {it.alias.lower(): it.expr for it in self.items if it.alias}
+        return [by_alias.get(g[0].low, g) if len(g) == 1 and g[0].kind == "ident" else g for g in self.group_by]
+
+    # ---------- editing ----------
+
+    def bind(self, value: Any) -> Token:
+        """A `?` token bound to value."""
+        self.params.append(value)
+        return Token("param", "?", len(self.params) - 1)
+
+    # ---------- rendering ----------
+
+    def render(self) -> Tuple[str, List[Any]]:
+        out: List[Any] = []
+        return self._sql(out), out
+
+    def _sql(self, out: List[Any]) -> str:
+        sql = "SELECT " + ("DISTINCT " if self.distinct else "")
+        sql += ", ".join(self._join(it.expr, out) + (f" AS {it.alias}" if it.alias else "") for it in self.items)
+        if isinstance(self.source, Select):
+            sql += f" FROM ({self.source._sql(out)})"
+        else:
+            sql += f" FROM {self.source}"
+        if self.source_alias:
+            sql += f" {self.source_alias}"
+        if self.where:
+            many = len(self.where) > 1
+            sql += " WHERE " + " AND ".join(
+                f"({self._join(c, out)})" if many and _has_or(c) else self._join(c, out)
+                for c in self.where)
+        if self.group_by:
+            sql += " GROUP BY " + ", ".join(self._join(g, out) for g in self.group_by)
+        if self.having:
+            sql += " HAVING " + self._join(self.having, out)
+        if self.order_by:
+            sql += " ORDER BY " + ", ".join(self._join(e, out) + (" DESC" if desc else "") for e, desc in self.order_by)
+        if self.limit is not None:
+            sql += f" LIMIT {int(self.limit)}"
+        if self.offset is not None:
+            sql += f" OFFSET {int(self.offset)}"
+        return sql
+
+    def _join(self, tokens: List[Token], out: List[Any]) -> str:
+        s, prev = "", None
+        for t in tokens:
+            if t.kind == "param":
+                out.append(self.params[t.start])
+            text = t.text
+            if prev is not None and not (text in (")", ",", ".") or prev.text in ("(", ".")
+                                         or (text == "(" and prev.kind == "ident" and prev.low not in _SPACED)):
+                s += " "
+            s += text
+            prev = t
+        return s
+
+# ---------- parsing ----------
+
+def parse(sql: str, params=None) -> Select:
+    """Parse one SELECT; raises ValueError for anything outside the covered shape."""
+    sql = (sql or "").strip()
+    if sql.endswith(";"):
+        sql = sql[:-1]
+    values = list(params or [])
+    tokens, n = [], 0
+    for t in tokenize(sql):
+        if t.text == "?":
+            t = Token("param", "?", n)
+            n += 1
+        tokens.append(t)
+    if n != len(values):
+        raise ValueError(f"{n} placeholders for {len(values)} parameters")
+    return _parse_select(tokens, values)
+
+def _parse_select(tokens: List[Token], params: List[Any]) -> Select:
+    if not tokens or not tokens[0].is_("select"):
+        raise ValueError("not a SELECT")
+    depths = _depths(tokens)
+    if depths[-1] != 0 or min(depths) < 0:
+        raise ValueError("unbalanced")
+    marks: List[Tuple[str, int]] = [("select", 0)]
+    for i, (t, d) in enumerate(zip(tokens, depths)):
+        if t.kind != "ident":
+            continue
+        if t.low in REFUSED or (t.low == "select" and i and d == 0):
+            raise ValueError(f"unsupported: {t.text}")
+        if d == 0 and t.low in CLAUSES:
+            if t.low in ("group", "order"):
+                if i + 1 >= len(tokens) or not tokens[i + 1].is_("by"):
+                    raise ValueError(f"{t.text} without BY")
+            marks.append((t.low, i))
+    names = [m[0] for m in marks]
+    if names != [c for c in ("select",) + CLAUSES if c in names]:
+        raise ValueError("repeated or out-of-order clauses")
+    if "from" not in names:
+        raise ValueError("no FROM")
+    q = Select(params)
+    for k, (name, start) in enumerate(marks):
+        end = marks[k + 1][1] if k + 1 < len(marks) else len(tokens)
+        body = tokens[start + (2 if name in ("group", "order") else 1):end]
+        if not body:
+            raise ValueError(f"empty {name.upper()}")
+        if name == "select":
+            if body[0].is_("distinct"):
+                q.distinct, body = True, body[1:]
+            elif body[0].is_("all"):
+                body = body[1:]
+            q.items = [_item(p) for p in _split(body)]
+        elif name == "from":
+            _source(q, body, params)
+        elif name == "where":
+            q.where = conjuncts(body)
+        elif name == "group":
+            q.group_by = _split(body)
+        elif name == "having":
+            q.having = body
+        elif name == "order":
+            q.order_by = [_order(p) for p in _split(body)]
+        elif name in ("limit", "offset"):
+            if len(body) != 1 or body[0].kind != "num" or "." in body[0].text:
+                raise ValueError(f"{name.upper()} must be an integer")
+            setattr(q, name, int(body[0].text))
+    return q
+
+def _item(tokens: List[Token]) -> Item:
+    if len(tokens) >= 3 and tokens[-2].is_("as") and tokens[-1].kind in ("ident", "qident"):
+        return Item(tokens[:-2], ident_name(tokens[-1]))
+    last, prev = tokens[-1], tokens[-2] if len(tokens) > 1 else None
+    if prev is not None and last.kind in ("ident", "qident") and last.low not in _KEYWORDS \
+            and (prev.text == ")" or (prev.kind in ("ident", "qident", "str", "num") and prev.low not in _KEYWORDS)):
+        return Item(tokens[:-1], ident_name(last))
+    return Item(tokens, None)
+
+def _order(tokens: List[Token]) -> Tuple[List[Token], bool]:
+    if tokens[-1].is_("desc", "asc") and len(tokens) > 1:
+        return tokens[:-1], tokens[-1].is_("desc")
+    if any(t.is_("nulls", "collate") for t in tokens):
+        raise ValueError("unsupported ORDER BY modifier")
+    return tokens, False
+
+def _source(q: Select, body: List[Token], params: List[Any]):
+    if body[0].text == "(":
+        close = match_paren(body, 0)
+        q.source = _parse_select(body[1:close], params)
+        rest = body[close + 1:]
+    elif body[0].kind == "ident":
+        q.source, rest = body[0].text, body[1:]
+    else:
+        raise ValueError("unsupported FROM")
+    if rest and rest[0].is_("as"):
+        rest = rest[1:]
+    if len(rest) > 1 or (rest and rest[0].kind != "ident"):
+        raise ValueError("unsupported FROM")
+    q.source_alias = rest[0].text if rest else None
@@ -0,0 +1,62 @@
+"""
+Query results held in Arrow buffers.
+
+With pyarrow installed (and ARROW_RESULTS left on) the engines build each
+fetched chunk straight from cursor rows into Arrow arrays and hand it on as a
+DataFrame whose columns are ArrowDtype views of those arrays. Everything
+downstream then shares the buffers instead of copying them: concatenating
+chunks, column projection in authz, head() in the formatter, the result and
+thread caches, Arrow IPC to Redis and the Parquet/CSV writers. Without
+pyarrow, results are ordinary NumPy-backed DataFrames as before.
+"""
+import os
+from typing import List, Sequence
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: pip install pyarrow
+    pa = None
+
+ARROW_RESULTS = pa is not None and os.getenv("ARROW_RESULTS", "true").lower() == "true"
+
+def is_arrow(df) -> bool:
+    """True if every column of df is Arrow-backed (so it converts to a Table without copying)."""
+    return (pa is not None and isinstance(df, pd.DataFrame) and len(df.columns) > 0
+            and all(isinstance(t, pd.ArrowDtype) for t in df.dtypes))
+
+def _column(values):
+    arr = values if isinstance(values, (pa.Array, pa.ChunkedArray)) else pa.array(values)
+    if pa.types.is_decimal(arr.type):
+        # DuckDB's SUM over integers is HUGEINT (decimal(38,0)): an integer, as SQLite returns;
+        # other decimals (Postgres NUMERIC) become floats, as pandas' coerce_float does
+        target = pa.int64() if (arr.type.precision, arr.type.scale) == (38, 0) else pa.float64()
+        arr = arr.cast(target, safe=False)
+    return arr
+
+def from_arrow(data) -> pd.DataFrame:
+    """DataFrame view of a pyarrow Table or RecordBatch (no copy, except to narrow decimals)."""
+    if any(pa.types.is_decimal(t) for t in data.schema.types):
+        data = pa.table([_column(c) for c in data.columns], names=data.schema.names)
+    return data.to_pandas(types_mapper=pd.ArrowDtype)
+
+def rows_to_frame(rows: Sequence[tuple], columns: List[str]) -> pd.DataFrame:
+    """One fetched chunk of DB-API rows as a DataFrame (Arrow-backed when enabled)."""
+    if ARROW_RESULTS and rows:
+        try:
+            return from_arrow(pa.table([_column(c) for c in zip(*rows)], names=columns))
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            pass  # a column mixing types (SQLite is dynamically typed): let pandas hold objects
+    return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+
+def to_arrow(df: pd.DataFrame):
+    """df as a pyarrow Table; shares the buffers of Arrow-backed columns."""
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+def write_csv(df: pd.DataFrame, f, header: bool = True):
+    """Append df as CSV to the binary file f; Arrow frames are written from their buffers by pyarrow.csv."""
+    if is_arrow(df):
+        from pyarrow import csv
+        csv.write_csv(to_arrow(df), f, csv.WriteOptions(include_header=header, quoting_style="needed"))
+    else:
+        df.to_csv(f, index=False, header=header, encoding="utf-8")
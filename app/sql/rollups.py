@@ -0,0 +1,286 @@
+"""
+Pre-aggregated rollups of app_metrics and the rewriter that routes queries to them.
+
+    python -m app.sql.rollups           # incremental refresh (from the last rolled-up day)
+    python -m app.sql.rollups --full    # rebuild from scratch
+"""
+import os, re, sys, time, sqlite3, calendar, logging, threading
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from .lexer import Token, tokenize, literal, match_paren
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_REWRITE = os.getenv("ROLLUP_REWRITE", "true").lower() == "true"
+META_TTL_SECONDS = float(os.getenv("ROLLUP_META_TTL", "60"))
+
+MEASURES = ("installs", "in_app_revenue", "ads_revenue", "ua_cost")
+ROLLUPS = {
+    # monthly per app/platform/country; `date` is the first day of the month
+    "app_metrics_monthly": {"dims": ("app_name", "platform", "country"),
+                            "date_expr": "substr(date,1,7) || '-01'", "monthly": True},
+    # daily per app/platform (no country)
+    "app_metrics_daily": {"dims": ("app_name", "platform"),
+                          "date_expr": "date", "monthly": False},
+}
+ALL_DIMS = ("app_name", "platform", "country")
+CLAUSE_WORDS = ("where", "group", "order", "limit", "union", "except", "intersect", "having", "on")
+
+# ---------- build / refresh ----------
+
+def _ranges(days: Iterable[str], monthly: bool) -> List[Tuple[str, str]]:
+    """Collapse ISO days into (lo, hi) date ranges: whole months for a monthly rollup, else runs of consecutive days."""
+    if monthly:
+        return [(m + "-01", m + "-31") for m in sorted({d[:7] for d in days})]
+    out: List[Tuple[str, str]] = []
+    for d in sorted(set(days)):
+        if out and date.fromisoformat(d) - date.fromisoformat(out[-1][1]) == timedelta(days=1):
+            out[-1] = (out[-1][0], d)
+        else:
+            out.append((d, d))
+    return out
+
+def refresh_rollups(con: sqlite3.Connection, since: Optional[str] = None, full: bool = False,
+                    days: Optional[Iterable[str]] = None) -> Dict[str, int]:
+    """Re-aggregate app_metrics into the rollup tables.
+
+    Without `since`, each rollup is refreshed from its own latest period, so
+    only the tail (plus newly loaded days) is recomputed. `days` refreshes
+    just the periods containing those days (what an ingest touched), and
+    `full=True` rebuilds everything. Returns row counts per rollup.
+    """
+    counts = {}
+    days = list(days) if days is not None else None
+    with con:
+        for name, spec in ROLLUPS.items():
+            if days is not None:
+                ranges = _ranges(days, spec["monthly"])
+            else:
+                lo = None if full else since
+                if lo is None and not full:
+                    lo = con.execute(f"SELECT MAX(date) FROM {name}").fetchone()[0]
+                if lo and spec["monthly"]:
+                    lo = lo[:7] + "-01"
+                ranges = [(lo, "9999-12-31")] if lo else [None]
+            dims = ", ".join(spec["dims"])
+            for rng in ranges:
+                where, params = ("WHERE date BETWEEN ? AND ?", rng) if rng else ("", ())
+                con.execute(f"DELETE FROM {name} {where}", params)
+                con.execute(
+                    f"INSERT INTO {name} ({dims}, date, {', '.join(MEASURES)}) "
+                    f"SELECT {dims}, {spec['date_expr']}, {', '.join(f'SUM({m})' for m in MEASURES)} "
+                    f"FROM app_metrics {where} GROUP BY {dims}, {spec['date_expr']}",
+                    params,
+                )
+            counts[name] = con.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0]
+            con.execute("INSERT OR REPLACE INTO rollup_meta (name, row_count, refreshed_at) "
+                        "VALUES (?, ?, datetime('now'))", (name, counts[name]))
+    scope = "full" if full else (f"{len(days)} days" if days is not None else f"since={since or 'tail'}")
+    logger.info("[sql] rollups refreshed (%s): %s", scope, counts)
+    return counts
+
+# ---------- exactness checks ----------
+
+def _depths(tokens: List[Token]) -> List[int]:
+    out, cur = [], 0
+    for t in tokens:
+        if t.text == "(":
+            out.append(cur); cur += 1
+        elif t.text == ")":
+            cur -= 1; out.append(cur)
+        else:
+            out.append(cur)
+    return out
+
+def _is_column(tokens: List[Token], i: int) -> bool:
+    # an identifier that is not a function call and not an alias definition
+    nxt = tokens[i + 1] if i + 1 < len(tokens) else None
+    prev = tokens[i - 1] if i > 0 else None
+    if nxt is not None and nxt.text in ("(", "."):
+        return False
+    return not (prev is not None and prev.is_("as"))
+
+def _month_start(s: str) -> bool:
+    return bool(re.fullmatch(r"\d{4}-\d{2}-01", s))
+
+def _month_end(s: str) -> bool:
+    m = re.fullmatch(r"(\d{4})-(\d{2})-(\d{2})", s)
+    return bool(m) and 1 <= int(m[2]) <= 12 and int(m[3]) == calendar.monthrange(int(m[1]), int(m[2]))[1]
+
+def _month_aligned_now(args: List[Token]) -> bool:
+    # date('now', 'start of month' [, '-N month'...]) always lands on a month start
+    vals = [literal(t) for t in args if t.kind == "str"]
+    if len(vals) != len([t for t in args if t.text != ","]) or not vals or vals[0] != "now":
+        return False
+    mods = [v.strip().lower() for v in vals[1:]]
+    if not any(m in ("start of month", "start of year") for m in mods):
+        return False
+    return all(m in ("start of month", "start of year") or re.fullmatch(r"[+-]?\d+ (months?|years?)", m) for m in mods)
+
+def _aligned_date_predicate(tokens: List[Token], i: int) -> bool:
+    """`date <op> X` whose truth is constant within each calendar month."""
+    rest = tokens[i + 1:i + 5]
+    if not rest:
+        return False
+    op = rest[0]
+    if op.is_("between") and len(rest) == 4:
+        lo, kw, hi = rest[1], rest[2], rest[3]
+        return (lo.kind == "str" and kw.is_("and") and hi.kind == "str"
+                and _month_start(literal(lo)) and _month_end(literal(hi)))
+    if op.text not in (">=", "<", ">", "<=") or len(rest) < 2:
+        return False
+    val = rest[1]
+    if val.kind == "str":
+        return _month_start(literal(val)) if op.text in (">=", "<") else _month_end(literal(val))
+    if val.is_("date") and op.text in (">=", "<") and i + 3 < len(tokens) and tokens[i + 3].text == "(":
+        close = match_paren(tokens, i + 3)
+        return _month_aligned_now(tokens[i + 4:close])
+    return False
+
+def _linear_sum(inner: List[Token]) -> bool:
+    """SUM(...) argument is a linear combination of measures, so SUM over a rollup is exact."""
+    cond = False
+    for j, t in enumerate(inner):
+        if t.is_("when"):
+            cond = True
+            continue
+        if t.is_("then"):
+            cond = False
+            continue
+        if cond:
+            if t.kind == "ident" and t.low in MEASURES:
+                return False
+            continue
+        if t.kind == "ident" and (t.low in MEASURES or t.low in ("case", "else", "end", "null")):
+            continue
+        if t.kind == "ident" and j + 1 < len(inner) and inner[j + 1].text == ".":
+            continue
+        if t.kind == "op" and t.text in ("+", "-", "(", ")", "."):
+            continue
+        if t.kind == "num" and float(t.text) == 0:
+            continue
+        return False
+    return True
+
+def _aggregating_scope(tokens: List[Token], depths: List[int], i: int) -> bool:
+    # the SELECT that reads app_metrics at tokens[i] must collapse rows
+    d = depths[i]
+    k = i - 1
+    while k >= 0 and not (depths[k] == d and tokens[k].is_("select")):
+        k -= 1
+    if k < 0:
+        return False
+    if tokens[k + 1].is_("distinct"):
+        return True
+    for m in range(k + 1, i):
+        if (depths[m] == d and tokens[m].is_("sum", "total", "count", "min", "max")
+                and tokens[m + 1].text == "("):
+            return True
+    for m in range(i + 1, len(tokens)):
+        if depths[m] < d:
+            break
+        if depths[m] == d and tokens[m].is_("group"):
+            return True
+    return False
+
+def answerable(tokens: List[Token], name: str) -> bool:
+    """True if swapping app_metrics for rollup `name` yields the exact same result."""
+    spec = ROLLUPS[name]
+    if not any(t.is_("app_metrics") for t in tokens):
+        return False
+    if any(t.is_("join", "over", "window") for t in tokens):
+        return False
+    depths = _depths(tokens)
+    n = len(tokens)
+
+    for i, t in enumerate(tokens):
+        if not t.is_("app_metrics") or (i + 1 < n and tokens[i + 1].text == "."):
+            continue
+        if i == 0 or not tokens[i - 1].is_("from"):
+            return False
+        j = i + 1
+        if j < n and tokens[j].is_("as"):
+            j += 1
+        if j < n and tokens[j].kind == "ident" and not tokens[j].is_(*CLAUSE_WORDS):
+            j += 1
+        if j < n and tokens[j].text == ",":
+            return False
+        if not _aggregating_scope(tokens, depths, i):
+            return False
+
+    in_sum = [False] * n
+    for i, t in enumerate(tokens):
+        if t.is_("sum", "total") and i + 1 < n and tokens[i + 1].text == "(":
+            close = match_paren(tokens, i + 1)
+            if not _linear_sum(tokens[i + 2:close]):
+                return False
+            for j in range(i + 2, close):
+                in_sum[j] = True
+        if t.is_("count") and i + 2 < n and tokens[i + 1].text == "(" and not tokens[i + 2].is_("distinct"):
+            return False
+
+    aliases = {tokens[i + 1].low for i, t in enumerate(tokens[:-1]) if t.is_("as")}
+    order_at = next((i for i, t in enumerate(tokens) if t.is_("order")), n)
+    missing = set(ALL_DIMS) - set(spec["dims"])
+    for i, t in enumerate(tokens):
+        if t.kind != "ident" or not _is_column(tokens, i):
+            continue
+        if t.low in MEASURES and not in_sum[i]:
+            if not (t.low in aliases and i > order_at):
+                return False
+        if t.low in missing:
+            return False
+        if t.low == "date" and spec["monthly"] and not _aligned_date_predicate(tokens, i):
+            return False
+    return True
+
+# ---------- rewriting ----------
+
+_sizes_lock = threading.Lock()
+_sizes: Dict[str, Tuple[float, Dict[str, int]]] = {}  # resolved db path -> (read at, sizes)
+
+def rollup_sizes(con: sqlite3.Connection, db_path: str) -> Dict[str, int]:
+    """Row counts of built rollups (from rollup_meta) in the DB at db_path, cached briefly."""
+    key = os.path.realpath(db_path)
+    with _sizes_lock:
+        hit = _sizes.get(key)
+        if hit and time.time() - hit[0] < META_TTL_SECONDS:
+            return hit[1]
+        try:
+            rows = con.execute("SELECT name, row_count FROM rollup_meta").fetchall()
+            sizes = {name: cnt for name, cnt in rows if name in ROLLUPS and cnt > 0}
+        except sqlite3.Error:
+            sizes = {}
+        _sizes[key] = (time.time(), sizes)
+        return sizes
+
+def choose_rollup(sql: str, sizes: Dict[str, int]) -> Optional[str]:
+    try:
+        tokens = tokenize(sql)
+    except ValueError:
+        return None
+    fits = [name for name in sizes if answerable(tokens, name)]
+    return min(fits, key=lambda name: sizes[name]) if fits else None
+
+def rewrite_for_rollup(sql: str, con: sqlite3.Connection, db_path: str) -> str:
+    """Point the query at the smallest rollup that answers it exactly, else return it unchanged."""
+    name = choose_rollup(sql, rollup_sizes(con, db_path))
+    if not name:
+        return sql
+    out, pos = [], 0
+    for t in tokenize(sql):
+        if t.is_("app_metrics"):
+            out.append(sql[pos:t.start])
+            out.append(name)
+            pos = t.start + len(t.text)
+    out.append(sql[pos:])
+    logger.info("[sql] rewrote query to rollup %s", name)
+    return "".join(out)
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    con = sqlite3.connect(os.getenv("DB_PATH", "data/rounds.db"))
+    print(refresh_rollups(con, full="--full" in sys.argv))
+    con.close()
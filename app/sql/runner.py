@@ -1,11 +1,18 @@
-import os, re, sqlite3, pandas as pd
+import os, re, pandas as pd
+from typing import Iterator, Optional, Sequence
 from dotenv import load_dotenv
+from .engines import get_engine
+from ..services.cache import ResultCache
 
 load_dotenv()
 
 DB_PATH = os.getenv("DB_PATH", "data/rounds.db")
 ALLOWED_TABLES = {"app_metrics"}
 BLOCKED = re.compile(r";|--|/\*|\*/", re.IGNORECASE)
+RESULT_CACHE = os.getenv("RESULT_CACHE", "true").lower() == "true"
+
+# Second-level cache: identical SQL from any thread/channel runs once per data version
+result_cache = ResultCache(max_bytes=int(os.getenv("RESULT_CACHE_MAX_MB", "256")) * 1024 * 1024)
 
 # Keep comments/multi-statements blocked, but allow ONE trailing semicolon
 def _sanitize(sql: str) -> str:
@@ -24,11 +31,26 @@ def _sanitize(sql: str) -> str:
     # You can expand this if you add more tables later.
     return sql
 
-def run_sql(sql: str) -> pd.DataFrame:
+def data_version() -> str:
+    """Stamp of the data run_sql currently reads (changes on every load)."""
+    return get_engine().data_version()
+
+def stream_sql(sql: str, chunk_rows: int = 50000, params: Optional[Sequence] = None) -> Iterator[pd.DataFrame]:
+    """Yield the result in DataFrame chunks straight off the cursor (bypasses the result cache).
+
+    Exports are meant to be large, so only the plan cost check and a longer
+    deadline apply here, not the LIMIT or the row/byte caps.
+    """
+    return get_engine().stream(_sanitize(sql), params, chunk_rows)
+
+def run_sql(sql: str, params: Optional[Sequence] = None) -> pd.DataFrame:
+    """Execute a read-only query with optional bound `?` params.
+
+    The returned DataFrame may be shared via the result cache; don't mutate it.
+    """
     sql = _sanitize(sql)
-    con = sqlite3.connect(DB_PATH)
-    try:
-        df = pd.read_sql_query(sql, con)
-    finally:
-        con.close()
-    return df
\ No newline at end of file
+    engine = get_engine()
+    if not RESULT_CACHE:
+        return engine.read(sql, params)
+    version = engine.data_version()
+    return result_cache.get_or_compute(sql, version, lambda: engine.read(sql, params), params=params)
@@ -8,3 +8,61 @@ CREATE TABLE IF NOT EXISTS app_metrics (
   ads_revenue REAL NOT NULL,
   ua_cost REAL NOT NULL
 );
+
+-- Natural key: one row per app/platform/day/country
+CREATE UNIQUE INDEX IF NOT EXISTS ux_app_metrics_key
+  ON app_metrics (app_name, platform, date, country);
+
+-- Covering indexes for the canned rules/few-shots (SQLite has no INCLUDE,
+-- so the measured columns are appended to the key)
+CREATE INDEX IF NOT EXISTS idx_app_metrics_platform_date_app
+  ON app_metrics (platform, date, app_name, installs);
+CREATE INDEX IF NOT EXISTS idx_app_metrics_date_country
+  ON app_metrics (date, country, platform, app_name, installs, in_app_revenue, ads_revenue, ua_cost);
+CREATE INDEX IF NOT EXISTS idx_app_metrics_country_date_app
+  ON app_metrics (country, date, app_name, installs);
+CREATE INDEX IF NOT EXISTS idx_app_metrics_country_revenue
+  ON app_metrics (country, in_app_revenue, ads_revenue);
+CREATE INDEX IF NOT EXISTS idx_app_metrics_app_date_ua
+  ON app_metrics (app_name, date, ua_cost);
+
+-- Rollups maintained by app/sql/rollups.py. Column names mirror app_metrics
+-- so queries can be rewritten by swapping the table name; in the monthly
+-- rollup `date` holds the first day of the month.
+CREATE TABLE IF NOT EXISTS app_metrics_monthly (
+  app_name TEXT NOT NULL,
+  platform TEXT NOT NULL,
+  country TEXT NOT NULL,
+  date TEXT NOT NULL, -- YYYY-MM-01
+  installs INTEGER NOT NULL,
+  in_app_revenue REAL NOT NULL,
+  ads_revenue REAL NOT NULL,
+  ua_cost REAL NOT NULL,
+  PRIMARY KEY (app_name, platform, country, date)
+);
+
+CREATE TABLE IF NOT EXISTS app_metrics_daily (
+  app_name TEXT NOT NULL,
+  platform TEXT NOT NULL,
+  date TEXT NOT NULL,
+  installs INTEGER NOT NULL,
+  in_app_revenue REAL NOT NULL,
+  ads_revenue REAL NOT NULL,
+  ua_cost REAL NOT NULL,
+  PRIMARY KEY (app_name, platform, date)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_meta (
+  name TEXT PRIMARY KEY,
+  row_count INTEGER NOT NULL,
+  refreshed_at TEXT NOT NULL
+);
+
+-- Single-row counter bumped on every successful data load; result caches
+-- and rollups key on it (app/sql/data_version.py)
+CREATE TABLE IF NOT EXISTS data_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version INTEGER NOT NULL,
+  updated_at TEXT NOT NULL
+);
+INSERT OR IGNORE INTO data_version (id, version, updated_at) VALUES (1, 0, datetime('now'));
@@ -0,0 +1,32 @@
+-- Postgres schema for DB_ENGINE=postgres (loaded by `python -m app.sql.engines load`).
+-- Mirrors schema.sql; `date` is a real DATE here, and rollups are left to the
+-- SQLite engine.
+CREATE TABLE IF NOT EXISTS app_metrics (
+  app_name TEXT NOT NULL,
+  platform TEXT NOT NULL CHECK (platform IN ('iOS','Android')),
+  date DATE NOT NULL,
+  country TEXT NOT NULL,
+  installs INTEGER NOT NULL,
+  in_app_revenue DOUBLE PRECISION NOT NULL,
+  ads_revenue DOUBLE PRECISION NOT NULL,
+  ua_cost DOUBLE PRECISION NOT NULL
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_app_metrics_key
+  ON app_metrics (app_name, platform, date, country);
+
+CREATE INDEX IF NOT EXISTS idx_app_metrics_platform_date_app
+  ON app_metrics (platform, date, app_name) INCLUDE (installs);
+CREATE INDEX IF NOT EXISTS idx_app_metrics_date_country
+  ON app_metrics (date, country) INCLUDE (platform, app_name, installs, in_app_revenue, ads_revenue, ua_cost);
+CREATE INDEX IF NOT EXISTS idx_app_metrics_country_date_app
+  ON app_metrics (country, date, app_name) INCLUDE (installs);
+CREATE INDEX IF NOT EXISTS idx_app_metrics_app_date_ua
+  ON app_metrics (app_name, date) INCLUDE (ua_cost);
+
+CREATE TABLE IF NOT EXISTS data_version (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  version BIGINT NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+INSERT INTO data_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING;
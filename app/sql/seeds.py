@@ -1,7 +1,11 @@
-import os, random, sqlite3, math
+import os, sqlite3, time, argparse, itertools
 from pathlib import Path
-from datetime import date, timedelta
+from datetime import date
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
 from dotenv import load_dotenv
+from .rollups import refresh_rollups
+from .data_version import bump_data_version
 
 DB_PATH = os.getenv("DB_PATH", "data/rounds.db")
 SCHEMA = Path(__file__).with_name("schema.sql").read_text(encoding="utf-8")
@@ -22,17 +26,28 @@ APPS = [
 ]
 
 COUNTRIES = ["US","GB","DE","FR","CA","BR","IN","AU"]
+# used, in order, when more than the demo countries are requested
+MORE_COUNTRIES = ["JP","KR","MX","ES","IT","NL","SE","PL","TR","ID","PH","VN","TH","SA","AE","ZA",
+                  "NG","EG","AR","CL","CO","PE","NZ","IE","BE","AT","CH","DK","NO","FI","PT","GR"]
+
+DEMO_START = date(2024, 12, 1)
+DEMO_END = date(2025, 8, 15)
+BATCH_ROWS = int(os.getenv("SEED_BATCH_ROWS", "200000"))
+INSERT_SQL = ("INSERT INTO app_metrics (app_name, platform, date, country, installs, in_app_revenue, ads_revenue, ua_cost) "
+              "VALUES (?,?,?,?,?,?,?,?)")
 
 def ensure_db():
     Path("data").mkdir(exist_ok=True)
     con = sqlite3.connect(DB_PATH)
+    # WAL is persistent in the file, so the read-only pool in runner.py inherits it
+    con.execute("PRAGMA journal_mode=WAL")
     with con:
         con.executescript(SCHEMA)
     con.close()
 
 def seasonality(day_idx):
-    # Weekly seasonality + mild monthly trend
-    return 1.0 + 0.15*math.sin(2*math.pi*(day_idx%7)/7.0) + 0.05*math.sin(2*math.pi*(day_idx%30)/30.0)
+    # Weekly seasonality + mild monthly trend (scalar or array)
+    return 1.0 + 0.15*np.sin(2*np.pi*(day_idx%7)/7.0) + 0.05*np.sin(2*np.pi*(day_idx%30)/30.0)
 
 def base_installs(app, platform):
     base_map = {
@@ -49,39 +64,118 @@ def base_installs(app, platform):
         base = int(base * 0.9)
     return base
 
-def run():
-    ensure_db()
-    con = sqlite3.connect(DB_PATH)
-    cur = con.cursor()
-    cur.execute("DELETE FROM app_metrics")
-    start = date(2024, 12, 1)
-    end = date(2025, 8, 15)
-    all_rows = []
-    day_idx = 0
-    random.seed(42)
-
-    for app_name, platform in APPS:
-        for c in COUNTRIES:
-            d = start
-            while d <= end:
-                s = seasonality(day_idx)
-                inst = max(0, int(base_installs(app_name, platform) * s * random.uniform(0.8, 1.3)))
-                # revenue mix
-                iap = round(inst * random.uniform(0.05, 0.18), 2)
-                ads = round(inst * random.uniform(0.02, 0.12), 2)
-                ua = round(inst * random.uniform(0.02, 0.16), 2)
-                all_rows.append((app_name, platform, d.isoformat(), c, inst, iap, ads, ua))
-                d += timedelta(days=1)
-                day_idx += 1
-
-    cur.executemany(
-        "INSERT INTO app_metrics (app_name, platform, date, country, installs, in_app_revenue, ads_revenue, ua_cost) VALUES (?,?,?,?,?,?,?,?)",
-        all_rows
-    )
-    con.commit()
+def scaled_apps(n: int) -> List[Tuple[str, str]]:
+    """The demo app/platform pairs, then synthetic "App 013"-style apps alternating platforms."""
+    extra = [(f"App {i // 2 + 1:03d}", "Android" if i % 2 == 0 else "iOS") for i in range(max(0, n - len(APPS)))]
+    return (APPS + extra)[:n]
+
+def scaled_countries(n: int) -> List[str]:
+    codes = COUNTRIES + MORE_COUNTRIES
+    taken = set(codes)
+    codes += ["".join(p) for p in itertools.product("ABCDEFGHIJKLMNOPQRSTUVWXYZ", repeat=2) if "".join(p) not in taken]
+    return codes[:n]
+
+def generate_batches(apps: List[Tuple[str, str]], countries: List[str], start: date, days: int,
+                     seed: int = 42, batch_rows: int = BATCH_ROWS) -> Iterator[List[tuple]]:
+    """Yield row tuples in batches of about batch_rows, one day (every app x country) at a time.
+
+    Each day draws from its own generator seeded by (seed, day), so the data
+    depends only on the seed and the scale, never on the batch size.
+    """
+    app_names = np.array([a for a, _ in apps], dtype=object)
+    platforms = np.array([p for _, p in apps], dtype=object)
+    n_series = len(apps) * len(countries)
+    names = np.repeat(app_names, len(countries)).tolist()
+    plats = np.repeat(platforms, len(countries)).tolist()
+    ctry = np.tile(np.array(countries, dtype=object), len(apps)).tolist()
+    base = np.repeat(np.array([base_installs(a, p) for a, p in apps], dtype=np.float64), len(countries))
+    # per-series phase so the weekly/monthly cycles don't line up across every app and country
+    phase = np.random.default_rng([seed, 1 << 30]).integers(0, 30, n_series)
+    dates = (np.datetime64(start.isoformat()) + np.arange(days)).astype(str).tolist()
+
+    batch: List[tuple] = []
+    for d in range(days):
+        rng = np.random.default_rng([seed, d])
+        u = rng.random((4, n_series))
+        inst = np.floor(base * seasonality(d + phase) * (0.8 + 0.5 * u[0])).clip(min=0)
+        iap = np.round(inst * (0.05 + 0.13 * u[1]), 2)
+        ads = np.round(inst * (0.02 + 0.10 * u[2]), 2)
+        ua = np.round(inst * (0.02 + 0.14 * u[3]), 2)
+        batch.extend(zip(names, plats, itertools.repeat(dates[d]), ctry,
+                         inst.astype(np.int64).tolist(), iap.tolist(), ads.tolist(), ua.tolist()))
+        if len(batch) >= batch_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _drop_indexes(con: sqlite3.Connection) -> None:
+    # rebuilt from schema.sql after the load: one sort per index beats per-row B-tree updates
+    for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type='index' AND tbl_name='app_metrics' "
+                               "AND sql IS NOT NULL").fetchall():
+        con.execute(f'DROP INDEX "{name}"')
+
+def generate(db_path: str = DB_PATH, apps: int = len(APPS), countries: int = len(COUNTRIES),
+             start: date = DEMO_START, days: Optional[int] = None, seed: int = 42,
+             batch_rows: int = BATCH_ROWS, max_rows: Optional[int] = None) -> int:
+    """(Re)build app_metrics in db_path at the given scale; returns the row count.
+
+    Rows = apps x countries x days (default: the demo 12 x 8 x 258). The load
+    runs with journal_mode=OFF and synchronous=OFF and without indexes; the
+    indexes, rollups, data version and planner stats are rebuilt afterwards
+    and the file is left in WAL mode for the read pool.
+    """
+    days = days if days is not None else (DEMO_END - start).days + 1
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(db_path, isolation_level=None)
+    con.executescript(SCHEMA)
+    con.execute("PRAGMA journal_mode=OFF")
+    con.execute("PRAGMA synchronous=OFF")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA cache_size=-262144")
+    t0 = time.perf_counter()
+    con.execute("BEGIN")
+    con.execute("DELETE FROM app_metrics")
+    _drop_indexes(con)
+    con.execute("COMMIT")
+    n = 0
+    for batch in generate_batches(scaled_apps(apps), scaled_countries(countries), start, days, seed, batch_rows):
+        if max_rows is not None:
+            batch = batch[:max_rows - n]
+        con.execute("BEGIN")
+        con.executemany(INSERT_SQL, batch)
+        con.execute("COMMIT")
+        n += len(batch)
+        if max_rows is not None and n >= max_rows:
+            break
+    loaded = time.perf_counter()
+    con.executescript(SCHEMA)  # indexes
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.isolation_level = ""  # back to implicit transactions for the helpers below
+    refresh_rollups(con, full=True)
+    with con:
+        bump_data_version(con)
+    # refresh planner statistics so the covering indexes get picked
+    con.execute("ANALYZE")
     con.close()
-    print(f"Seeded {len(all_rows)} rows into {DB_PATH}")
+    print(f"Seeded {n} rows into {db_path} (load {loaded - t0:.1f}s, indexes+rollups {time.perf_counter() - loaded:.1f}s)")
+    return n
+
+def run():
+    generate(DB_PATH)
 
 if __name__ == "__main__":
     load_dotenv()
-    run()
+    ap = argparse.ArgumentParser(prog="python -m app.sql.seeds")
+    ap.add_argument("--db", default=os.getenv("DB_PATH", DB_PATH))
+    ap.add_argument("--apps", type=int, default=len(APPS), help="app/platform pairs")
+    ap.add_argument("--countries", type=int, default=len(COUNTRIES))
+    ap.add_argument("--start", default=DEMO_START.isoformat())
+    ap.add_argument("--days", type=int, help="date span (default: through 2025-08-15)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--batch-rows", type=int, default=BATCH_ROWS)
+    ap.add_argument("--max-rows", type=int)
+    args = ap.parse_args()
+    generate(args.db, args.apps, args.countries, date.fromisoformat(args.start), args.days,
+             args.seed, args.batch_rows, args.max_rows)
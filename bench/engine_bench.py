@@ -0,0 +1,91 @@
+"""
+Engine benchmark: the canned SIMPLE_RULES / FEW_SHOTS queries on SQLite vs DuckDB.
+
+    python -m bench.engine_bench [--scales 1e5,1e6] [--repeat 5] [--out data/bench/results/engines.json]
+
+Each scale gets a seeds.py SQLite file under data/bench/ (shared with
+bench.load_test) and a month-partitioned Parquet export beside it. Every query
+runs through Engine.read, as run_sql would, on SQLite with rollup rewriting
+(as deployed), SQLite without it, and DuckDB. The DuckDB result is checked
+to be identical (values and dtypes, up to the order of tied rows) to
+SQLite's before it is timed. Reports the median of --repeat runs after one
+warm-up.
+"""
+import argparse, json, statistics, time
+from pathlib import Path
+import pandas as pd
+from app.sql import engines
+from app.sql.engines import DuckDBEngine, SQLiteEngine, export_columnar
+from app.sql.plan_check import canned_queries
+from app.sql.runner import _sanitize
+from bench.load_test import DATA_DIR, build_db, git_commit
+
+def timed(fn, repeat: int) -> float:
+    fn()
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs) * 1000
+
+def run_sqlite(engine: SQLiteEngine, sql: str, rollups: bool) -> pd.DataFrame:
+    engines.ROLLUP_REWRITE = rollups
+    try:
+        return engine.read(sql)
+    finally:
+        engines.ROLLUP_REWRITE = True
+
+def bench_scale(rows: int, sqls, repeat: int) -> dict:
+    path = build_db(DATA_DIR / f"rounds_{rows}.db", rows)
+    columnar = DATA_DIR / f"columnar_{rows}"
+    export_columnar(str(path), str(columnar))
+    lite, duck = SQLiteEngine(str(path)), DuckDBEngine(str(columnar))
+    out = []
+    for sql in sqls:
+        res = {"sql": sql}
+        a, b = duck.read(sql), run_sqlite(lite, sql, False)
+        try:
+            # rows that tie on ORDER BY may come back in either order
+            pd.testing.assert_frame_equal(*(df.sort_values(list(df.columns), ignore_index=True) for df in (a, b)))
+            res["identical"] = True
+        except AssertionError as e:
+            res["identical"] = False
+            res["diff"] = str(e).splitlines()[0]
+        for name, fn in (("sqlite_ms", lambda: run_sqlite(lite, sql, True)),
+                         ("sqlite_no_rollups_ms", lambda: run_sqlite(lite, sql, False)),
+                         ("duckdb_ms", lambda: duck.read(sql))):
+            try:
+                res[name] = round(timed(fn, repeat), 3)
+            except Exception as e:  # e.g. refused by the cost guard at this scale
+                res[name] = None
+                res.setdefault("errors", {})[name] = str(e)
+        out.append(res)
+    duck.close()
+    return {"queries": out}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scales", default="1e5,1e6")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out")
+    args = ap.parse_args()
+    sqls = list(dict.fromkeys(_sanitize(s) for s in canned_queries()))
+    result = {"commit": git_commit(), "repeat": args.repeat, "scales": {}}
+    for rows in (int(float(x)) for x in args.scales.split(",")):
+        res = bench_scale(rows, sqls, args.repeat)
+        result["scales"][str(rows)] = res
+        print(f"rows={rows}")
+        print(f"  {'sqlite':>9} {'no rollup':>10} {'duckdb':>9} {'x':>7}  same  sql")
+        for q in res["queries"]:
+            a, b, d = q["sqlite_ms"], q["sqlite_no_rollups_ms"], q["duckdb_ms"]
+            fmt = lambda v: f"{v:9.2f}" if v is not None else f"{'-':>9}"
+            speedup = f"{b / d:6.1f}x" if b and d else f"{'-':>7}"
+            print(f"  {fmt(a)} {fmt(b):>10} {fmt(d)} {speedup}  {'yes ' if q['identical'] else 'NO  '}  {q['sql'][:70]}")
+    out = Path(args.out) if args.out else DATA_DIR / "results" / f"engines_{result['commit']}_{int(time.time())}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    print(f"wrote {out} (x = SQLite without rollups / DuckDB)")
+
+if __name__ == "__main__":
+    main()
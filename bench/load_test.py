@@ -0,0 +1,348 @@
+"""
+Load test: replay a question mix through the full answer path and report latency.
+
+    python -m bench.load_test [--scales 1e4,1e5,1e6] [--concurrency 8] [--requests 400]
+                              [--mix mix.json] [--llm-ms 500] [--llm-token-ms 10] [--no-stream] [--pipeline]
+                              [--out data/bench/results/load.json] [--compare old.json]
+
+Drives handlers._handle_query with a fake say/Slack client and a deterministic
+stub in place of the LLM (canned few-shot plans after --llm-ms of "thinking",
+streamed at --llm-token-ms per token).
+Each scale gets its own SQLite file under data/bench/, built once from
+app/sql/seeds.py and reused. Per-stage timings come from the spans in
+app/obs/metrics.py; the report has p50/p95/p99 per stage, per planner path and
+end to end, plus QPS, and is written as JSON so runs from different commits
+can be compared with --compare.
+
+Mix file: [{"weight": 3, "session": ["revenue by country in 2025", "what about iOS?"]}, ...]
+Questions in a session run in order in one thread, so follow-ups see the previous answer.
+"""
+import argparse, hashlib, json, os, random, sqlite3, subprocess, sys, threading, time, types
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+
+DATA_DIR = Path("data/bench")
+
+DEFAULT_MIX = [
+    {"weight": 3, "session": ["how many apps do we have?"]},
+    {"weight": 2, "session": ["which country generates the most revenue?"]},
+    {"weight": 3, "session": ["total revenue by country in 2025"]},
+    {"weight": 2, "session": ["top 5 apps by installs on android in 2025"]},
+    {"weight": 2, "session": ["revenue by month in 2025"]},
+    {"weight": 2, "session": ["revenue by country in 2025", "what about iOS?"]},
+    {"weight": 2, "session": ["which apps are growing fastest in Germany?"]},
+    {"weight": 1, "session": ["compare total revenue vs ua cost by platform this month"]},
+    {"weight": 1, "session": ["hello"]},
+]
+
+PROGRESS_PREFIXES = (":thinking_face:", ":hourglass_flowing_sand:", ":hourglass:")
+
+# ---------- test doubles ----------
+
+class StubChat:
+    """Stands in for langchain_openai.ChatOpenAI: deterministic plans, fixed latency.
+
+    `delay` is the time to the first token, then every ~4 characters of the
+    reply take `token_delay`; stream() yields them as they are "generated".
+    """
+    delay = 0.5
+    token_delay = 0.0
+
+    def __init__(self, model=None, temperature=0.0, **kwargs):
+        pass
+
+    def _reply(self, prompt):
+        from app.nlp.prompts import FEW_SHOTS
+        if not isinstance(prompt, str):  # [(role, text), ...]
+            prompt = "\n\n".join(text for _, text in prompt)
+        question = prompt.rsplit("User: ", 1)[-1].split("\nReturn ONLY", 1)[0].strip()
+        shot = next((s for s in FEW_SHOTS if s["user"].lower() == question.lower()), None)
+        if shot is None:
+            h = int(hashlib.md5(question.encode()).hexdigest(), 16)
+            shot = FEW_SHOTS[h % len(FEW_SHOTS)]
+        content = json.dumps(shot["json"])
+        return content, {"input_tokens": len(prompt) // 4, "output_tokens": len(content) // 4}
+
+    def invoke(self, prompt):
+        content, usage = self._reply(prompt)
+        time.sleep(self.delay + self.token_delay * usage["output_tokens"])
+        return types.SimpleNamespace(content=content, usage_metadata=usage)
+
+    def stream(self, prompt):
+        content, usage = self._reply(prompt)
+        t0 = time.perf_counter() + self.delay
+        for n, i in enumerate(range(0, len(content), 4)):
+            # sleep to each token's deadline so the total matches invoke()
+            time.sleep(max(0.0, t0 + n * self.token_delay - time.perf_counter()))
+            yield types.SimpleNamespace(content=content[i:i + 4], usage_metadata=None)
+        yield types.SimpleNamespace(content="", usage_metadata=usage)
+
+class Completion:
+    """Collects the final reply for each request thread."""
+
+    def __init__(self):
+        self.events = {}
+        self.finals = {}
+        self.lock = threading.Lock()
+
+    def expect(self, thread_ts):
+        with self.lock:
+            self.events[thread_ts] = threading.Event()
+            self.finals.pop(thread_ts, None)
+        return self.events[thread_ts]
+
+    def deliver(self, thread_ts, text):
+        if text is None or str(text).startswith(PROGRESS_PREFIXES):
+            return
+        with self.lock:
+            ev = self.events.get(thread_ts)
+            self.finals[thread_ts] = text
+        if ev:
+            ev.set()
+
+class FakeClient:
+    def __init__(self, done: Completion, latency: float):
+        self.done, self.latency = done, latency
+        self.placeholders = {}
+        self.lock = threading.Lock()
+
+    def chat_postMessage(self, channel, thread_ts=None, text=None, **kwargs):
+        time.sleep(self.latency)
+        ts = f"{thread_ts}.reply"
+        with self.lock:
+            self.placeholders[ts] = thread_ts
+        return {"ok": True, "ts": ts}
+
+    def chat_update(self, channel, ts, text=None, **kwargs):
+        time.sleep(self.latency)
+        with self.lock:
+            thread_ts = self.placeholders.get(ts)
+        self.done.deliver(thread_ts, text)
+        return {"ok": True}
+
+    def files_upload_v2(self, **kwargs):
+        return {"ok": True}
+
+def make_say(done: Completion, latency: float):
+    def say(text=None, thread_ts=None, **kwargs):
+        time.sleep(latency)
+        done.deliver(thread_ts, text)
+    return say
+
+# ---------- databases ----------
+
+def build_db(path: Path, rows: int) -> Path:
+    """A seeds.py database with exactly `rows` rows of app_metrics (reused if already built)."""
+    if path.exists():
+        try:
+            with sqlite3.connect(path) as con:
+                if con.execute("SELECT COUNT(*) FROM app_metrics").fetchone()[0] == rows:
+                    return path
+        except sqlite3.Error:
+            pass
+        path.unlink()
+    from app.sql import seeds
+    # the demo span and countries, with as many apps as it takes to reach `rows`
+    days = (seeds.DEMO_END - seeds.DEMO_START).days + 1
+    countries = len(seeds.COUNTRIES)
+    apps = max(1, -(-rows // (days * countries)))
+    seeds.generate(str(path), apps=apps, countries=countries, days=days, max_rows=rows)
+    return path
+
+def use_db(path: Path):
+    """Point run_sql at another database and drop every cache tied to the old one."""
+    from app.sql import engines, runner, data_version, rollups, cost_guard
+    os.environ["DB_PATH"] = str(path)
+    runner.DB_PATH = str(path)
+    engines._engine = None
+    data_version._cached.clear()
+    rollups._sizes.clear()
+    cost_guard._stats_cache.clear()
+    runner.result_cache.clear()
+
+# ---------- run ----------
+
+class StageRecorder:
+    """Keeps every raw observation of the span histograms, for exact percentiles."""
+
+    def __init__(self):
+        from app.obs import metrics
+        self.samples = defaultdict(list)
+        self.lock = threading.Lock()
+        for hist, key in ((metrics.STAGE_SECONDS, "stage"), (metrics.PLAN_SECONDS, "path")):
+            self._wrap(hist, key)
+
+    def _wrap(self, hist, key):
+        original = hist.observe
+
+        def observe(value, **labels):
+            original(value, **labels)
+            with self.lock:
+                self.samples[(key, labels.get(key, ""))].append(value)
+        hist.observe = observe
+
+    def reset(self):
+        with self.lock:
+            self.samples.clear()
+
+def summarize(values) -> dict:
+    a = np.asarray(values, dtype=float) * 1000
+    if not len(a):
+        return {"count": 0}
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"count": int(len(a)), "mean_ms": round(float(a.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(a.max()), 3)}
+
+def sessions(mix, n_requests: int, seed: int):
+    """Weighted, seeded sequence of sessions adding up to at least n_requests questions."""
+    rnd = random.Random(seed)
+    weights = [m.get("weight", 1) for m in mix]
+    out, total = [], 0
+    while total < n_requests:
+        s = rnd.choices(mix, weights)[0]["session"]
+        out.append(s)
+        total += len(s)
+    return out
+
+def run_scale(args, mix, recorder, done) -> dict:
+    from app import handlers
+    app = types.SimpleNamespace(client=FakeClient(done, args.slack_ms / 1000))
+    say = make_say(done, args.slack_ms / 1000)
+    latencies, outcomes = [], defaultdict(int)
+    lock = threading.Lock()
+    counter = iter(range(10**9))
+
+    def play(i, session):
+        user = f"U{i % args.concurrency}"
+        thread = f"{time.time():.6f}.{next(counter)}"
+        for question in session:
+            ev = done.expect(thread)
+            t0 = time.perf_counter()
+            handlers._handle_query(app, say, "CBENCH", thread, user, question)
+            ok = ev.wait(args.timeout)
+            dt = time.perf_counter() - t0
+            final = str(done.finals.get(thread, ""))
+            outcome = ("timeout" if not ok else "rejected" if any(w in final.lower() for w in ("try again", "ask again"))
+                       else "error" if final.startswith(("Sorry", ":octagonal_sign:")) else "ok")
+            with lock:
+                latencies.append(dt)
+                outcomes[outcome] += 1
+
+    work = sessions(mix, args.requests, args.seed)
+    # warm-up: one pass over the distinct questions, not measured
+    for s in {tuple(m["session"]) for m in mix}:
+        play(0, list(s))
+    recorder.reset()
+    with lock:
+        latencies.clear()
+        outcomes.clear()
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
+        list(ex.map(lambda p: play(*p), enumerate(work)))
+    wall = time.perf_counter() - t0
+
+    with recorder.lock:
+        samples = {k: list(v) for k, v in recorder.samples.items()}
+    return {
+        "requests": len(latencies),
+        "wall_seconds": round(wall, 3),
+        "qps": round(len(latencies) / wall, 2) if wall else None,
+        "outcomes": dict(outcomes),
+        "end_to_end": summarize(latencies),
+        "stages": {name: summarize(v) for (kind, name), v in sorted(samples.items()) if kind == "stage"},
+        "plan_paths": {name: summarize(v) for (kind, name), v in sorted(samples.items()) if kind == "path"},
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+def compare(current: dict, baseline: dict):
+    """Print p50/p95/p99 and QPS changes against a previous result file."""
+    print(f"\ncompared with {baseline.get('commit')} ({baseline.get('started')})")
+    for scale, cur in current["scales"].items():
+        old = baseline.get("scales", {}).get(scale)
+        if not old:
+            continue
+        print(f"rows={scale}: qps {old['qps']} -> {cur['qps']}")
+        rows = [("end_to_end", cur["end_to_end"], old["end_to_end"])]
+        rows += [(f"stage:{k}", v, old["stages"].get(k, {})) for k, v in cur["stages"].items()]
+        rows += [(f"path:{k}", v, old["plan_paths"].get(k, {})) for k, v in cur["plan_paths"].items()]
+        for name, new, prev in rows:
+            cells = []
+            for p in ("p50_ms", "p95_ms", "p99_ms"):
+                if p in new and prev.get(p):
+                    cells.append(f"{p[:3]} {prev[p]:.1f}->{new[p]:.1f} ({(new[p] / prev[p] - 1) * 100:+.0f}%)")
+            if cells:
+                print(f"  {name:<24} " + "  ".join(cells))
+
+def main():
+    ap = argparse.ArgumentParser(prog="python -m bench.load_test")
+    ap.add_argument("--scales", default="1e4,1e5,1e6", help="app_metrics row counts, e.g. 1e4,1e6,1e8")
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=400, help="questions per scale")
+    ap.add_argument("--mix", help="JSON file of weighted question sessions")
+    ap.add_argument("--llm-ms", type=float, default=500, help="stub LLM latency to the first token")
+    ap.add_argument("--llm-token-ms", type=float, default=0, help="stub LLM time per output token (~4 chars)")
+    ap.add_argument("--no-stream", action="store_true", help="plan from the whole completion (LLM_STREAMING=false)")
+    ap.add_argument("--slack-ms", type=float, default=0, help="fake Slack API latency per call")
+    ap.add_argument("--pipeline", action="store_true", help="answer through the worker pipeline (placeholder + updates)")
+    ap.add_argument("--plan-cache", action="store_true", help="keep the LLM plan cache on")
+    ap.add_argument("--timeout", type=float, default=120)
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", help="result JSON path (default data/bench/results/load_<commit>_<time>.json)")
+    ap.add_argument("--compare", help="previous result JSON to diff against")
+    args = ap.parse_args()
+
+    scales = [int(float(s)) for s in args.scales.split(",")]
+    mix = json.loads(Path(args.mix).read_text()) if args.mix else DEFAULT_MIX
+
+    # configure before the app modules read their environment
+    os.environ["DB_PATH"] = str(DATA_DIR / f"rounds_{scales[0]}.db")
+    os.environ["PIPELINE_ENABLED"] = "true" if args.pipeline else "false"
+    os.environ["PIPELINE_PER_USER"] = os.environ.get("PIPELINE_PER_USER", "2")
+    os.environ["PLAN_CACHE_ENABLED"] = "true" if args.plan_cache else "false"
+    os.environ.setdefault("OPENAI_API_KEY", "bench-stub")
+    os.environ["LLM_STREAMING"] = "false" if args.no_stream else "true"
+    StubChat.delay = args.llm_ms / 1000
+    StubChat.token_delay = args.llm_token_ms / 1000
+    sys.modules["langchain_openai"] = types.SimpleNamespace(ChatOpenAI=StubChat)
+    from app.nlp import agent
+    agent.USE_OPENAI = True
+
+    recorder = StageRecorder()
+    done = Completion()
+    result = {"commit": git_commit(), "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+              "mix": mix, "scales": {}}
+    for rows in scales:
+        t0 = time.perf_counter()
+        path = build_db(DATA_DIR / f"rounds_{rows}.db", rows)
+        print(f"rows={rows}: database ready in {time.perf_counter() - t0:.1f}s ({path})", flush=True)
+        use_db(path)
+        res = run_scale(args, mix, recorder, done)
+        result["scales"][str(rows)] = res
+        e2e = res["end_to_end"]
+        print(f"rows={rows}: {res['requests']} requests, {res['qps']} qps, "
+              f"p50 {e2e['p50_ms']:.1f}ms p95 {e2e['p95_ms']:.1f}ms p99 {e2e['p99_ms']:.1f}ms {res['outcomes']}")
+        for name, s in res["stages"].items():
+            print(f"    {name:<16} p50 {s['p50_ms']:>9.2f}ms  p95 {s['p95_ms']:>9.2f}ms  p99 {s['p99_ms']:>9.2f}ms  n={s['count']}")
+
+    out = Path(args.out) if args.out else DATA_DIR / "results" / f"load_{result['commit']}_{int(time.time())}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+    print(f"wrote {out}")
+    if args.compare:
+        compare(result, json.loads(Path(args.compare).read_text()))
+    if args.pipeline:
+        from app.handlers import pipeline
+        pipeline.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Micro-benchmark: per-message intent routing cost as the rule set grows.
+
+    python -m bench.router_bench [--sizes 10,50,100,250,500,1000] [--messages 2000]
+
+Compares the combined IntentRouter against checking each compiled pattern
+with re.search in turn (the previous approach). Synthetic rules look like
+the real ones ("how many <word> apps", "top <n> ... in <country>").
+"""
+import argparse, random, re, time
+from app.nlp.agent import ROUTER, route
+from app.nlp.router import IntentRouter
+
+WORDS = ["revenue", "installs", "spend", "retention", "churn", "sessions", "ratings", "crashes",
+         "downloads", "refunds", "trials", "subs", "ads", "ua", "cohort", "ltv", "arpu", "dau"]
+
+def synthetic_rules(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    rules = []
+    for i in range(n):
+        a, b = rnd.sample(WORDS, 2)
+        rules.append(("rule", rf"\b{a}\b.*\b{b}\s+by\s+(app|country|platform)\s*#?{i}\b", i))
+    return rules
+
+def messages(n: int, seed: int = 11):
+    rnd = random.Random(seed)
+    base = ["how many apps do we have?", "which country generates the most revenue?",
+            "what about ios?", "show me the sql", "export this as csv",
+            "top 3 apps by installs in the last 14 days in US"]
+    out = []
+    for _ in range(n):
+        a, b = rnd.sample(WORDS, 2)
+        out.append(rnd.choice(base) if rnd.random() < 0.5 else f"{a} vs {b} by country #{rnd.randint(0, 1500)}")
+    return out
+
+def bench(fn, msgs) -> float:
+    t0 = time.perf_counter()
+    for m in msgs:
+        fn(m)
+    return (time.perf_counter() - t0) / len(msgs) * 1e6
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="10,50,100,250,500,1000")
+    ap.add_argument("--messages", type=int, default=2000)
+    args = ap.parse_args()
+    msgs = messages(args.messages)
+
+    print(f"production router ({len(ROUTER.rules)} rules): {bench(route, msgs):.1f} us/msg")
+    print(f"{'rules':>6} {'combined us/msg':>16} {'sequential us/msg':>18}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        rules = synthetic_rules(n)
+        router = IntentRouter(rules)
+        compiled = [(re.compile(p, re.I), payload) for _, p, payload in rules]
+
+        def sequential(text):
+            for pat, payload in compiled:
+                if pat.search(text):
+                    return payload
+            return None
+
+        print(f"{n:>6} {bench(router.route, msgs):>16.1f} {bench(sequential, msgs):>18.1f}")
+
+if __name__ == "__main__":
+    main()
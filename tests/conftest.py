@@ -0,0 +1,12 @@
+from datetime import date
+
+import pytest
+
+from app.sql.seeds import generate
+
+@pytest.fixture
+def seeded_db(tmp_path):
+    """A small demo database: 3 apps x 2 countries x 10 days."""
+    path = str(tmp_path / "rounds.db")
+    generate(path, apps=3, countries=2, start=date(2025, 1, 1), days=10)
+    return path
@@ -0,0 +1,55 @@
+import sqlite3, threading
+
+import pytest
+
+from app.sql.cost_guard import (QueryAborted, cancel_scope, deadline, ensure_limit, has_outer_limit, plan_cost,
+                                read_capped)
+
+@pytest.mark.parametrize("sql,expected", [
+    ("SELECT * FROM app_metrics", False),
+    ("SELECT * FROM app_metrics LIMIT 5", True),
+    ("select * from app_metrics limit 5 offset 10", True),
+    ("SELECT * FROM (SELECT * FROM app_metrics LIMIT 5) t", False),
+    ("SELECT app_name FROM app_metrics WHERE app_name IN (SELECT app_name FROM app_metrics LIMIT 3)", False),
+    ("SELECT 'limit' AS word FROM app_metrics", False),
+])
+def test_has_outer_limit(sql, expected):
+    assert has_outer_limit(sql) is expected
+
+def test_ensure_limit_only_adds_missing_outer_limit():
+    assert ensure_limit("SELECT * FROM app_metrics", 11) == "SELECT * FROM app_metrics LIMIT 11"
+    assert ensure_limit("SELECT * FROM app_metrics LIMIT 3", 11) == "SELECT * FROM app_metrics LIMIT 3"
+    sub = "SELECT * FROM (SELECT * FROM app_metrics LIMIT 3) t"
+    assert ensure_limit(sub, 11) == sub + " LIMIT 11"
+
+@pytest.fixture
+def con():
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE app_metrics (app_name TEXT, installs INTEGER)")
+    con.executemany("INSERT INTO app_metrics VALUES (?, ?)", [(f"app{i}", i) for i in range(20)])
+    yield con
+    con.close()
+
+def test_unbounded_result_over_the_cap_is_refused_not_truncated(con):
+    sql = ensure_limit("SELECT * FROM app_metrics", 10 + 1)
+    with pytest.raises(QueryAborted) as e:
+        read_capped(con.execute(sql), max_rows=10)
+    assert e.value.kind == "rows"
+
+def test_result_at_the_cap_is_returned_whole(con):
+    sql = ensure_limit("SELECT * FROM app_metrics WHERE installs < 10", 10 + 1)
+    assert len(read_capped(con.execute(sql), max_rows=10)) == 10
+    assert list(read_capped(con.execute("SELECT * FROM app_metrics WHERE 0")).columns) == ["app_name", "installs"]
+
+def test_plan_cost_multiplies_nested_loops():
+    plan = [(2, 0, "SCAN a"), (3, 0, "SEARCH b USING INDEX ix_b (k=?)")]
+    assert plan_cost(plan, {"a": 100, "b": 1000}, {"ix_b": [1000, 10]}) == 100 + 100 * 10
+
+def test_cancel_scope_interrupts_a_running_query(con):
+    cancel = threading.Event()
+    endless = "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n"
+    threading.Timer(0.05, cancel.set).start()
+    with cancel_scope(cancel), pytest.raises(QueryAborted) as e:
+        with deadline(con, 30):
+            con.execute(endless).fetchone()
+    assert e.value.kind == "cancelled"
@@ -0,0 +1,42 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from app.services import csv_export
+from app.services.csv_export import stream_export, strip_outer_limit
+from app.sql.engines import SQLiteEngine
+
+@pytest.mark.parametrize("sql,expected", [
+    ("SELECT * FROM app_metrics LIMIT 50", "SELECT * FROM app_metrics"),
+    ("SELECT * FROM app_metrics LIMIT 50 OFFSET 10;", "SELECT * FROM app_metrics"),
+    ("SELECT * FROM app_metrics LIMIT 10, 50", "SELECT * FROM app_metrics"),
+    ("SELECT * FROM (SELECT * FROM app_metrics LIMIT 5) t", "SELECT * FROM (SELECT * FROM app_metrics LIMIT 5) t"),
+    ("SELECT * FROM app_metrics LIMIT ?", "SELECT * FROM app_metrics LIMIT ?"),
+])
+def test_strip_outer_limit(sql, expected):
+    assert strip_outer_limit(sql) == expected
+
+@pytest.fixture
+def exporting(seeded_db, tmp_path, monkeypatch):
+    engine = SQLiteEngine(seeded_db)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(csv_export, "EXPORT_CHUNK_ROWS", 7)
+    monkeypatch.setattr(csv_export, "stream_sql", lambda sql, chunk_rows, params=None: engine.stream(sql, params, chunk_rows))
+    con = sqlite3.connect(seeded_db)
+    expected = pd.read_sql_query("SELECT * FROM app_metrics ORDER BY app_name, platform, date, country", con)
+    con.close()
+    return expected.drop(columns=["ua_cost"])
+
+SQL = "SELECT * FROM app_metrics ORDER BY app_name, platform, date, country LIMIT 5"
+
+def test_gzip_export_round_trips_every_row(exporting):
+    path = stream_export(SQL, "full", "U1")
+    assert path.endswith(".csv.gz")
+    pd.testing.assert_frame_equal(pd.read_csv(path), exporting)
+
+def test_parquet_export_round_trips_every_row(exporting):
+    pytest.importorskip("pyarrow")
+    path = stream_export(SQL, "full", "U1", fmt="parquet")
+    assert path.endswith(".parquet")
+    pd.testing.assert_frame_equal(pd.read_parquet(path), exporting, check_dtype=False)
@@ -0,0 +1,34 @@
+import sqlite3
+
+from app.sql.data_version import bump_data_version, read_data_version
+from app.sql.rollups import rollup_sizes
+
+def _db(path, version, monthly_rows):
+    con = sqlite3.connect(str(path))
+    con.execute("CREATE TABLE data_version (id INTEGER PRIMARY KEY, version INTEGER, updated_at TEXT)")
+    con.execute("CREATE TABLE rollup_meta (name TEXT PRIMARY KEY, row_count INTEGER)")
+    con.execute("INSERT INTO rollup_meta VALUES ('app_metrics_monthly', ?)", (monthly_rows,))
+    for _ in range(version):
+        bump_data_version(con)
+    con.commit()
+    return con
+
+def test_versions_and_rollup_sizes_are_cached_per_database(tmp_path):
+    a = _db(tmp_path / "a.db", 1, 10)
+    b = _db(tmp_path / "b.db", 3, 20)
+    assert read_data_version(a, str(tmp_path / "a.db")) == "v1"
+    assert read_data_version(b, str(tmp_path / "b.db")) == "v3"
+    assert rollup_sizes(a, str(tmp_path / "a.db")) == {"app_metrics_monthly": 10}
+    assert rollup_sizes(b, str(tmp_path / "b.db")) == {"app_metrics_monthly": 20}
+
+def test_engine_reads_cached_version_without_a_pool_connection(tmp_path, monkeypatch):
+    from app.sql import engines
+    path = str(tmp_path / "a.db")
+    _db(tmp_path / "a.db", 2, 0).close()
+    engine = engines.SQLiteEngine(path)
+    assert engine.data_version() == "v2"
+
+    def no_pool(db_path):
+        raise AssertionError("cache hit should not check out a connection")
+    monkeypatch.setattr(engines, "get_pool", no_pool)
+    assert engine.data_version() == "v2"
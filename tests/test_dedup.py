@@ -0,0 +1,54 @@
+import time
+
+from app.services.dedup import EventDeduper, delivery_keys
+
+def _keys(event_id, ts="1700000000.0001"):
+    return delivery_keys({"channel": "C1", "ts": ts, "client_msg_id": "m-" + ts}, {"event_id": event_id})
+
+def test_message_and_app_mention_answered_once():
+    d = EventDeduper()
+    done = d.claim(_keys("Ev1"))
+    assert callable(done)
+    assert d.claim(_keys("Ev2")) is None
+    assert d.stats()["attached"] == 1
+    done()
+    assert d.claim(_keys("Ev1")) is None
+    assert d.stats()["duplicate"] == 2 and d.stats()["attached"] == 1
+
+def test_duplicate_returns_without_waiting_for_running_answer():
+    d = EventDeduper()
+    d.claim(_keys("Ev1"))
+    start = time.monotonic()
+    assert d.claim(_keys("Ev2")) is None
+    assert time.monotonic() - start < 0.5
+
+def test_expired_and_evicted_keys_are_answered_again():
+    d = EventDeduper(ttl_seconds=0)
+    assert d.claim(_keys("Ev1")) is not None
+    assert d.claim(_keys("Ev1")) is not None
+    d = EventDeduper(max_keys=3)
+    d.claim(_keys("Ev1", ts="1"))
+    d.claim(_keys("Ev2", ts="2"))
+    assert d.stats()["keys"] == 3
+    assert d.claim(_keys("Ev1", ts="1")) is not None
+
+def test_no_keys_is_always_answered():
+    assert callable(EventDeduper().claim([]))
+
+class _FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+def test_shared_claim_drops_delivery_answered_by_another_replica():
+    from app.services.dedup import RedisClaims
+    shared = _FakeRedis()
+    a, b = EventDeduper(shared=RedisClaims(shared)), EventDeduper(shared=RedisClaims(shared))
+    assert a.claim(_keys("Ev1")) is not None
+    assert b.claim(_keys("Ev2")) is None
+    assert b.stats()["duplicate_remote"] == 1
@@ -0,0 +1,60 @@
+"""Canned queries must return the same DataFrames on every engine as on SQLite.
+
+The Postgres test loads the demo data into TEST_DATABASE_URL (its app_metrics
+is truncated first, so point it at a throwaway database, e.g. the `postgres`
+service in dev/docker-compose.yml) and is skipped when that is unset.
+"""
+import os
+
+import pytest
+
+from app.sql import seeds
+from app.sql.engines import DuckDBDialect, PostgresDialect, SQLiteEngine, parity
+from app.sql.plan_check import canned_queries
+from app.sql.runner import _sanitize
+
+EXTRA = [
+    "SELECT platform, COUNT(*) AS n, SUM(installs) AS installs FROM app_metrics GROUP BY platform ORDER BY platform",
+    "SELECT substr(date,1,7) AS month, SUM(ua_cost) AS ua FROM app_metrics GROUP BY month ORDER BY month",
+    "SELECT app_name, SUM(installs) / 7 AS weekly FROM app_metrics WHERE app_name LIKE '%a%' "
+    "GROUP BY app_name ORDER BY app_name",
+]
+
+@pytest.fixture(scope="module")
+def sqlite_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("engines") / "rounds.db")
+    seeds.generate(path, apps=4, countries=3, days=75)
+    return path
+
+def _queries():
+    return [_sanitize(s) for s in canned_queries()] + EXTRA
+
+def test_duckdb_matches_sqlite(sqlite_db, tmp_path):
+    pytest.importorskip("duckdb")
+    from app.sql.engines import DuckDBEngine, export_columnar
+    export_columnar(sqlite_db, str(tmp_path))
+    assert parity(DuckDBEngine(str(tmp_path)), SQLiteEngine(sqlite_db), _queries()) == 0
+
+@pytest.mark.skipif(not os.getenv("TEST_DATABASE_URL"), reason="TEST_DATABASE_URL not set")
+def test_postgres_matches_sqlite(sqlite_db):
+    pytest.importorskip("psycopg_pool")
+    from app.sql.engines import PostgresEngine, load_postgres
+    dsn = os.environ["TEST_DATABASE_URL"]
+    load_postgres(dsn, sqlite_db)
+    assert parity(PostgresEngine(dsn), SQLiteEngine(sqlite_db), _queries()) == 0
+
+def test_dialects_translate_sqlite_idioms():
+    duck = DuckDBDialect().translate("SELECT * FROM app_metrics WHERE date >= date('now','-30 day')")
+    assert "'now'" not in duck
+    assert PostgresDialect().bind("SELECT * FROM app_metrics WHERE platform = ?") == \
+        "SELECT * FROM app_metrics WHERE platform = %s"
+
+def test_incomplete_engine_fails_at_construction():
+    from app.sql.engines import Engine
+
+    class ReadOnly(Engine):
+        def read(self, sql, params=None):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnly()
@@ -0,0 +1,55 @@
+import pytest
+
+from app.nlp.followup import followup_plan, read_followup, rewrite
+
+BASE = ("SELECT country, SUM(installs) AS installs FROM app_metrics "
+        "WHERE platform = 'Android' AND date >= date('now','-30 day') "
+        "GROUP BY country ORDER BY installs DESC LIMIT 10")
+
+@pytest.mark.parametrize("text,sql,params,answer_type", [
+    ("what about iOS?",
+     "SELECT country, SUM(installs) AS installs FROM app_metrics WHERE date >= date('now', '-30 day') "
+     "AND platform = ? GROUP BY country ORDER BY installs DESC LIMIT 10", ["iOS"], None),
+    ("only in Germany",
+     "SELECT country, SUM(installs) AS installs FROM app_metrics WHERE platform = 'Android' "
+     "AND date >= date('now', '-30 day') AND country = ? GROUP BY country ORDER BY installs DESC LIMIT 10",
+     ["DE"], None),
+    ("top 5",
+     "SELECT country, SUM(installs) AS installs FROM app_metrics WHERE platform = 'Android' "
+     "AND date >= date('now', '-30 day') GROUP BY country ORDER BY installs DESC LIMIT 5", [], None),
+    ("in total",
+     "SELECT SUM(installs) AS installs FROM app_metrics WHERE platform = 'Android' "
+     "AND date >= date('now', '-30 day')", [], "simple"),
+    ("by revenue",
+     "SELECT country, SUM(in_app_revenue + ads_revenue) AS total_revenue FROM app_metrics "
+     "WHERE platform = 'Android' AND date >= date('now', '-30 day') GROUP BY country "
+     "ORDER BY total_revenue DESC LIMIT 10", [], None),
+    ("all platforms",
+     "SELECT country, SUM(installs) AS installs FROM app_metrics WHERE date >= date('now', '-30 day') "
+     "GROUP BY country ORDER BY installs DESC LIMIT 10", [], None),
+])
+def test_rewrite_edits_the_previous_sql(text, sql, params, answer_type):
+    out = rewrite(BASE, None, read_followup(text))
+    assert out[:3] == (sql, params, answer_type)
+
+def test_date_range_replaces_the_date_filter():
+    sql, params, _, notes = rewrite(BASE, None, read_followup("last 7 days instead"))
+    assert "date >= ?" in sql and "'now'" not in sql
+    assert len(params) == 1 and notes == ["last 7 days"]
+
+def test_unrelated_text_is_not_a_followup():
+    assert read_followup("tell me a joke about pandas") is None
+    assert followup_plan("tell me a joke about pandas", {"sql": BASE}) is None
+
+def test_sql_outside_the_parser_is_not_rewritten():
+    sub = "SELECT * FROM (SELECT app_name FROM apps) t"
+    assert rewrite(sub, None, {"platform": "iOS"}) is None
+    case = ("SELECT app_name, SUM(CASE WHEN date BETWEEN '2024-12-01' AND '2024-12-31' THEN ua_cost ELSE 0 END) "
+            "AS dec FROM app_metrics GROUP BY app_name")
+    assert rewrite(case, None, read_followup("last 7 days instead")) is None
+
+def test_followup_plan_keeps_bound_params():
+    first = followup_plan("what about iOS?", {"sql": BASE, "answer_type": "table"})
+    second = followup_plan("only in Germany", first)
+    assert second["params"] == ["iOS", "DE"]
+    assert second["answer_type"] == "table"
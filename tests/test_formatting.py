@@ -0,0 +1,26 @@
+import pandas as pd
+import pytest
+
+from app.services.formatting import df_to_markdown_table, df_to_table_blocks
+
+def _empty():
+    return pd.DataFrame({"app_name": pd.Series([], dtype=object),
+                         "installs": pd.Series([], dtype="int64"),
+                         "share_pct": pd.Series([], dtype="float64")})
+
+def test_zero_rows_renders_header_only():
+    lines = df_to_markdown_table(_empty()).splitlines()
+    assert lines == ["| app_name | installs | share_pct |", "|----------|----------|-----------|"]
+    assert df_to_table_blocks(_empty())[0]["text"]["text"].count("\n") == 3
+
+def test_zero_rows_arrow_backed():
+    pa = pytest.importorskip("pyarrow")
+    df = pa.table({"app_name": pa.array([], pa.string()), "installs": pa.array([], pa.int64())}).to_pandas(
+        types_mapper=pd.ArrowDtype)
+    assert df_to_markdown_table(df).splitlines()[0] == "| app_name | installs |"
+
+def test_columns_formatted_and_aligned():
+    df = pd.DataFrame({"app": ["a", None], "installs": [1234567, -5], "ok": [True, False]})
+    lines = df_to_markdown_table(df).splitlines()
+    assert lines[2] == "| a   | 1,234,567 | true  |"
+    assert lines[3] == "| —   |        -5 | false |"
@@ -0,0 +1,95 @@
+import pandas as pd
+import pytest
+
+import app.handlers as handlers
+import app.nlp.agent as agent
+from app.nlp.plan_cache import PlanCache
+from app.sql.cost_guard import QueryAborted
+
+class Reporter:
+    def __init__(self):
+        self.text = None
+
+    def progress(self, text):
+        pass
+
+    def finish(self, text, blocks=None):
+        self.text = text
+
+LLM_PLAN = {"sql": "SELECT SUM(installs) AS installs FROM app_metrics", "answer_type": "table",
+            "explanation": "", "assumptions": ""}
+
+@pytest.fixture
+def llm(monkeypatch):
+    cache = PlanCache(None)
+    monkeypatch.setattr(agent, "plan_cache", cache)
+    monkeypatch.setattr(agent, "USE_OPENAI", True)
+    monkeypatch.setattr(agent, "TEMPLATES_ENABLED", False)
+    monkeypatch.setattr(agent, "_llm_plan", lambda *a, **k: dict(LLM_PLAN))
+    monkeypatch.setattr(handlers, "data_version", lambda: "v1")
+    monkeypatch.setattr(handlers, "warmer", None)
+    return cache
+
+def test_llm_plan_is_cached_after_its_sql_runs(llm, monkeypatch):
+    monkeypatch.setattr(handlers, "_run_sql", lambda sql, params=None: pd.DataFrame({"installs": [5]}))
+    handlers._answer_query("C1", None, "U1", "installs of every app ever", Reporter())
+    assert llm.get("installs of every app ever") == LLM_PLAN
+
+@pytest.mark.parametrize("error", [QueryAborted("rows", "too many rows"), ValueError("no such column")])
+def test_failing_llm_plan_is_not_cached(llm, monkeypatch, error):
+    def fail(sql, params=None):
+        raise error
+    monkeypatch.setattr(handlers, "_run_sql", fail)
+    reporter = Reporter()
+    handlers._answer_query("C1", None, "U1", "installs of every app ever", reporter)
+    assert reporter.text.startswith((":octagonal_sign:", "Sorry"))
+    assert llm.get("installs of every app ever") is None
+
+def test_full_exports_do_not_take_answer_workers(monkeypatch):
+    import threading
+    from app.services.pipeline import QueryPipeline
+    gate, said = threading.Event(), []
+    monkeypatch.setattr(handlers, "PIPELINE_ENABLED", True)
+    monkeypatch.setattr(handlers, "exports", QueryPipeline(workers=1, max_queue=1, per_user=1))
+
+    def slow_export(*args, **kwargs):
+        gate.wait(5)
+        raise QueryAborted("timeout", "test over")
+
+    monkeypatch.setattr(handlers, "stream_export", slow_export)
+    say = lambda text, thread_ts=None: said.append(text)
+    before = handlers.pipeline.stats()["inflight"]
+    handlers._export_full(None, say, "C1", "1.0", "U1", "SELECT * FROM app_metrics", "csv.gz")
+    handlers._export_full(None, say, "C1", "1.0", "U1", "SELECT * FROM app_metrics", "csv.gz")
+    assert handlers.pipeline.stats()["inflight"] == before
+    assert handlers.exports.stats()["inflight"] == 1
+    assert said[-1].startswith("You already have a full export")
+    gate.set()
+    handlers.exports.shutdown()
+    assert said[-1].startswith(":octagonal_sign:")
+
+def test_early_sql_is_cancelled_when_the_final_plan_differs(llm, monkeypatch):
+    import threading
+    from app.services.pipeline import QueryPipeline
+    monkeypatch.setattr(handlers, "pipeline", QueryPipeline(workers=1, max_queue=0, per_user=2))
+    running, stopped = threading.Event(), []
+
+    def draft_then_final(*args, on_sql=None, **kwargs):
+        on_sql("SELECT installs FROM app_metrics")
+        running.wait(5)
+        return dict(LLM_PLAN)
+
+    def early_run(sql, cancel):
+        running.set()
+        stopped.append(cancel.wait(5))
+        raise QueryAborted("cancelled", "no longer needed")
+
+    monkeypatch.setattr(agent, "_llm_plan", draft_then_final)
+    monkeypatch.setattr(handlers, "_run_early", early_run)
+    monkeypatch.setattr(handlers, "_run_sql", lambda sql, params=None: pd.DataFrame({"installs": [5]}))
+    reporter = Reporter()
+    handlers._answer_query("C1", None, "U1", "installs of every app ever", reporter)
+    handlers.pipeline.shutdown()
+    assert stopped == [True]
+    assert handlers.pipeline.stats()["inflight"] == 0
+    assert reporter.text == LLM_PLAN["explanation"]
@@ -0,0 +1,68 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from app.sql.ingest import ingest
+
+def _one(con, sql, *params):
+    return con.execute(sql, params).fetchone()
+
+@pytest.fixture
+def batch(seeded_db, tmp_path):
+    con = sqlite3.connect(seeded_db)
+    app, platform, country = _one(con, "SELECT app_name, platform, country FROM app_metrics LIMIT 1")
+    con.close()
+    path = tmp_path / "batch.csv"
+    pd.DataFrame([
+        # an existing key with new numbers, and a day that wasn't loaded yet
+        {"app_name": app, "platform": platform.lower(), "date": "2025-01-05", "country": country,
+         "installs": 1000, "in_app_revenue": 1.5, "ads_revenue": 0.5, "ua_cost": 2},
+        {"app_name": app, "platform": platform, "date": "2025-01-11", "country": country,
+         "installs": 7, "in_app_revenue": 0, "ads_revenue": 0, "ua_cost": 0},
+    ]).to_csv(path, index=False)
+    return str(path), (app, platform, country)
+
+def test_upsert_is_idempotent_and_bumps_the_version(seeded_db, batch):
+    path, (app, platform, country) = batch
+    con = sqlite3.connect(seeded_db)
+    rows_before = _one(con, "SELECT COUNT(*) FROM app_metrics")[0]
+    version_before = _one(con, "SELECT version FROM data_version")[0]
+    con.close()
+
+    first = ingest([path], seeded_db)
+    second = ingest([path], seeded_db)
+    assert (first["rows"], first["days"]) == (2, 2)
+    assert second["version"] == first["version"] + 1 == version_before + 2
+
+    con = sqlite3.connect(seeded_db)
+    assert _one(con, "SELECT COUNT(*) FROM app_metrics")[0] == rows_before + 1
+    assert _one(con, "SELECT installs FROM app_metrics WHERE app_name=? AND platform=? AND date='2025-01-05' "
+                     "AND country=?", app, platform, country) == (1000,)
+    con.close()
+
+def test_rollups_follow_the_load(seeded_db, batch):
+    path, (app, platform, _) = batch
+    ingest([path], seeded_db)
+    con = sqlite3.connect(seeded_db)
+    for day in ("2025-01-05", "2025-01-11"):
+        base = _one(con, "SELECT SUM(installs) FROM app_metrics WHERE app_name=? AND platform=? AND date=?",
+                    app, platform, day)
+        assert _one(con, "SELECT installs FROM app_metrics_daily WHERE app_name=? AND platform=? AND date=?",
+                    app, platform, day) == base
+    month = _one(con, "SELECT SUM(installs) FROM app_metrics WHERE app_name=? AND platform=? AND date LIKE '2025-01-%'",
+                 app, platform)
+    assert _one(con, "SELECT SUM(installs) FROM app_metrics_monthly WHERE app_name=? AND platform=? "
+                     "AND date='2025-01-01'", app, platform) == month
+    con.close()
+
+def test_failed_append_writes_nothing(seeded_db, batch):
+    path, _ = batch
+    con = sqlite3.connect(seeded_db)
+    before = _one(con, "SELECT version FROM data_version")[0], _one(con, "SELECT COUNT(*) FROM app_metrics")[0]
+    con.close()
+    with pytest.raises(ValueError, match="already loaded"):
+        ingest([path], seeded_db, mode="append")
+    con = sqlite3.connect(seeded_db)
+    assert (_one(con, "SELECT version FROM data_version")[0], _one(con, "SELECT COUNT(*) FROM app_metrics")[0]) == before
+    con.close()
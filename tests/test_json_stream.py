@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from app.nlp.json_stream import IncrementalJSON
+
+PLAN = {"sql": "SELECT \"a\\b\" FROM app_metrics WHERE x = '}'", "answer_type": "table",
+        "n": -1.5e3, "ok": True, "none": None, "nested": {"list": [1, {"k": "]"}], "s": "é\n"}}
+
+@pytest.mark.parametrize("size", [1, 2, 7, 1000])
+def test_fields_match_json_loads_at_any_chunking(size):
+    text = "```json\n" + json.dumps(PLAN, ensure_ascii=False) + "\n```"
+    p, seen = IncrementalJSON(), []
+    for i in range(0, len(text), size):
+        seen.extend(p.feed(text[i:i + size]))
+    assert p.done and p.fields == PLAN
+    assert [k for k, _ in seen] == list(PLAN)
+
+def test_sql_is_reported_before_the_rest_arrives():
+    p = IncrementalJSON()
+    assert p.feed('{"sql": "SELECT 1", "explanation": "cou') == [("sql", "SELECT 1")]
+    assert not p.done
+    assert p.feed('nts"}') == [("explanation", "counts")]
+    assert p.done
+
+def test_number_completes_on_its_delimiter():
+    p = IncrementalJSON()
+    assert p.feed('{"a": 12') == []
+    assert p.feed("3 ") == [("a", 123)]
+
+def test_empty_object():
+    p = IncrementalJSON()
+    p.feed("{ }")
+    assert p.done and p.fields == {}
+
+@pytest.mark.parametrize("text", ['{"a" 1}', '{"a": 1 "b": 2}', "{a: 1}"])
+def test_invalid_object_raises(text):
+    with pytest.raises(ValueError):
+        IncrementalJSON().feed(text)
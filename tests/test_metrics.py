@@ -0,0 +1,34 @@
+from app.obs.metrics import Counter, Histogram, Registry, ROWS_RETURNED, render_metrics, span
+
+def test_render_metrics_exposes_the_bot_metric_names():
+    import app.handlers  # noqa: F401  registers the cache/dedup collectors
+    with span("test_stage"):
+        pass
+    ROWS_RETURNED.inc(3)
+    text = render_metrics()
+    for name in ("bi_stage_seconds", "bi_plan_seconds", "bi_rows_returned_total", "bi_llm_tokens_total",
+                 "bi_thread_cache_lookups_total", "bi_answers_total", "bi_result_cache_events_total",
+                 "bi_event_deliveries_total"):
+        assert f"# TYPE {name} " in text
+    assert 'bi_stage_seconds_bucket{stage="test_stage",le="+Inf"} 1' in text
+    assert 'bi_stage_seconds_count{stage="test_stage"} 1' in text
+    assert 'bi_result_cache_events_total{event="hits"}' in text
+
+def test_histogram_buckets_are_cumulative_and_a_broken_collector_is_skipped():
+    reg = Registry()
+    hist = reg.register(Histogram("h_seconds", "h", ["stage"], buckets=(0.1, 1.0)))
+    reg.register(Counter("c_total", "c", ["kind"])).inc(2, kind='say "hi"')
+    for v in (0.05, 0.5, 5):
+        hist.observe(v, stage="a")
+
+    def broken():
+        raise RuntimeError("stats unavailable")
+        yield
+
+    reg.collectors.append(broken)
+    lines = reg.render().splitlines()
+    assert 'h_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'h_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'h_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'h_seconds_count{stage="a"} 3' in lines
+    assert 'c_total{kind="say \\"hi\\""} 2' in lines
@@ -0,0 +1,68 @@
+import threading
+
+from app.services.pipeline import BUSY, USER_LIMIT, QueryPipeline
+
+def _wait_idle(p):
+    p.shutdown(wait=True)
+    return p.stats()
+
+def test_rejects_per_user_then_when_full():
+    p = QueryPipeline(workers=1, max_queue=1, per_user=1)
+    gate = threading.Event()
+    assert p.submit("u1", gate.wait) is None
+    assert p.submit("u1", gate.wait) == USER_LIMIT
+    assert p.submit("u2", gate.wait) is None
+    assert p.submit("u3", gate.wait) == BUSY
+    gate.set()
+    stats = _wait_idle(p)
+    assert stats["inflight"] == 0 and stats["users"] == 0
+    assert (stats["submitted"], stats["rejected_user"], stats["rejected_busy"]) == (2, 1, 1)
+
+def test_failed_job_releases_its_slot():
+    p = QueryPipeline(workers=1, max_queue=0, per_user=1)
+    done = threading.Event()
+
+    def boom():
+        try:
+            raise RuntimeError("boom")
+        finally:
+            done.set()
+
+    assert p.submit("u1", boom) is None
+    done.wait(5)
+    stats = _wait_idle(p)
+    assert stats["failed"] == 1 and stats["inflight"] == 0 and stats["users"] == 0
+
+def test_slot_is_free_again_after_a_failure():
+    p = QueryPipeline(workers=1, max_queue=0, per_user=1)
+    ran = threading.Event()
+    p.submit("u1", lambda: 1 / 0)
+    p._executor.submit(lambda: None).result(5)  # the failed job has finished on the single worker
+    assert p.submit("u1", ran.set) is None
+    assert ran.wait(5)
+    p.shutdown()
+
+def test_speculative_work_counts_against_the_user_limit():
+    p = QueryPipeline(workers=1, max_queue=1, per_user=2)
+    gate = threading.Event()
+    assert p.submit("u1", gate.wait) is None
+    early = p.speculate("u1", lambda: "rows")
+    assert early.result(5) == "rows"
+    blocked = p.speculate("u1", gate.wait)
+    assert blocked is not None and p.speculate("u1", gate.wait) is None
+    gate.set()
+    blocked.result(5)
+    stats = _wait_idle(p)
+    assert stats["inflight"] == 0 and stats["users"] == 0
+    assert (stats["speculated"], stats["speculation_skipped"]) == (2, 1)
+
+def test_cancelled_speculation_releases_its_slot():
+    p = QueryPipeline(workers=1, max_queue=1, per_user=2)
+    gate = threading.Event()
+    running = p.speculate("u1", gate.wait)
+    queued = p.speculate("u1", gate.wait)
+    assert queued.cancel()
+    assert p.stats()["inflight"] == 1
+    gate.set()
+    running.result(5)
+    assert _wait_idle(p)["inflight"] == 0
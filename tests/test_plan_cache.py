@@ -0,0 +1,58 @@
+import json
+import threading
+
+from app.nlp.plan_cache import PlanCache, normalize_question
+
+PLAN = {"sql": "SELECT COUNT(*) AS app_count FROM app_metrics", "answer_type": "simple"}
+
+def test_normalized_question_hits():
+    pc = PlanCache(None)
+    pc.put("<@U1> How many apps?", None, PLAN)
+    assert pc.get("how many apps") == PLAN
+    assert pc.get("how many apps", last_plan={"sql": "SELECT 1"}) is None
+    assert normalize_question("<@U1>  How  many APPS?!") == "how many apps"
+
+def test_saves_are_batched_and_flushed(tmp_path):
+    path = tmp_path / "plan_cache.json"
+    pc = PlanCache(str(path), save_delay=60)
+    pc.put("how many apps", None, PLAN)
+    assert not path.exists()
+    pc.flush()
+    assert len(json.loads(path.read_text())["entries"]) == 1
+    assert PlanCache(str(path)).get("how many apps") == PLAN
+
+def test_concurrent_saves_leave_a_whole_file(tmp_path):
+    path = tmp_path / "plan_cache.json"
+    pc = PlanCache(str(path), save_delay=0)
+
+    def worker(i):
+        for j in range(20):
+            pc.put(f"question {i} {j}", None, PLAN)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(json.loads(path.read_text())["entries"]) == 160
+    assert [p.name for p in tmp_path.iterdir()] == ["plan_cache.json"]
+
+def test_cli_pin_survives_a_running_bots_save(tmp_path):
+    path = str(tmp_path / "plan_cache.json")
+    bot = PlanCache(path, save_delay=0)
+    bot.put("top apps by revenue", None, PLAN)
+    assert PlanCache(path).pin("top apps by revenue")  # the CLI, in another process
+    bot.put("how many apps", None, PLAN)
+    assert PlanCache(path).stats()["pinned"] == 1
+    assert bot.stats()["pinned"] == 1
+    assert PlanCache(path).pin("top apps by revenue", pinned=False)
+    bot.put("how many ios apps", None, PLAN)
+    assert PlanCache(path).stats()["pinned"] == 0
+
+def test_plans_are_not_shared_across_dialects(tmp_path):
+    path = str(tmp_path / "plan_cache.json")
+    sqlite = PlanCache(path, save_delay=0)
+    sqlite.put("installs last 30 days", None, {"sql": "SELECT SUM(installs) FROM app_metrics "
+                                                      "WHERE date >= date('now','-30 day')"})
+    assert PlanCache(path, dialect="postgres").get("installs last 30 days") is None
+    assert PlanCache(path).get("installs last 30 days") is not None
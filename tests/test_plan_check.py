@@ -0,0 +1,17 @@
+import sqlite3
+
+from app.sql import plan_check
+
+REVENUE_BY_COUNTRY = "SELECT country, SUM(in_app_revenue + ads_revenue) AS revenue FROM app_metrics GROUP BY country"
+
+def test_canned_queries_use_the_covering_indexes(seeded_db, monkeypatch):
+    monkeypatch.setattr(plan_check, "DB_PATH", seeded_db)
+    assert plan_check.check_query_plans() == []
+
+def test_query_is_flagged_when_its_covering_index_is_missing(seeded_db, monkeypatch):
+    con = sqlite3.connect(seeded_db)
+    for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx%'").fetchall():
+        con.execute(f'DROP INDEX "{name}"')
+    con.close()
+    monkeypatch.setattr(plan_check, "DB_PATH", seeded_db)
+    assert plan_check.check_query_plans([REVENUE_BY_COUNTRY]) == [REVENUE_BY_COUNTRY]
@@ -0,0 +1,35 @@
+import sqlite3
+
+import pytest
+
+from app.sql.pool import ConnectionPool
+
+def test_connections_are_returned_and_reused(seeded_db):
+    pool = ConnectionPool(seeded_db, max_size=1, timeout=0.05)
+    with pool.connection() as con:
+        first = con
+        with pytest.raises(TimeoutError):
+            pool.acquire()
+    with pool.connection() as con:
+        assert con is first
+    assert pool._opened == 1
+    pool.close()
+
+def test_pooled_connections_are_read_only(seeded_db):
+    pool = ConnectionPool(seeded_db, max_size=1)
+    with pool.connection() as con:
+        assert con.execute("SELECT COUNT(*) FROM app_metrics").fetchone()[0] == 60
+        with pytest.raises(sqlite3.OperationalError):
+            con.execute("DELETE FROM app_metrics")
+    pool.close()
+
+def test_broken_connection_is_replaced_on_checkout(seeded_db):
+    pool = ConnectionPool(seeded_db, max_size=1)
+    con = pool.acquire()
+    con.close()
+    pool.release(con)
+    with pool.connection() as fresh:
+        assert fresh is not con
+        assert fresh.execute("SELECT 1").fetchone() == (1,)
+    assert pool._opened == 1
+    pool.close()
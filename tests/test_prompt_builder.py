@@ -0,0 +1,37 @@
+from app.nlp.prompt_builder import PromptBuilder, ShotIndex
+
+SHOTS = [
+    {"user": "installs by country last week", "json": {"sql": "SELECT country, SUM(installs) FROM app_metrics"}},
+    {"user": "total revenue by platform", "json": {"sql": "SELECT platform, SUM(in_app_revenue) FROM app_metrics"}},
+    {"user": "ua cost per app in january", "json": {"sql": "SELECT app_name, SUM(ua_cost) FROM app_metrics"}},
+]
+
+def test_shots_are_ranked_by_similarity():
+    index = ShotIndex(SHOTS)
+    ranked = index.top("revenue by platform for iOS", 3)
+    assert [i for i, _ in ranked] == [1, 0, 2]
+    assert ranked[0][1] > ranked[1][1] > 0
+    assert [i for i, _ in index.top("completely unrelated words", 2)] == [0, 1]
+
+def _builder(max_tokens=0):
+    return PromptBuilder("Rules for {DIALECT}.", "app_metrics(app_name, ...)", SHOTS, k=3, max_tokens=max_tokens)
+
+def test_least_relevant_shots_are_dropped_to_fit_the_budget():
+    question = "ua cost per app by platform"
+    full, info = _builder().build(question, "SQLite")
+    assert info["shots"] == 3
+
+    b = _builder()
+    best, second = [i for i, _ in b.index.top(question, 2)]
+    system = b.prefix("SQLite")
+    tail = f"User: {question}\nReturn ONLY the JSON."
+    budget = b.count_tokens(system) + b.count_tokens(tail) + b.count_tokens(b.shot_texts[best])
+    messages, info = _builder(budget).build(question, "SQLite")
+    assert info["shots"] == 1
+    assert b.shot_texts[best] in messages[1][1] and b.shot_texts[second] not in messages[1][1]
+    assert messages[0] == full[0]
+
+def test_system_prefix_is_built_once_per_dialect():
+    b = _builder()
+    assert b.prefix("SQLite") is b.prefix("SQLite")
+    assert "Rules for PostgreSQL." in b.prefix("PostgreSQL")
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from app.services.redis_cache import RedisThreadCache, deserialize_df, serialize_df
+
+fakeredis = pytest.importorskip("fakeredis")
+
+DF = pd.DataFrame({"app_name": ["a", "b", "a"], "installs": [1, 2, 3], "revenue": [0.5, 1.25, None]})
+
+@pytest.fixture
+def cache():
+    return RedisThreadCache(fakeredis.FakeRedis(), ttl_seconds=60)
+
+def test_result_round_trips_and_is_shared_by_aliases(cache):
+    cache.set("C1", "111.1", {"plan": {"sql": "SELECT 1"}, "df": DF, "sql": "SELECT 1"}, aliases=("__last__",))
+    for ts in ("111.1", "__last__"):
+        got = cache.get("C1", ts)
+        assert got["sql"] == "SELECT 1" and got["plan"] == {"sql": "SELECT 1"}
+        pd.testing.assert_frame_equal(got["df"], DF, check_dtype=False, check_categorical=False)
+    assert len(cache.client.keys("bi:result:*")) == 1
+    assert cache.get("C1", "222.2") is None
+    assert cache.get("C2", "111.1") is None
+
+def test_entries_expire_with_the_ttl(cache):
+    cache.set("C1", "111.1", {"sql": "SELECT 1"})
+    assert 0 < cache.client.ttl("bi:thread:C1:111.1") <= 60
+
+def test_outage_does_not_fail_the_answer():
+    server = fakeredis.FakeServer()
+    cache = RedisThreadCache(fakeredis.FakeRedis(server=server))
+    server.connected = False
+    cache.set("C1", "1", {"sql": "SELECT 1", "df": DF})
+    assert cache.get("C1", "1") is None
+    assert cache.stats() == {"backend": "redis"}
+
+def test_json_fallback_serialization():
+    fmt, data = "json", DF.to_json(orient="table", index=False).encode("utf-8")
+    pd.testing.assert_frame_equal(deserialize_df(fmt, data), DF, check_dtype=False)
+    fmt, data = serialize_df(DF)
+    pd.testing.assert_frame_equal(deserialize_df(fmt, data), DF, check_dtype=False)
+
+def test_incomplete_backend_fails_at_construction():
+    from app.services.cache import ThreadCacheBackend
+
+    class WriteOnly(ThreadCacheBackend):
+        def set(self, channel, thread_ts, value, aliases=()):
+            pass
+
+    with pytest.raises(TypeError):
+        WriteOnly()
@@ -0,0 +1,95 @@
+import threading, time
+from datetime import date
+
+import pandas as pd
+import pytest
+
+import app.services.cache as cache_mod
+from app.services.cache import ResultCache
+from app.sql.cost_guard import QueryAborted
+
+class _Day:
+    today_value = date(2025, 1, 1)
+
+    @classmethod
+    def today(cls):
+        return cls.today_value
+
+def _counting():
+    calls = []
+    def compute():
+        calls.append(1)
+        return len(calls)
+    return calls, compute
+
+def test_canonical_sql_and_version_share_entries():
+    rc = ResultCache()
+    calls, compute = _counting()
+    rc.get_or_compute("select  COUNT(*) from apps", "v1", compute)
+    rc.get_or_compute("SELECT COUNT(*) FROM apps;", "v1", compute)
+    assert len(calls) == 1
+    rc.get_or_compute("SELECT COUNT(*) FROM apps", "v2", compute)
+    assert len(calls) == 2
+
+def test_flapping_versions_keep_both_entries():
+    rc = ResultCache()
+    calls, compute = _counting()
+    for version in ("v1", "v2", "v1", "v2"):
+        rc.get_or_compute("SELECT COUNT(*) FROM apps", version, compute)
+    assert len(calls) == 2
+    assert rc.stats()["entries"] == 2 and rc.stats()["version"] == "v2"
+
+def test_old_version_entries_age_out_through_the_lru():
+    frame = lambda: pd.DataFrame({"n": [1]})
+    rc = ResultCache(max_bytes=2 * ResultCache.sizeof(frame()))
+    rc.get_or_compute("SELECT 1", "v1", frame)
+    rc.get_or_compute("SELECT 1", "v2", frame)
+    rc.get_or_compute("SELECT 2", "v2", frame)
+    assert [key[0] for key in rc.store] == ["v2", "v2"]
+
+def test_clock_dependent_sql_rolls_over_with_the_date(monkeypatch):
+    monkeypatch.setattr(cache_mod, "date", _Day)
+    rc = ResultCache()
+    calls, compute = _counting()
+    sql = "SELECT SUM(installs) FROM app_metrics WHERE date >= date('now', '-30 day')"
+    assert rc.get_or_compute(sql, "v1", compute) == 1
+    assert rc.get_or_compute(sql, "v1", compute) == 1
+    monkeypatch.setattr(_Day, "today_value", date(2025, 1, 2))
+    assert rc.get_or_compute(sql, "v1", compute) == 2
+    pg = "SELECT SUM(installs) FROM app_metrics WHERE date >= CURRENT_DATE - 30"
+    rc.get_or_compute(pg, "v1", compute)
+    monkeypatch.setattr(_Day, "today_value", date(2025, 1, 3))
+    rc.get_or_compute(pg, "v1", compute)
+    assert len(calls) == 4
+
+def test_fixed_dates_ignore_the_clock(monkeypatch):
+    monkeypatch.setattr(cache_mod, "date", _Day)
+    rc = ResultCache()
+    calls, compute = _counting()
+    sql = "SELECT SUM(installs) FROM app_metrics WHERE date >= '2025-01-01'"
+    rc.get_or_compute(sql, "v1", compute)
+    monkeypatch.setattr(_Day, "today_value", date(2025, 1, 2))
+    rc.get_or_compute(sql, "v1", compute)
+    assert len(calls) == 1
+
+def test_waiter_recomputes_when_the_leader_is_cancelled():
+    rc = ResultCache()
+    started, release = threading.Event(), threading.Event()
+
+    def abandoned():
+        started.set()
+        release.wait(5)
+        raise QueryAborted("cancelled", "no longer needed")
+
+    leader = threading.Thread(target=lambda: pytest.raises(QueryAborted, rc.get_or_compute, "SELECT 1", "v1", abandoned))
+    leader.start()
+    started.wait(5)
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(rc.get_or_compute("SELECT 1", "v1", lambda: "fresh")))
+    waiter.start()
+    while rc.stats()["coalesced"] == 0:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    waiter.join(5)
+    assert result == ["fresh"]
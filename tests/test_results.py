@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from app.sql import results
+from app.sql.results import is_arrow, rows_to_frame
+
+ROWS = [("Paint Pro", 120, 3.5), ("TimerX", 80, 1.25)]
+COLUMNS = ["app_name", "installs", "revenue"]
+
+def test_numpy_frames_without_arrow(monkeypatch):
+    monkeypatch.setattr(results, "ARROW_RESULTS", False)
+    df = rows_to_frame(ROWS, COLUMNS)
+    assert not is_arrow(df)
+    assert [str(t) for t in df.dtypes] == ["object", "int64", "float64"]
+
+def test_arrow_frames_keep_sql_types(monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    monkeypatch.setattr(results, "ARROW_RESULTS", True)
+    df = rows_to_frame(ROWS, COLUMNS)
+    assert is_arrow(df)
+    assert [t.pyarrow_dtype for t in df.dtypes] == [pa.string(), pa.int64(), pa.float64()]
+    assert df["installs"].sum() == 200
+
+def test_arrow_decimals_are_narrowed(monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    monkeypatch.setattr(results, "ARROW_RESULTS", True)
+    hugeint = pa.array([Decimal(5), Decimal(7)], pa.decimal128(38, 0))
+    numeric = pa.array([Decimal("1.50"), Decimal("2.25")], pa.decimal128(10, 2))
+    df = results.from_arrow(pa.table([hugeint, numeric], names=["installs", "revenue"]))
+    assert [t.pyarrow_dtype for t in df.dtypes] == [pa.int64(), pa.float64()]
+    df = rows_to_frame([(Decimal("1.50"),), (Decimal("2.25"),)], ["revenue"])
+    assert df["revenue"].dtype.pyarrow_dtype == pa.float64()
+
+def test_mixed_column_falls_back_to_objects(monkeypatch):
+    pytest.importorskip("pyarrow")
+    monkeypatch.setattr(results, "ARROW_RESULTS", True)
+    df = rows_to_frame([("a", 1), ("b", "n/a")], ["app_name", "installs"])
+    assert not is_arrow(df)
+    assert df["installs"].tolist() == [1, "n/a"]
+
+def test_empty_result_keeps_its_columns():
+    df = rows_to_frame([], COLUMNS)
+    assert list(df.columns) == COLUMNS and len(df) == 0
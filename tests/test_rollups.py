@@ -0,0 +1,46 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from app.sql import seeds
+from app.sql.rollups import choose_rollup, rewrite_for_rollup
+
+@pytest.fixture(scope="module")
+def db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("rollups") / "rounds.db")
+    seeds.generate(path, apps=4, countries=3, days=90)
+    con = sqlite3.connect(path)
+    yield con, path
+    con.close()
+
+@pytest.mark.parametrize("sql,rollup", [
+    ("SELECT country, SUM(installs) AS i FROM app_metrics GROUP BY country ORDER BY country",
+     "app_metrics_monthly"),
+    ("SELECT app_name, SUM(in_app_revenue + ads_revenue) AS r FROM app_metrics "
+     "WHERE date BETWEEN '2024-12-01' AND '2024-12-31' GROUP BY app_name ORDER BY app_name", "app_metrics_monthly"),
+    ("SELECT COUNT(DISTINCT app_name) AS app_count FROM app_metrics WHERE platform = 'iOS'", "app_metrics_monthly"),
+    ("SELECT platform, date, SUM(ua_cost) AS c FROM app_metrics WHERE date >= '2025-01-03' "
+     "GROUP BY platform, date ORDER BY platform, date", "app_metrics_daily"),
+])
+def test_rewritten_queries_give_the_same_answer(db, sql, rollup):
+    con, path = db
+    rewritten = rewrite_for_rollup(sql, con, path)
+    assert f"FROM {rollup}" in rewritten
+    pd.testing.assert_frame_equal(pd.read_sql_query(rewritten, con), pd.read_sql_query(sql, con))
+
+@pytest.mark.parametrize("sql", [
+    "SELECT country, SUM(installs) AS i FROM app_metrics WHERE date >= '2024-12-15' GROUP BY country",
+    "SELECT COUNT(*) AS n FROM app_metrics",
+    "SELECT AVG(installs) AS a FROM app_metrics",
+    "SELECT * FROM app_metrics LIMIT 3",
+])
+def test_queries_a_rollup_cannot_answer_exactly_are_left_alone(db, sql):
+    con, path = db
+    assert rewrite_for_rollup(sql, con, path) == sql
+
+def test_smallest_fitting_rollup_wins():
+    sql = "SELECT platform, SUM(installs) AS i FROM app_metrics GROUP BY platform"
+    assert choose_rollup(sql, {"app_metrics_monthly": 10, "app_metrics_daily": 500}) == "app_metrics_monthly"
+    assert choose_rollup(sql, {"app_metrics_monthly": 900, "app_metrics_daily": 500}) == "app_metrics_daily"
+    assert choose_rollup(sql, {}) is None
@@ -0,0 +1,50 @@
+import re
+
+import pytest
+
+from app.nlp.agent import ROUTER, route
+from app.nlp.router import IntentRouter, required_keywords
+
+@pytest.mark.parametrize("pattern,keywords", [
+    (r"how\s+many\s+apps", {"many"}),
+    (r"\b(joke|weather)\b", {"joke", "weather"}),
+    (r"^\s*(thanks|thank you|thx)\s*!?$", {"th"}),
+    (r"\d+", None),
+])
+def test_required_keywords(pattern, keywords):
+    assert required_keywords(pattern) == keywords
+
+@pytest.mark.parametrize("text,kind", [
+    ("export this as csv", "export"),
+    ("download everything as parquet", "export"),
+    ("show me the SQL you used", "show_sql"),
+    ("sql", "show_sql"),
+    ("hello!", "offtopic"),
+    ("tell me a joke", "offtopic"),
+    ("How many apps do we have?", "rule"),
+    ("List all iOS apps sorted by their popularity", "rule"),
+    ("which apps grew the most last week", None),
+])
+def test_route(text, kind):
+    intent = route(text)
+    assert (intent.kind if intent else None) == kind
+
+def _linear(rules, text):
+    for kind, pattern, _ in rules:
+        if re.search(pattern, text, re.I):
+            return kind
+    return None
+
+def test_matches_trying_every_rule_in_order():
+    rules = [("a", r"\bfoo\b.*bar", None), ("b", r"^bar$", None), ("c", r"(baz|qux)\d+", None),
+             ("d", r"foo", None), ("e", r"\d{3}", None)]
+    router = IntentRouter(rules)
+    texts = ["foo then bar", "bar", "Bar", "qux42", "foo", "food", "x123", "nothing here", "", "BAZ7 foo"]
+    for text in texts:
+        intent = router.route(text)
+        assert (intent.kind if intent else None) == _linear(rules, text), text
+    assert router.stats()["routed"] == len(texts)
+
+def test_agent_router_labels_rules_by_kind():
+    assert route("how many android apps").label == "rule:2"
+    assert ROUTER.stats()["routed"] > 0
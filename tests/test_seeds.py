@@ -0,0 +1,25 @@
+from datetime import date
+
+from app.sql.seeds import generate_batches, scaled_apps, scaled_countries
+
+def _rows(seed=42, batch_rows=1000):
+    return [row for batch in generate_batches(scaled_apps(14), scaled_countries(10), date(2025, 1, 1), 20,
+                                              seed=seed, batch_rows=batch_rows)
+            for row in batch]
+
+def test_same_seed_gives_identical_rows_whatever_the_batch_size():
+    rows = _rows()
+    assert len(rows) == 14 * 10 * 20
+    assert _rows() == rows
+    assert _rows(batch_rows=7) == rows
+
+def test_different_seed_gives_different_rows():
+    assert _rows(seed=7) != _rows()
+
+def test_batches_stop_near_batch_rows():
+    sizes = [len(b) for b in generate_batches(scaled_apps(3), scaled_countries(2), date(2025, 1, 1), 10, batch_rows=10)]
+    assert sum(sizes) == 60 and all(s == 12 for s in sizes[:-1])
+
+def test_scaled_dimensions_are_unique():
+    assert len(set(scaled_apps(40))) == 40
+    assert len(set(scaled_countries(100))) == 100
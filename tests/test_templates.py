@@ -0,0 +1,56 @@
+from datetime import date
+
+import pytest
+
+from app.nlp.templates import extract_slots, followup_from_template, plan_from_template
+
+TODAY = date(2025, 3, 15)
+
+@pytest.mark.parametrize("text,group", [
+    ("revenue by country for iOS apps", ["country"]),
+    ("total revenue for android apps", None),
+    ("revenue for apps in the US", None),
+    ("total installs", None),
+    ("overall revenue by platform", ["platform"]),
+    ("top 5 apps by installs", ["app_name"]),
+    ("list all iOS apps sorted by installs", ["app_name"]),
+    ("which apps had the most revenue", ["app_name"]),
+    ("installs per app in Germany", ["app_name"]),
+    ("revenue by app", ["app_name"]),
+    ("monthly installs by country", ["month", "country"]),
+])
+def test_grouping(text, group):
+    slots, leftover = extract_slots(text, TODAY)
+    assert slots.get("group") == group
+    assert leftover == []
+
+def test_total_for_platform_apps_is_a_single_number():
+    plan = plan_from_template("total revenue for android apps")
+    assert plan["sql"] == "SELECT SUM(in_app_revenue + ads_revenue) AS total_revenue FROM app_metrics WHERE platform = ?"
+    assert plan["params"] == ["Android"] and plan["answer_type"] == "simple"
+
+def test_by_country_for_platform_apps_groups_by_country_only():
+    plan = plan_from_template("revenue by country for iOS apps")
+    assert "GROUP BY country ORDER BY total_revenue DESC" in plan["sql"]
+    assert "app_name" not in plan["sql"]
+
+def test_top_n_apps_ranked_by_metric():
+    plan = plan_from_template("bottom 3 apps by installs in Germany")
+    assert plan["sql"] == ("SELECT app_name, SUM(installs) AS installs FROM app_metrics WHERE country IN (?) "
+                           "GROUP BY app_name ORDER BY installs ASC LIMIT 3")
+    assert plan["params"] == ["DE"]
+
+def test_slots_cover_dates_countries_and_app_counts():
+    slots, _ = extract_slots("installs in US and France for January 2025", TODAY)
+    assert slots["countries"] == ["FR", "US"]
+    assert slots["date_range"] == {"start": "2025-01-01", "end": "2025-01-31", "label": "January 2025"}
+    assert extract_slots("how many iOS apps do we have", TODAY)[0] == {"platform": "iOS", "count_apps": True}
+
+def test_unexplained_words_go_to_the_llm():
+    assert plan_from_template("revenue retention by country") is None
+    assert plan_from_template("which apps had the biggest change in UA spend") is None
+
+def test_followup_rerenders_the_template():
+    plan = plan_from_template("installs by country for iOS apps")
+    again = followup_from_template("what about android?", plan)
+    assert again["params"] == ["Android"] and "GROUP BY country" in again["sql"]
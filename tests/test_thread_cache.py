@@ -0,0 +1,44 @@
+import pandas as pd
+
+from app.services.cache import ResultCache, ThreadCache, compact_df
+
+def _value(n):
+    return {"plan": {}, "sql": "SELECT 1", "df": pd.DataFrame({"installs": range(n)})}
+
+def test_result_shared_by_aliases_is_counted_once():
+    tc = ThreadCache()
+    tc.set("C1", "1.0", _value(100), aliases=("__last__",))
+    stats = tc.stats()
+    assert stats["keys"] == 2 and stats["entries"] == 1
+    assert stats["bytes"] == ResultCache.sizeof(tc.get("C1", "__last__")["df"])
+    tc.set("C1", "2.0", _value(10), aliases=("__last__",))
+    assert tc.get("C1", "1.0") is not None and tc.stats()["entries"] == 2
+    tc.set("C1", "1.0", _value(10))  # the first result has lost both of its keys
+    assert tc.stats()["entries"] == 2
+    assert tc.stats()["bytes"] == 2 * ResultCache.sizeof(compact_df(_value(10)["df"]))
+
+def test_sweep_evicts_oldest_over_the_byte_budget():
+    tc = ThreadCache(max_bytes=1)
+    tc.set("C1", "old", _value(1000))
+    tc.set("C1", "new", _value(1000))
+    tc.store["C1:old"]["ts"] -= 10
+    tc.max_bytes = tc.stats()["bytes"] - 1
+    assert tc.sweep() == 1
+    assert tc.get("C1", "old") is None and tc.get("C1", "new") is not None
+
+def test_sweep_and_get_drop_expired_entries():
+    tc = ThreadCache(ttl_seconds=60)
+    tc.set("C1", "1.0", _value(5))
+    tc.set("C1", "2.0", _value(5))
+    for item in tc.store.values():
+        item["ts"] -= 120
+    assert tc.get("C1", "1.0") is None
+    assert tc.sweep() == 1
+    assert tc.stats() == {"keys": 0, "entries": 0, "bytes": 0, "max_bytes": None}
+
+def test_compact_df_shrinks_dimensions_and_ints():
+    df = pd.DataFrame({"country": ["US", "DE"] * 50, "installs": list(range(100)), "revenue": [0.5] * 100})
+    small = compact_df(df)
+    assert str(small["country"].dtype) == "category" and small["installs"].dtype.itemsize == 1
+    assert small["revenue"].dtype == "float64"
+    pd.testing.assert_frame_equal(small.astype(df.dtypes.to_dict()), df)
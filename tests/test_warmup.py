@@ -0,0 +1,49 @@
+import json, time
+
+from app.services import warmup
+from app.services.warmup import QueryWarmer
+
+PLAN = {"sql": "SELECT COUNT(DISTINCT app_name) AS app_count FROM app_metrics"}
+
+def _plan(n):
+    return {"sql": f"SELECT {n} AS n"}
+
+def test_questions_are_counted_and_ranked():
+    w = QueryWarmer(None)
+    w.record("How many apps?", PLAN)
+    w.record("how many apps", PLAN)
+    w.record("only android", _plan(1), followup=True)
+    top = w.top()
+    assert [e["hits"] for e in top] == [2, 1]
+    assert top[0]["key"].startswith("q|") and top[1]["key"].startswith("s|")
+
+def test_least_asked_question_makes_room():
+    w = QueryWarmer(None, max_entries=2)
+    for q, n in (("a a", 2), ("b b", 1), ("c c", 1)):
+        for _ in range(n):
+            w.record(q, _plan(q[0]))
+    assert sorted(e["question"] for e in w.top()) == ["a a", "c c"]
+
+def test_entries_persist_and_stale_ones_are_dropped_on_load(tmp_path):
+    path = tmp_path / "warm.json"
+    w = QueryWarmer(str(path))
+    w.record("How many apps?", PLAN)
+    w.save()
+    data = json.loads(path.read_text())
+    data["entries"].append({"key": "q|old", "question": "old", "sql": "SELECT 1", "hits": 50,
+                            "last_seen": time.time() - 30 * 86400})
+    path.write_text(json.dumps(data))
+    loaded = QueryWarmer(str(path), max_age_seconds=14 * 86400)
+    assert [(e["question"], e["hits"]) for e in loaded.top()] == [("How many apps?", 1)]
+
+def test_warm_runs_top_questions_once_each(monkeypatch):
+    ran = []
+    monkeypatch.setattr(warmup, "WARMUP_CANNED", False)
+    monkeypatch.setattr("app.sql.runner.run_sql", lambda sql, params=None: ran.append(sql))
+    monkeypatch.setattr("app.sql.runner.RESULT_CACHE", True)
+    w = QueryWarmer(None)
+    w.record("How many apps?", PLAN)
+    w.record("apps count again", PLAN)
+    assert w.warm("test") == 1
+    assert ran == [PLAN["sql"]]
+    assert w.stats()["runs"] == 1